@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+#
+# benchmark_pixbuf.py
+#
+# Objectives: Reproducible benchmarks of the encode and decode paths of the
+# image embedding programs, across image formats and sizes.
+#
+# Synthetic PNG, JPEG, ICO, GIF and SVG images are generated from 16 pixels up
+# to 8K. For each image the following are measured:
+#   encode   Main_Window.convert_image_to_base64() in image_embedding_tool_pixbuf.py
+#   summary  The same, for images larger than OUTPUT_TEXT_LIMIT. These are not
+#            encoded, only summarised from the image header, so they are
+#            reported as a separate operation.
+#   decode   get_image_from_base64() as in info_from_pixbuf.py
+#   stream   Icon_Window.get_image_pixbuf() in image_embedding_tool.py, which
+#            loads the image from a Gio.MemoryInputStream.
+#   tempfile The original path of image_embedding_tool.py, which it no longer
+#            has: the image is written to a file in /tmp, loaded from the file
+#            and the file removed. Compare it with stream.
+#   css      Loading a Gtk.CssProvider with the image as a data: URI, made by
+#            embedded_image.py. This is the CSS parse cost as payloads grow.
+#
+# Each result has the median and minimum time, the throughput, the peak python
+# heap allocated, as traced by tracemalloc, and the peak resident memory (RSS)
+# of the process. The python heap leaves out the pixels of a pixbuf, which
+# GdkPixbuf allocates itself, and only the RSS includes them. The peak RSS is
+# read from VmHWM of /proc/self/status, after resetting it through
+# /proc/self/clear_refs, so it is only measured on Linux, and is None elsewhere.
+# Results are stored as JSON.
+# The compare command flags any result slower, or using more memory, than a
+# saved baseline.
+#
+# $ python benchmark_pixbuf.py run --output baseline.json
+# $ python benchmark_pixbuf.py run --quick --output new.json
+# $ python benchmark_pixbuf.py compare baseline.json new.json
+#
+# Notes: ICO images are limited to 256 pixels by the format. GdkPixbuf can not
+# write GIF images, so a simple uncompressed GIF writer is used, and limited to
+# 1024 pixels as larger GIF images are not realistic.
+
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import gi
+gi.require_version('GLib', '2.0')
+gi.require_version('GdkPixbuf', '2.0')
+gi.require_version('Gtk', '3.0')
+from gi.repository import GdkPixbuf, GLib, Gtk
+
+import embedded_image
+import image_embedding_tool
+import image_embedding_tool_pixbuf
+import info_from_pixbuf
+
+FORMATS = ("png", "jpeg", "ico", "gif", "svg")
+SIZES = (16, 32, 64, 256, 1024, 4096, 7680)
+QUICK_SIZES = (16, 64, 256, 1024)
+OPERATIONS = ("encode", "decode", "stream", "tempfile", "css")
+
+# CSS with an embedded image, as used by image_embedding_tool_pixbuf.py
+BENCH_CSS = """
+    #logo {
+        background-image: url("embedded:B64_IMAGE");
+        background-repeat: no-repeat;
+    }
+"""
+
+# Largest size generated for each format.
+MAX_SIZE = {"ico": 256, "gif": 1024}
+
+# Minimum run time and repeats of each measurement.
+MIN_TIME = 0.2
+MIN_REPEATS = 3
+MAX_REPEATS = 50
+
+# Default threshold, as a fraction, for flagging regressions.
+REGRESSION_THRESHOLD = 0.10
+
+
+class Text_Sink():
+    'Stands in for the Gtk.TextBuffer used by convert_image_to_base64()'
+    def set_text(self, text):
+        self.text = text
+
+
+class Stand_In():
+    'Stands in for the window, so its methods can be called without a display.'
+    def __init__(self):
+        self.textbuffer = Text_Sink()
+
+
+def make_rgba_pixels(width, height):
+    'Return RGBA bytes of a deterministic gradient pattern.'
+    rows = []
+    for shift in range(16):
+        row = bytearray(width * 4)
+        for x in range(width):
+            offset = x * 4
+            row[offset] = (x + shift * 16) & 0xff
+            row[offset + 1] = (x * 3) & 0xff
+            row[offset + 2] = (shift * 16) & 0xff
+            row[offset + 3] = 255 if (x // 8 + shift) % 4 else 128
+        rows.append(bytes(row))
+    return b"".join(rows[y % 16] for y in range(height))
+
+
+def make_pixbuf(width, height):
+    'Return a pixbuf with a deterministic pattern.'
+    data = GLib.Bytes.new(make_rgba_pixels(width, height))
+    return GdkPixbuf.Pixbuf.new_from_bytes(data, GdkPixbuf.Colorspace.RGB, True,
+                                           8, width, height, width * 4)
+
+
+def gif_bytes(width, height):
+    '''
+    Return an uncompressed GIF with a 256 grey level palette. Each pixel is
+    written as a 9 bit LZW literal, with a clear code before the code table
+    would grow, so no compression is required.
+    '''
+    palette = b"".join(bytes((level, level, level)) for level in range(256))
+    header = b"GIF89a" + struct.pack("<HHBBB", width, height, 0xF7, 0, 0)
+    image = b"," + struct.pack("<HHHHB", 0, 0, width, height, 0)
+
+    clear, end = 256, 257
+    out = bytearray()
+    accumulator = 0
+    bits = 0
+    count = 0
+
+    def emit(code):
+        nonlocal accumulator, bits
+        accumulator |= code << bits
+        bits += 9
+        while bits >= 8:
+            out.append(accumulator & 0xff)
+            accumulator >>= 8
+            bits -= 8
+
+    emit(clear)
+    for y in range(height):
+        for x in range(width):
+            emit((x + y) & 0xff)
+            count += 1
+            if count == 254:
+                emit(clear)
+                count = 0
+    emit(end)
+    if bits:
+        out.append(accumulator & 0xff)
+
+    blocks = bytearray([8])
+    for offset in range(0, len(out), 255):
+        block = out[offset:offset + 255]
+        blocks.append(len(block))
+        blocks.extend(block)
+    blocks.append(0)
+    return header + palette + image + bytes(blocks) + b";"
+
+
+def svg_bytes(size):
+    'Return an SVG of the given size, with a grid of coloured squares.'
+    cells = []
+    step = max(size // 8, 1)
+    for row in range(8):
+        for col in range(8):
+            cells.append('<rect x="{}" y="{}" width="{}" height="{}" '
+                         'fill="#{:02x}{:02x}80"/>'.format(
+                             col * step, row * step, step, step,
+                             col * 32, row * 32))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{0}">\n'
+            '{1}\n</svg>\n'.format(size, "\n".join(cells))).encode()
+
+
+def generate_image(image_format, size, directory):
+    'Write a synthetic image and return its path.'
+    path = os.path.join(directory, "bench_{}.{}".format(size, image_format))
+    if image_format == "svg":
+        data = svg_bytes(size)
+        with open(path, "wb") as fout:
+            fout.write(data)
+    elif image_format == "gif":
+        with open(path, "wb") as fout:
+            fout.write(gif_bytes(size, size))
+    else:
+        pixbuf = make_pixbuf(size, size)
+        if image_format == "jpeg":
+            pixbuf.savev(path, "jpeg", ["quality"], ["90"])
+        else:
+            pixbuf.savev(path, image_format, [], [])
+    return path
+
+
+def read_status_bytes(field):
+    'Return a memory field of /proc/self/status, E.g. VmRSS, in bytes, or None.'
+    try:
+        with open("/proc/self/status") as fid:
+            for line in fid:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def reset_peak_rss():
+    'Reset VmHWM to the current RSS. Return False if it is not supported.'
+    try:
+        with open("/proc/self/clear_refs", "w") as fout:
+            fout.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def measure_peak_rss(function):
+    '''
+    Call the function once. Return the growth of the resident memory at its
+    peak, in bytes, or None if the peak RSS can not be reset and read.
+    '''
+    if not reset_peak_rss():
+        return None
+    before = read_status_bytes("VmRSS")
+    function()
+    peak = read_status_bytes("VmHWM")
+    if before is None or peak is None:
+        return None
+    return max(peak - before, 0)
+
+
+def measure(function):
+    '''
+    Call the function repeatedly. Return (times, peak, peak_rss) where peak is
+    the largest python heap allocation seen, in bytes, during one call, and
+    peak_rss that of the resident memory, or None.
+    '''
+    times = []
+    start_all = time.perf_counter()
+    while (len(times) < MIN_REPEATS or time.perf_counter() - start_all < MIN_TIME) \
+            and len(times) < MAX_REPEATS:
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    # Memory is measured separately, as tracing slows the code down.
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak, measure_peak_rss(function)
+
+
+def bench_encode(path):
+    'Time convert_image_to_base64() of image_embedding_tool_pixbuf.py'
+    stand_in = Stand_In()
+    return lambda: image_embedding_tool_pixbuf.Main_Window.convert_image_to_base64(
+            stand_in, path)
+
+
+def bench_decode(b64_image):
+    'Time get_image_from_base64() of info_from_pixbuf.py'
+    return lambda: info_from_pixbuf.get_image_from_base64(b64_image)
+
+
+def bench_stream(b64_image):
+    '''
+    Time get_image_pixbuf() of image_embedding_tool.py
+    The program decodes its own B64_IMAGE_2 constant, so it is replaced by the
+    synthetic image while timing.
+    '''
+    def run():
+        saved = (image_embedding_tool.ICON_IMAGE, image_embedding_tool.B64_IMAGE_2)
+        image_embedding_tool.ICON_IMAGE = 2
+        image_embedding_tool.B64_IMAGE_2 = b64_image
+        try:
+            image_embedding_tool.Icon_Window.get_image_pixbuf(None)
+        finally:
+            image_embedding_tool.ICON_IMAGE, image_embedding_tool.B64_IMAGE_2 = saved
+    return run
+
+
+def bench_tempfile(b64_image):
+    '''
+    Time the original path of image_embedding_tool.py: get_image_temp_file_path()
+    wrote the decoded image to a file in /tmp, which was loaded from the file.
+    '''
+    def run():
+        image_data = base64.decodebytes(b64_image)
+        fd, path = tempfile.mkstemp(suffix=".ico", prefix="icon_")
+        try:
+            with open(fd, "wb") as fout:
+                fout.write(image_data)
+            GdkPixbuf.Pixbuf.new_from_file(path)
+        finally:
+            os.remove(path)
+    return run
+
+
+def bench_css(b64_image):
+    '''
+    Time making the data: URI of the image and loading it into a
+    Gtk.CssProvider, as embedded_image.load_css_provider() does.
+    '''
+    def run():
+        css = embedded_image.get_css_with_images(BENCH_CSS,
+                                                 {"B64_IMAGE": b64_image})
+        Gtk.CssProvider().load_from_data(css.encode())
+    return run
+
+
+def run_benchmarks(formats=FORMATS, sizes=SIZES, operations=OPERATIONS,
+                   verbose=True):
+    'Generate the images, run the benchmarks and return the results dictionary.'
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_pixbuf_") as directory:
+        for image_format in formats:
+            for size in sizes:
+                if size > MAX_SIZE.get(image_format, size):
+                    continue
+                path = generate_image(image_format, size, directory)
+                with open(path, "rb") as fid:
+                    data = fid.read()
+                b64_image = base64.encodebytes(data)
+                functions = {"encode": bench_encode(path),
+                             "decode": bench_decode(b64_image),
+                             "stream": bench_stream(b64_image),
+                             "tempfile": bench_tempfile(b64_image),
+                             "css": bench_css(b64_image)}
+                for operation in operations:
+                    times, peak, peak_rss = measure(functions[operation])
+                    median = statistics.median(times)
+                    if operation == "encode" and len(data) > \
+                            image_embedding_tool_pixbuf.OUTPUT_TEXT_LIMIT:
+                        operation = "summary"
+                    result = {
+                        "case": "{}/{}/{}".format(operation, image_format, size),
+                        "operation": operation,
+                        "format": image_format,
+                        "size": size,
+                        "bytes": len(data),
+                        "repeats": len(times),
+                        "seconds_median": median,
+                        "seconds_min": min(times),
+                        "throughput_mb_s": len(data) / median / 1e6 if median else None,
+                        "peak_heap_bytes": peak,
+                        "peak_rss_bytes": peak_rss,
+                    }
+                    results.append(result)
+                    if verbose:
+                        print("{:<22} {:>10} bytes {:>10.3f} ms {:>12} heap "
+                              "{:>12} rss".format(
+                              result["case"], result["bytes"], median * 1000,
+                              peak, peak_rss), file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "gdkpixbuf": GdkPixbuf.PIXBUF_VERSION,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    '''
+    Compare two results dictionaries. Return a list of (case, measure,
+    baseline value, current value, change) for every regression larger than the
+    threshold. The median time, the peak python heap and the peak RSS are
+    compared, where both results have them.
+    '''
+    base_cases = {result["case"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        base = base_cases.get(result["case"])
+        if base is None:
+            continue
+        for key in ("seconds_median", "peak_heap_bytes", "peak_rss_bytes"):
+            before = base.get(key)
+            after = result.get(key)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if change > threshold:
+                regressions.append((result["case"], key, before, after, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Benchmark the image encode and decode paths.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the benchmarks")
+    run.add_argument("-o", "--output", help="Write the results to a JSON file")
+    run.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS)
+    run.add_argument("--sizes", nargs="+", type=int, default=None)
+    run.add_argument("--operations", nargs="+", choices=OPERATIONS,
+                     default=OPERATIONS)
+    run.add_argument("--quick", action="store_true",
+                     help="Only sizes up to 1024 pixels")
+
+    compare = commands.add_parser("compare",
+            help="Flag regressions against a baseline")
+    compare.add_argument("baseline", help="Baseline results JSON file")
+    compare.add_argument("current", help="Current results JSON file")
+    compare.add_argument("-t", "--threshold", type=float,
+                         default=REGRESSION_THRESHOLD,
+                         help="Fractional change flagged (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+        results = run_benchmarks(args.formats, sizes, args.operations)
+        text = json.dumps(results, indent=1)
+        if args.output:
+            with open(args.output, "w") as fout:
+                fout.write(text + "\n")
+        else:
+            print(text)
+        return 0
+
+    with open(args.baseline) as fid:
+        baseline = json.load(fid)
+    with open(args.current) as fid:
+        current = json.load(fid)
+    regressions = compare_results(baseline, current, args.threshold)
+    for case, key, before, after, change in regressions:
+        print("REGRESSION {:<22} {:<15} {:.6g} -> {:.6g} ({:+.1%})".format(
+              case, key, before, after, change))
+    if not regressions:
+        print("No regressions")
+    return 1 if regressions else 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+#
+# constant_index.py
+#
+# Objectives: List, extract, replace and de-duplicate the embedded image
+# constants of a large code base, without parsing its python files every time.
+#
+# Each .py file is tokenized once, and the byte offsets of every module level
+# B64_ bytes literal are recorded, with the sha256 digest of its base64 text,
+# ignoring line breaks, in a sidecar JSON index in the root folder. An entry is
+# reused while the size and modification time of its file are unchanged, so
+# later commands only stat the files, and read a constant with one seek. A
+# replacement is spliced in at the recorded offsets, and the offsets of the
+# constants after it are moved, so the file is not tokenized again.
+#
+# A constant is given as path:NAME, with the path relative to the root.
+#
+# $ python constant_index.py list ~/project
+# $ python constant_index.py extract ~/project app/icons.py:B64_LOGO -o logo.png
+# $ python constant_index.py replace ~/project app/icons.py:B64_LOGO new_logo.png
+# $ python constant_index.py dedupe ~/project
+
+import argparse
+import ast
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import tokenize
+
+import embed_output
+
+INDEX_NAME = ".constant_index.json"
+INDEX_VERSION = 1
+
+# Folders not searched for python files
+SKIP_DIRS = frozenset({"__pycache__", ".git", ".hg", ".svn", ".tox", ".venv",
+                       "venv", "node_modules"})
+
+# Tokens which do not change the meaning of a logical line
+IGNORED_TOKENS = frozenset({tokenize.NL, tokenize.COMMENT, tokenize.INDENT,
+                            tokenize.DEDENT, tokenize.ENCODING})
+
+STRING_PREFIX_RE = re.compile(r"^[A-Za-z]*")
+
+
+def get_line_starts(source):
+    'Return the byte offset of the start of each line of the source.'
+    return [0] + [match.end() for match in re.finditer(b"\n", source)]
+
+
+def get_payload_digest(value):
+    'Return the sha256 hex digest of base64 text, ignoring the line breaks.'
+    return hashlib.sha256(b"".join(value.split())).hexdigest()
+
+
+def iter_logical_lines(source):
+    '''
+    Yield the tokens of each module level logical line of python source,
+    without comments, blank lines or indentation tokens. Statements separated
+    by semicolons, E.g. X = 1; B64_A = b"...", are yielded separately.
+    '''
+    depth = 0
+    tokens = []
+    for token in tokenize.tokenize(io.BytesIO(source).readline):
+        if token.type == tokenize.INDENT:
+            depth += 1
+        elif token.type == tokenize.DEDENT:
+            depth -= 1
+        if token.type in IGNORED_TOKENS:
+            continue
+        if token.type in (tokenize.NEWLINE, tokenize.ENDMARKER) \
+                or token.type == tokenize.OP and token.string == ";":
+            if tokens and depth == 0:
+                yield tokens
+            tokens = []
+            continue
+        tokens.append(token)
+
+
+def get_literal_tokens(tokens, prefix):
+    '''
+    Return the string tokens of a logical line NAME = (b"""...""") whose name
+    starts with the prefix, or None if the line is not such a constant.
+    '''
+    if len(tokens) < 3 or tokens[0].type != tokenize.NAME \
+            or not tokens[0].string.startswith(prefix) \
+            or tokens[1].string != "=":
+        return None
+    value = tokens[2:]
+    while len(value) > 2 and value[0].string == "(" \
+            and value[-1].string == ")":
+        value = value[1:-1]
+    for token in value:
+        if token.type != tokenize.STRING or "b" not in \
+                STRING_PREFIX_RE.match(token.string).group().lower():
+            return None
+    return value
+
+
+def eval_literal(literal):
+    r'''
+    Return the value of the bytes literal of a constant, from the first to the
+    last of its string tokens. It is evaluated in parentheses, as the tokens
+    may be on several lines, E.g. in parentheses or after a backslash.
+
+    >>> eval_literal(b'b"aGVs"\n    b"bG8="')
+    b'aGVsbG8='
+    >>> eval_literal(b'b"aGVs" \\\n    b"bG8="')
+    b'aGVsbG8='
+    '''
+    return ast.literal_eval("(" + literal.decode("utf-8") + ")")
+
+
+def find_constants(source, prefix="B64_", errors=None):
+    '''
+    Tokenize python source, as bytes, and return a list of its module level
+    bytes constants whose names start with the prefix. Each is a dictionary of
+    the name, the line, the byte offsets of the literal, start and end, the
+    length of its base64 text and its sha256 digest. A constant whose literal
+    can not be evaluated is left out, and, if errors is a list, its name, line
+    and error are added to it.
+    '''
+    line_starts = get_line_starts(source)
+
+    def get_offset(position):
+        row, col = position
+        start = line_starts[row - 1]
+        if source[start:start + col].isascii():
+            return start + col
+        # Token columns count characters, not bytes
+        line = source[start:start + col * 4].decode("utf-8", "ignore")
+        return start + len(line[:col].encode("utf-8"))
+
+    constants = []
+    for tokens in iter_logical_lines(source):
+        literal = get_literal_tokens(tokens, prefix)
+        if literal is None:
+            continue
+        start = get_offset(literal[0].start)
+        end = get_offset(literal[-1].end)
+        try:
+            value = eval_literal(source[start:end])
+        except (SyntaxError, ValueError, UnicodeDecodeError) as e:
+            if errors is not None:
+                errors.append({"name": tokens[0].string,
+                               "line": tokens[0].start[0],
+                               "error": str(e)})
+            continue
+        constants.append({"name": tokens[0].string,
+                          "line": tokens[0].start[0],
+                          "start": start,
+                          "end": end,
+                          "payload_bytes": len(b"".join(value.split())),
+                          "sha256": get_payload_digest(value)})
+    return constants
+
+
+def get_index_path(root):
+    return os.path.join(root, INDEX_NAME)
+
+
+def load_index(root, prefix="B64_"):
+    'Return the index of the root folder, or an empty index.'
+    empty = {"version": INDEX_VERSION, "prefix": prefix, "files": {}}
+    try:
+        with open(get_index_path(root)) as fid:
+            index = json.load(fid)
+    except (OSError, ValueError):
+        return empty
+    if index.get("version") != INDEX_VERSION or index.get("prefix") != prefix:
+        return empty
+    return index
+
+
+def save_index(root, index):
+    embed_output.write_text(get_index_path(root),
+                            json.dumps(index, separators=(",", ":")))
+
+
+def iter_python_files(root):
+    'Yield the path, relative to the root, of every .py file under the root.'
+    for folder, dirs, files in os.walk(root):
+        dirs[:] = sorted(name for name in dirs if name not in SKIP_DIRS)
+        for name in sorted(files):
+            if name.endswith(".py"):
+                yield os.path.relpath(os.path.join(folder, name), root)
+
+
+def index_file(root, path, prefix="B64_"):
+    'Tokenize one file and return its index entry.'
+    with open(os.path.join(root, path), "rb") as fid:
+        stat = os.fstat(fid.fileno())
+        source = fid.read()
+    try:
+        constants = find_constants(source, prefix)
+    except (tokenize.TokenError, SyntaxError, ValueError, UnicodeDecodeError):
+        constants = []
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+            "constants": constants}
+
+
+def update_index(root, prefix="B64_"):
+    '''
+    Return the index of the root folder, tokenizing only the files which are
+    new or have changed since it was saved, and the number tokenized. The
+    index is saved if it has changed.
+    '''
+    index = load_index(root, prefix)
+    old_files = index["files"]
+    files = {}
+    tokenized = 0
+    for path in iter_python_files(root):
+        try:
+            stat = os.stat(os.path.join(root, path))
+        except OSError:
+            continue
+        entry = old_files.get(path)
+        if entry is None or entry["mtime_ns"] != stat.st_mtime_ns \
+                or entry["size"] != stat.st_size:
+            try:
+                entry = index_file(root, path, prefix)
+            except OSError:
+                continue
+            tokenized += 1
+        files[path] = entry
+    if tokenized or files.keys() != old_files.keys():
+        index["files"] = files
+        save_index(root, index)
+    return index, tokenized
+
+
+def get_constant(index, spec):
+    'Return the path and the index entry of a constant given as path:NAME.'
+    path, separator, name = spec.rpartition(":")
+    entry = index["files"].get(os.path.normpath(path))
+    if not separator or entry is None:
+        raise KeyError("No indexed file for {}".format(spec))
+    for constant in entry["constants"]:
+        if constant["name"] == name:
+            return os.path.normpath(path), constant
+    raise KeyError("{} not found in {}".format(name, path))
+
+
+def read_constant(root, path, constant):
+    'Return the bytes value of an indexed constant, reading only its literal.'
+    with open(os.path.join(root, path), "rb") as fid:
+        fid.seek(constant["start"])
+        literal = fid.read(constant["end"] - constant["start"])
+    return eval_literal(literal)
+
+
+def replace_constant(root, index, path, constant, image_data):
+    '''
+    Replace the literal of an indexed constant with the base64 of the image
+    data, and move the offsets and lines of the constants after it, so the
+    file is not tokenized again. The file and the index are written
+    atomically.
+    '''
+    file_path = os.path.join(root, path)
+    with open(file_path, "rb") as fid:
+        source = fid.read()
+    encoded = embed_output.encode_base64(image_data)
+    literal = b'b"""\n' + encoded + b'"""'
+    old_literal = source[constant["start"]:constant["end"]]
+    embed_output.write_text(file_path, source[:constant["start"]] + literal
+                            + source[constant["end"]:])
+
+    shift = len(literal) - len(old_literal)
+    line_shift = literal.count(b"\n") - old_literal.count(b"\n")
+    for other in index["files"][path]["constants"]:
+        if other["start"] > constant["start"]:
+            other["start"] += shift
+            other["end"] += shift
+            other["line"] += line_shift
+    constant["end"] = constant["start"] + len(literal)
+    constant["payload_bytes"] = len(b"".join(encoded.split()))
+    constant["sha256"] = get_payload_digest(encoded)
+    stat = os.stat(file_path)
+    index["files"][path]["mtime_ns"] = stat.st_mtime_ns
+    index["files"][path]["size"] = stat.st_size
+    save_index(root, index)
+
+
+def find_duplicates(index):
+    '''
+    Return a list of the groups of constants with the same payload, each a
+    list of (path, constant), the largest waste first.
+    '''
+    groups = {}
+    for path, entry in index["files"].items():
+        for constant in entry["constants"]:
+            groups.setdefault(constant["sha256"], []).append((path, constant))
+    duplicates = [group for group in groups.values() if len(group) > 1]
+    duplicates.sort(key=lambda group: -(len(group) - 1)
+                                      * group[0][1]["payload_bytes"])
+    return duplicates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Index the embedded image constants of python files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("root", help="Root folder of the python files")
+    common.add_argument("-p", "--prefix", default="B64_",
+            help="Prefix of the constant names (default: B64_)")
+
+    listing = commands.add_parser("list", parents=[common],
+            help="List the constants")
+    listing.add_argument("--json", action="store_true",
+            help="Output the index entries as JSON")
+
+    extract = commands.add_parser("extract", parents=[common],
+            help="Extract the image of a constant")
+    extract.add_argument("constant", help="Constant, as path:NAME")
+    extract.add_argument("-o", "--output-file",
+            help="Write the decoded image to a file, rather than print the "
+                 "base64")
+
+    replace = commands.add_parser("replace", parents=[common],
+            help="Replace the image of a constant")
+    replace.add_argument("constant", help="Constant, as path:NAME")
+    replace.add_argument("image", help="New image file")
+
+    commands.add_parser("dedupe", parents=[common],
+            help="Report constants with the same image")
+    args = parser.parse_args(argv)
+
+    index, tokenized = update_index(args.root, args.prefix)
+
+    if args.command == "list":
+        if args.json:
+            print(json.dumps(index["files"], indent=1))
+            return 0
+        count = 0
+        for path, entry in index["files"].items():
+            for constant in entry["constants"]:
+                print("{}:{}  line {}  {} bytes  {}".format(
+                      path, constant["name"], constant["line"],
+                      constant["payload_bytes"], constant["sha256"][:12]))
+                count += 1
+        print("{} constants in {} files, {} tokenized".format(
+              count, len(index["files"]), tokenized), file=sys.stderr)
+        return 0
+
+    if args.command == "dedupe":
+        wasted = 0
+        for group in find_duplicates(index):
+            payload = group[0][1]["payload_bytes"]
+            wasted += (len(group) - 1) * payload
+            print("{} copies of {} bytes, {}".format(len(group), payload,
+                                                     group[0][1]["sha256"][:12]))
+            for path, constant in group:
+                print("    {}:{}  line {}".format(path, constant["name"],
+                                                 constant["line"]))
+        print("{} base64 bytes duplicated".format(wasted))
+        return 0
+
+    try:
+        path, constant = get_constant(index, args.constant)
+    except KeyError as error:
+        print(error.args[0], file=sys.stderr)
+        return 1
+    if args.command == "extract":
+        value = read_constant(args.root, path, constant)
+        if args.output_file:
+            with open(args.output_file, "wb") as fout:
+                fout.write(base64.decodebytes(value))
+        else:
+            print(value.decode("ascii"), end="")
+        return 0
+
+    with open(args.image, "rb") as fid:
+        replace_constant(args.root, index, path, constant, fid.read())
+    print("Replaced {}:{}".format(path, constant["name"]))
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,706 @@
+#!/usr/bin/env python3
+#
+# embed_output.py
+#
+# Objectives: Generate the python code that embeds an image, in one of several
+# output modes, from the command line.
+#
+# Output modes:
+#   constant  A base64 bytes constant, as produced by the GUI programs:
+#             B64_IMAGE = (b"""
+#             iVBORw0KGgoAAAANSUhEUgAAACAAAAAgCAYAAABzenr0AAAJs3pUWHRSYXcgcHJvZmlsZSB0eXBl
+#             ...""")
+#   sidecar   The image is copied, unencoded, to a data file next to the python
+#             program, or in its package. The generated code reads it through
+#             importlib.resources only when it is first needed, so importing
+#             the program does not compile or load the image.
+#   datauri   A data: URI of the image, for use in CSS or markup:
+#             data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAACAAAAAgCAYAAABzenr0...
+#   css       A CSS rule with the data: URI as its background image. It may be
+#             added to the CSS loaded by a Gtk.CssProvider. See also
+#             embedded_image.py, which puts B64_ constants into the CSS.
+#   strip     The frames of an animated GIF, composed and packed into a grid in
+#             one PNG, with a second constant of the frame layout:
+#             B64_IMAGE_FRAMES = (width, height, columns, (delays in ms, ...))
+#             embedded_image.get_strip_frames() returns the frames as
+#             sub-pixbufs of the strip, so it is decoded only once.
+#
+# Trimming: --trim crops the fully transparent borders of an icon, keeping
+# PADDING pixels, before it is encoded, which reduces both the payload and the
+# decoded pixbuf. The size of the original canvas and the offset of the crop
+# are output as a second constant, B64_IMAGE_LAYOUT = (width, height, x, y),
+# and embedded_image.image_new_from_trimmed() restores the layout with widget
+# margins, so the transparent pixels are never stored.
+#
+# Migration: --migrate rewrites a python program which writes its embedded
+# image to a temporary file, with get_image_temp_file_path(), as suggested by
+# image_embedding_tool.py, to load it in memory using embedded_image.py. Only
+# the code is rewritten. Comments and strings are left for review.
+#
+# Large base64 constants are compiled by python whenever there is no .pyc file
+# and loaded from the .pyc on every import. See import_cost.py for a benchmark.
+#
+# $ python embed_output.py radio_retro_32
+# $ python embed_output.py --mode sidecar --name B64_LOGO --output-dir mypackage logo.png
+# $ python embed_output.py --name B64_PHOTO --output-file photo_image.py photo.jpg
+# $ python embed_output.py --estimate photo.jpg
+# $ python embed_output.py --mode css --selector "#logo" radio_retro_32
+# $ python embed_output.py --mode strip --name B64_SPINNER spinner.gif
+# $ python embed_output.py --trim 2 --name B64_LOGO logo.png
+# $ python embed_output.py --migrate --in-place my_program.py
+
+import argparse
+import binascii
+import io
+import math
+import os
+import re
+import shutil
+import stat
+import sys
+import time
+import tokenize
+
+import pixbuf_probe
+
+MODES = ("constant", "sidecar", "datauri", "css", "strip")
+
+# MIME types of the image formats found by pixbuf_probe.py
+MIME_TYPES = {"png": "image/png",
+              "jpeg": "image/jpeg",
+              "gif": "image/gif",
+              "ico": "image/vnd.microsoft.icon",
+              "bmp": "image/bmp",
+              "webp": "image/webp",
+              "svg": "image/svg+xml"}
+
+# Constants larger than this, in characters, are not printed without --force.
+# The GUI asks before encoding them. About 130,000 lines.
+LARGE_OUTPUT = 10 * 1024 * 1024
+
+# Characters in each line of base64 data, as for base64.encodebytes()
+LINE_LENGTH = 76
+
+# Image bytes encoded by each binascii call, a whole number of 57 byte lines.
+# binascii holds the GIL for the whole of a call, so a worker thread encoding a
+# large image lets the GUI main loop run between blocks.
+ENCODE_BLOCK = 57 * 16384
+
+# Bytes of image data encoded at a time when streaming. A multiple of the 57
+# bytes in each line, so every block ends on a whole line.
+BLOCK_SIZE = 57 * 1024
+
+# Most frames packed into a frame strip. Every frame of the strip is held in
+# memory, so longer animations should be embedded as they are, and shown with
+# embedded_image.Animated_Image, which composes one frame at a time.
+MAX_STRIP_FRAMES = 64
+
+SIDECAR_TEMPLATE = '''\
+{name}_FILE = "{file_name}"
+
+# Image data files already read, by file name
+image_data_cache = {{}}
+
+
+def load_image_data(file_name):
+    'Return the binary data of an image data file. It is read when first used.'
+    if file_name not in image_data_cache:
+        # Imported here, so they add nothing to the import time of the program.
+        import importlib.resources
+        import pathlib
+        if __package__:
+            path = importlib.resources.files(__package__).joinpath(file_name)
+        else:
+            path = pathlib.Path(__file__).with_name(file_name)
+        image_data_cache[file_name] = path.read_bytes()
+    return image_data_cache[file_name]
+
+
+def get_image_from_resource(file_name={name}_FILE):
+    'Load the image data file using GdkPixbuf.PixbufLoader. Return the Pixbuf.'
+    import gi
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GdkPixbuf
+    loader = GdkPixbuf.PixbufLoader()
+    loader.write(load_image_data(file_name))
+    loader.close()
+    return loader.get_pixbuf()
+'''
+
+
+def encode_base64(data):
+    '''
+    Return the same result as base64.encodebytes(), lines of 76 characters,
+    but encode ENCODE_BLOCK bytes at a time rather than 57, which is much
+    faster for large images.
+    '''
+    if not data:
+        return b""
+    lines = []
+    view = memoryview(data)
+    for offset in range(0, len(view), ENCODE_BLOCK):
+        encoded = binascii.b2a_base64(view[offset:offset + ENCODE_BLOCK],
+                                      newline=False)
+        lines.extend(encoded[i:i + LINE_LENGTH]
+                     for i in range(0, len(encoded), LINE_LENGTH))
+    lines.append(b"")
+    return b"\n".join(lines)
+
+
+def format_constant(data, name="B64_IMAGE"):
+    'Return the python source of a base64 bytes constant for the image data.'
+    s = name + ' = (b"""\n'
+    s += encode_base64(data).decode('utf-8')
+    s += '""")'
+    return s
+
+
+def get_constant_length(size, name="B64_IMAGE"):
+    'Return the number of characters format_constant() returns for size bytes.'
+    encoded = (size + 2) // 3 * 4
+    lines = (encoded + LINE_LENGTH - 1) // LINE_LENGTH
+    return len(name + ' = (b"""\n') + encoded + lines + len('""")')
+
+
+def estimate_output(file_path, name="B64_IMAGE"):
+    '''
+    Predict the output for an image file before encoding it, from os.stat()
+    and the image header. Return a dictionary of the file size, the base64
+    bytes and lines, the characters of the constant, and the memory of the
+    decoded pixbuf, including the padding of each row. When the header does
+    not say if there is alpha, 4 channels are assumed, the larger estimate.
+    pixbuf_bytes is None if the image could not be probed, or its size is not
+    known from the header, E.g. an SVG with a width of 100% and no viewBox.
+    '''
+    size = os.stat(file_path).st_size
+    encoded = (size + 2) // 3 * 4
+    estimate = {"path": file_path,
+                "name": name,
+                "size": size,
+                "base64_bytes": encoded,
+                "lines": (encoded + LINE_LENGTH - 1) // LINE_LENGTH,
+                "constant_bytes": get_constant_length(size, name),
+                "format": None,
+                "width": None,
+                "height": None,
+                "pixbuf_bytes": None,
+                "frames": None}
+    try:
+        info = pixbuf_probe.probe(file_path)
+    except (OSError, ValueError, ImportError):
+        # ImportError: Not a built-in format, and GdkPixbuf is not available.
+        info = None
+    if info is not None:
+        estimate.update({"format": info["format"],
+                         "width": info["width"],
+                         "height": info["height"]})
+        if isinstance(info["width"], int) and isinstance(info["height"], int):
+            channels = 3 if info["has_alpha"] is False else 4
+            estimate["pixbuf_bytes"] = pixbuf_probe.pixbuf_memory(
+                    info["width"], info["height"], channels)
+    if estimate["format"] == "gif":
+        try:
+            with open(file_path, "rb") as fid:
+                estimate["frames"] = len(pixbuf_probe.gif_frame_delays(fid))
+        except (OSError, ValueError):
+            pass
+    return estimate
+
+
+def format_estimate(estimate):
+    'Return an estimate from estimate_output() as readable text.'
+    text = "{}: {} bytes -> {} base64 bytes in {} lines".format(
+            estimate["name"], estimate["size"], estimate["base64_bytes"],
+            estimate["lines"])
+    if estimate["pixbuf_bytes"] is not None:
+        text += ". {} {} x {}, {} bytes decoded".format(
+                estimate["format"].upper(), estimate["width"],
+                estimate["height"], estimate["pixbuf_bytes"])
+    if estimate["frames"] and estimate["frames"] > 1:
+        text += ", {} frames".format(estimate["frames"])
+    return text
+
+
+def iter_constant(fid, name="B64_IMAGE", block_size=BLOCK_SIZE):
+    '''
+    Yield the python source of a base64 bytes constant, in pieces, for the
+    image data read from a binary file object. The result is the same as
+    format_constant(), but only one block of the image is held at a time.
+    '''
+    yield name + ' = (b"""\n'
+    for block in iter(lambda: fid.read(block_size), b""):
+        yield encode_base64(block).decode('utf-8')
+    yield '""")'
+
+
+def create_temp_file(output_path):
+    '''
+    Create a temporary file in the folder of output_path, to be renamed over
+    it, and return its file descriptor and path. The file has the mode of
+    output_path if that exists, otherwise the default mode of a new file,
+    set by the umask, rather than the 0600 of tempfile.mkstemp().
+    '''
+    directory = os.path.dirname(os.path.abspath(output_path))
+    try:
+        mode = stat.S_IMODE(os.stat(output_path).st_mode)
+    except OSError:
+        mode = None
+    while True:
+        temp_path = os.path.join(directory,
+                                 ".embed_{}.tmp".format(os.urandom(6).hex()))
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        break
+    if mode is not None:
+        try:
+            os.chmod(fd, mode)
+        except OSError:
+            pass
+    return fd, temp_path
+
+
+def write_text(output_path, text):
+    '''
+    Write text, or bytes, to a file atomically, through a temporary file in
+    the same folder. An existing file keeps its mode.
+    '''
+    fd, temp_path = create_temp_file(output_path)
+    try:
+        with open(fd, "wb" if isinstance(text, bytes) else "w") as fout:
+            fout.write(text)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_constants(output_path, sources):
+    '''
+    Write the python source of the constants for a list of (image file path,
+    constant name) to output_path. The source is streamed to a temporary file
+    which is renamed into place, which is atomic, so a partially written file
+    is never left behind. Return the number of characters written.
+    '''
+    fd, temp_path = create_temp_file(output_path)
+    written = 0
+    try:
+        with open(fd, "w") as fout:
+            for index, (file_path, name) in enumerate(sources):
+                if index:
+                    written += fout.write("\n\n")
+                with open(file_path, "rb") as fid:
+                    for text in iter_constant(fid, name):
+                        written += fout.write(text)
+            written += fout.write("\n")
+        os.replace(temp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return written
+
+
+def get_mime_type(file_path):
+    'Return the MIME type of an image file, from its header.'
+    try:
+        info = pixbuf_probe.probe(file_path, fallback=False)
+    except (OSError, ValueError):
+        info = None
+    if info is None:
+        return "application/octet-stream"
+    return MIME_TYPES.get(info["format"], "image/" + info["format"])
+
+
+def format_data_uri(data, mime_type):
+    'Return a data: URI for binary image data.'
+    return "data:{};base64,{}".format(mime_type,
+            binascii.b2a_base64(data, newline=False).decode('ascii'))
+
+
+def format_css(data, mime_type, selector):
+    'Return a CSS rule using the image data as the background image.'
+    return '{} {{\n    background-image: url("{}");\n}}'.format(
+            selector, format_data_uri(data, mime_type))
+
+
+def get_css_selector(name):
+    'Return a CSS class selector for a constant name, E.g. B64_LOGO is .b64-logo'
+    return "." + name.lower().replace("_", "-")
+
+
+def make_frame_strip(file_path, max_frames=MAX_STRIP_FRAMES):
+    '''
+    Compose every frame of an animated GIF with the GdkPixbuf animation
+    iterator, and pack them into one pixbuf, a grid read left to right. The
+    frames are counted from the GIF blocks, and the iterator is advanced by
+    each frame delay from time 0, so one loop is packed, whatever the clock.
+    Return the PNG data of the strip and its frame layout,
+    (width, height, columns, delays), with the delays in milliseconds.
+    '''
+    import gi
+    gi.require_version('GLib', '2.0')
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GLib, GdkPixbuf
+
+    with open(file_path, "rb") as fid:
+        count = len(pixbuf_probe.gif_frame_delays(fid))
+    if count > max_frames:
+        raise ValueError("{} frames is more than {}. Embed the animation as a "
+                         "constant instead".format(count, max_frames))
+    animation = GdkPixbuf.PixbufAnimation.new_from_file(file_path)
+    width, height = animation.get_width(), animation.get_height()
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    strip = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, True, 8,
+                                 width * columns, height * rows)
+    strip.fill(0x00000000)
+
+    current_time = GLib.TimeVal()
+    current_time.tv_sec = current_time.tv_usec = 0
+    frame_iter = animation.get_iter(current_time)
+    elapsed = 0
+    delays = []
+    for index in range(count):
+        frame_iter.get_pixbuf().copy_area(0, 0, width, height, strip,
+                                          index % columns * width,
+                                          index // columns * height)
+        delay = frame_iter.get_delay_time()
+        delays.append(delay)
+        if delay < 0:
+            # The last frame is shown for ever
+            break
+        elapsed += delay
+        current_time.tv_sec, current_time.tv_usec = divmod(elapsed * 1000,
+                                                           1000000)
+        frame_iter.advance(current_time)
+    _, data = strip.save_to_bufferv("png", [], [])
+    return data, (width, height, columns, tuple(delays))
+
+
+def format_strip(data, layout, name="B64_IMAGE"):
+    'Return the python source of a frame strip constant and its layout.'
+    return "{}\n{}_FRAMES = {!r}".format(format_constant(data, name), name,
+                                        layout)
+
+
+def trim_image(file_path, padding=0):
+    '''
+    Crop the fully transparent borders of an image, keeping padding pixels on
+    each side. Return the image data, as PNG if it was cropped, and the layout
+    (canvas width, canvas height, x, y) of the crop in the original image. An
+    image with nothing to crop, an SVG, or an image whose cropped PNG is no
+    smaller than the original, E.g. a palette image, is returned unchanged.
+    Raise ValueError for an animation, which would lose all but one frame.
+    '''
+    with open(file_path, "rb") as fid:
+        data = fid.read()
+    info = pixbuf_probe.probe_bytes(data)
+    if is_animation(data, info):
+        raise ValueError("An animation can not be trimmed. "
+                         "Use --mode strip")
+
+    import info_from_pixbuf
+    import pixbuf_array
+    pixbuf = info_from_pixbuf.get_image_from_bytes(data)
+    unchanged = (pixbuf.get_width(), pixbuf.get_height(), 0, 0)
+    if info is not None and info["format"] == "svg":
+        # Cropping would rasterize the SVG
+        return data, unchanged
+    trimmed, layout = pixbuf_array.trim_pixbuf(pixbuf, padding)
+    if trimmed is pixbuf:
+        return data, layout
+    _, png_data = trimmed.save_to_bufferv("png", [], [])
+    if len(png_data) >= len(data):
+        return data, unchanged
+    return png_data, layout
+
+
+def is_animation(data, info):
+    'Return True if image data, probed as info, has more than one frame.'
+    if info is None:
+        return False
+    if info["format"] == "gif":
+        try:
+            return len(pixbuf_probe.gif_frame_delays(io.BytesIO(data))) > 1
+        except ValueError:
+            return False
+    # A WebP extended header has an animation flag
+    return info["format"] == "webp" and data[12:16] == b"VP8X" \
+            and bool(data[20] & 0x02)
+
+
+def non_negative_int(text):
+    'argparse type for a count which may be 0, E.g. of padding pixels.'
+    value = int(text)
+    if value < 0:
+        raise argparse.ArgumentTypeError("must not be negative")
+    return value
+
+
+def format_trimmed(data, layout, name="B64_IMAGE"):
+    'Return the python source of a trimmed image constant and its layout.'
+    return "{}\n{}_LAYOUT = {!r}".format(format_constant(data, name), name,
+                                        layout)
+
+
+def get_constant_name(file_path):
+    'Return a constant name for an image file, E.g. logo-32.png is B64_LOGO_32'
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    name = re.sub(r"\W+", "_", stem).strip("_").upper()
+    return "B64_" + (name or "IMAGE")
+
+
+def encode_file(file_path, name=None):
+    '''
+    Read an image file and return a dictionary of the python source of its
+    constant, the file size, and the time taken. Used by worker threads.
+    '''
+    start = time.perf_counter()
+    if name is None:
+        name = get_constant_name(file_path)
+    with open(file_path, "rb") as fid:
+        data = fid.read()
+    text = format_constant(data, name)
+    return {"path": file_path,
+            "name": name,
+            "size": len(data),
+            "text": text,
+            "seconds": time.perf_counter() - start}
+
+
+def get_sidecar_name(name, file_path):
+    'Return the data file name for a constant name and the source image file.'
+    extension = os.path.splitext(file_path)[1].lower()
+    return name.lower() + extension
+
+
+def format_sidecar(name, file_name):
+    'Return the python source that loads an image data file when first used.'
+    return SIDECAR_TEMPLATE.format(name=name, file_name=file_name)
+
+
+def write_sidecar(file_path, name, output_dir):
+    '''
+    Copy the image file to the output directory as the data file for the
+    constant name. Return the python source that loads it.
+    '''
+    file_name = get_sidecar_name(name, file_path)
+    os.makedirs(output_dir, exist_ok=True)
+    shutil.copyfile(file_path, os.path.join(output_dir, file_name))
+    return format_sidecar(name, file_name)
+
+
+def mask_source(source):
+    '''
+    Return python source with each comment and string replaced by a
+    placeholder, \0C1\0 or \0S2\0, and the list of the replaced text, so
+    the code can be rewritten without touching them. Raise ValueError if the
+    source can not be tokenized.
+    '''
+    line_starts = get_line_starts(source)
+    regions = []
+    fstring_start = None
+    depth = 0
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            kind = tokenize.tok_name[token.type]
+            if kind == "FSTRING_START":
+                if depth == 0:
+                    fstring_start = token.start
+                depth += 1
+            elif kind == "FSTRING_END":
+                depth -= 1
+                if depth == 0:
+                    regions.append(("S", fstring_start, token.end))
+            elif depth == 0 and token.type in (tokenize.COMMENT,
+                                               tokenize.STRING):
+                regions.append(("C" if token.type == tokenize.COMMENT else "S",
+                                token.start, token.end))
+    except (tokenize.TokenError, SyntaxError) as e:
+        raise ValueError("Unable to tokenize the source: {}".format(e))
+
+    pieces = []
+    masked = []
+    offset = 0
+    for kind, start, end in regions:
+        start = line_starts[start[0] - 1] + start[1]
+        end = line_starts[end[0] - 1] + end[1]
+        masked.append(source[offset:start])
+        masked.append("\0{}{}\0".format(kind, len(pieces)))
+        pieces.append(source[start:end])
+        offset = end
+    masked.append(source[offset:])
+    return "".join(masked), pieces
+
+
+def unmask_source(masked, pieces):
+    'Return the source with the placeholders of mask_source() replaced.'
+    return re.sub(r"\0[CS](\d+)\0", lambda match: pieces[int(match.group(1))],
+                  masked)
+
+
+def get_line_starts(source):
+    'Return the offset of the start of each line of the source.'
+    return [0] + [match.end() for match in re.finditer("\n", source)]
+
+
+def migrate_source(source):
+    '''
+    Rewrite python source that loads its embedded image through a temporary
+    file, to load it in memory with embedded_image.py. Only the code is
+    rewritten. Comments and strings are left as they are, except for the
+    comments directly above a line which is removed. Return the new source and
+    the number of changes.
+    '''
+    source, pieces = mask_source(source)
+    changes = 0
+
+    def sub(pattern, replacement, text, flags=re.MULTILINE):
+        nonlocal changes
+        text, count = re.subn(pattern, replacement, text, flags=flags)
+        changes += count
+        return text
+
+    # Comment lines, as placeholders, directly above a line
+    comments = r"(?:[ \t]*\0C\d+\0[ \t]*\n)*"
+
+    # Variables holding the temporary file path become pixbufs
+    names = set(re.findall(r"([\w.]+)\s*=\s*(?:self\.)?get_image_temp_file_path\(\)",
+                           source))
+    for name in sorted(names):
+        new_name = re.sub(r"_?(path_file|file_path|path)$", "_pixbuf", name)
+        if new_name == name:
+            new_name = name + "_pixbuf"
+        pattern = re.escape(name) + r"\b"
+        source = sub(r"^" + comments + r"[ \t]*os\.remove\(" + pattern
+                     + r"\)[ \t]*\n", "", source)
+        source = sub(r"Gtk\.Image\.new_from_file\((" + pattern + r")\)",
+                     r"Gtk.Image.new_from_pixbuf(\1)", source)
+        source = sub(r"\.set_icon_from_file\((" + pattern + r")\)",
+                     r".set_icon(\1)", source)
+        source = sub(r"(?<![\w.])" + pattern, new_name, source)
+
+    # The function decodes to a pixbuf in memory, rather than to a file
+    source = sub(r"^([ \t]*)image_data = base64\.decodebytes\((\w+)\)[ \t]*\n"
+                 r"(?:(?:\1.*|[ \t]*)\n)*?\1return temp_file_tuple\[1\][ \t]*$",
+                 r"\1return embedded_image.get_pixbuf_from_base64(\2)", source)
+    source = sub(r"\bget_image_temp_file_path\b", "get_image_pixbuf", source)
+
+    # import tempfile becomes import embedded_image, if no longer used
+    if changes:
+        if "tempfile." not in source:
+            source = sub(r"^([ \t]*)import tempfile[ \t]*$",
+                         r"\1import embedded_image", source)
+        if not re.search(r"^import embedded_image", source, re.MULTILINE):
+            source = sub(r"^import base64[ \t]*$",
+                         "import base64\nimport embedded_image", source)
+    return unmask_source(source, pieces), changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Generate python code that embeds an image.")
+    parser.add_argument("image", help="Image file to embed")
+    parser.add_argument("-m", "--mode", choices=MODES, default="constant",
+            help="Output mode (default: constant)")
+    parser.add_argument("-n", "--name", default="B64_IMAGE",
+            help="Name of the constant (default: B64_IMAGE)")
+    parser.add_argument("-o", "--output-dir", default=".",
+            help="Directory for the sidecar data file (default: .)")
+    parser.add_argument("-f", "--output-file",
+            help="Write the constant to a python file, rather than print it")
+    parser.add_argument("-s", "--selector",
+            help="Selector of the css rule (default: from the name, .b64-image)")
+    parser.add_argument("-e", "--estimate", action="store_true",
+            help="Only show the predicted size of the output")
+    parser.add_argument("-t", "--trim", type=non_negative_int, nargs="?",
+            const=0,
+            metavar="PADDING",
+            help="Crop transparent borders, keeping PADDING pixels (default: 0)")
+    parser.add_argument("--force", action="store_true",
+            help="Print the constant however large it is")
+    parser.add_argument("--migrate", action="store_true",
+            help="The file is a python program, whose temporary file image "
+                 "loading is rewritten to use embedded_image.py")
+    parser.add_argument("-i", "--in-place", action="store_true",
+            help="With --migrate, rewrite the program rather than print it")
+    args = parser.parse_args(argv)
+    if args.trim is not None and args.mode != "constant":
+        parser.error("--trim is only available in the constant mode")
+
+    if args.migrate:
+        with open(args.image) as fid:
+            try:
+                source, changes = migrate_source(fid.read())
+            except ValueError as e:
+                print("{}: {}".format(args.image, e), file=sys.stderr)
+                return 1
+        if not args.in_place:
+            print(source, end="")
+        elif changes:
+            write_text(args.image, source)
+        print("{} changes. Copy embedded_image.py next to {}".format(
+              changes, args.image), file=sys.stderr)
+        return 0
+
+    estimate = estimate_output(args.image, args.name)
+    if args.estimate:
+        print(format_estimate(estimate))
+        return 0
+    if args.mode == "constant" and not args.output_file and not args.force \
+            and estimate["constant_bytes"] > LARGE_OUTPUT:
+        print(format_estimate(estimate), file=sys.stderr)
+        print("The constant is too large to print. Use --output-file, or "
+              "--force to print it anyway.", file=sys.stderr)
+        return 1
+
+    if args.mode == "sidecar":
+        print(write_sidecar(args.image, args.name, args.output_dir))
+    elif args.mode in ("datauri", "css"):
+        mime_type = get_mime_type(args.image)
+        with open(args.image, "rb") as fid:
+            data = fid.read()
+        if args.mode == "datauri":
+            print(format_data_uri(data, mime_type))
+        else:
+            print(format_css(data, mime_type,
+                             args.selector or get_css_selector(args.name)))
+    elif args.mode == "strip":
+        try:
+            data, layout = make_frame_strip(args.image)
+        except ValueError as error:
+            print("{}: {}".format(args.image, error), file=sys.stderr)
+            return 1
+        text = format_strip(data, layout, args.name)
+        if args.output_file:
+            write_text(args.output_file, text + "\n")
+        else:
+            print(text)
+    elif args.trim is not None:
+        try:
+            data, layout = trim_image(args.image, args.trim)
+        except ValueError as error:
+            print("{}: {}".format(args.image, error), file=sys.stderr)
+            return 1
+        text = format_trimmed(data, layout, args.name)
+        if args.output_file:
+            write_text(args.output_file, text + "\n")
+        else:
+            print(text)
+    elif args.output_file:
+        write_constants(args.output_file, [(args.image, args.name)])
+    else:
+        with open(args.image, "rb") as fid:
+            print(format_constant(fid.read(), args.name))
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
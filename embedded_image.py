@@ -0,0 +1,611 @@
+#!/usr/bin/env python3
+#
+# embedded_image.py
+#
+# Objectives: Helpers for GTK programs that use embedded base64 images. The
+# module has no dependencies other than PyGObject, so it may be copied into a
+# program being developed, or the functions pasted into it.
+#
+# Images: get_pixbuf_from_base64() decodes a B64_ constant into a pixbuf in
+# memory, through a Gio.MemoryInputStream over GLib.Bytes. Nothing is written
+# to /tmp. These replace the file based calls used with a temporary file:
+#   Gtk.Image.new_from_file(path)    image_new_from_base64(B64_IMAGE)
+#   window.set_icon_from_file(path)  set_icon_from_base64(window, B64_IMAGE)
+# See embed_output.py --migrate to rewrite a program using a temporary file.
+#
+# Trimmed images: embed_output.py --trim crops the transparent borders of an
+# icon and outputs its layout. image_new_from_trimmed() restores the layout
+# with the margins of the Gtk.Image:
+#   image = image_new_from_trimmed(B64_LOGO, B64_LOGO_LAYOUT)
+#
+# Icons: add_theme_icon() registers a B64_ constant as a themed icon. Widgets
+# then share GTK's icon cache, rather than each scaling its own pixbuf:
+#   add_theme_icon("my-logo", B64_LOGO)
+#   image = Gtk.Image.new_from_icon_name("my-logo", Gtk.IconSize.DND)
+#
+# HiDPI: A 32 pixel image is scaled up, and blurred, on a display with a scale
+# factor of 2. Scaled_Image decodes at the device size, 64 pixels, and draws
+# from a Cairo surface, made once and cached by get_surface_from_base64().
+#   image = Scaled_Image(B64_LOGO, 32)
+#
+# Pool: Pixbuf_Pool holds decoded images for the widgets showing them, and
+# releases the pixels of an image shown only by hidden widgets, such as the
+# logo of an About dialog, decoding it again when it is next shown:
+#   pool.add_image("logo", B64_LOGO)
+#   pool.attach(about_dialog, "logo", about_dialog.set_logo)
+#
+# Animations: get_pixbuf_from_base64() returns only the first frame of an
+# animated GIF. get_animation_from_base64() returns a PixbufAnimation, shown by
+# Animated_Image a frame at a time, through the animation iterator, so memory
+# stays bounded for a long animation used as a spinner. A short animation may
+# instead be embedded as a frame strip, all its frames in one image, with
+# embed_output.py --mode strip, and shown with:
+#   Animated_Image(frames=get_strip_frames(B64_SPINNER, B64_SPINNER_FRAMES))
+#
+# Copies: base64.decodebytes() makes a full binary copy of the image, held by
+# python, and GLib.Bytes.new() or PixbufLoader.write() copy it again into C.
+# get_pixbuf_from_base64() decodes 64 KB of base64 at a time. Each binary
+# chunk is copied into the stream as GLib.Bytes, and freed by python, so
+# python never holds more than one chunk of the image. PyGObject always copies
+# a python buffer into GLib.Bytes, so one copy in C remains. The pixbuf loader
+# reads the stream a block at a time. See memory_profile.py for a comparison.
+#
+# CSS: Gtk.CssProvider can only load background images and icons from files,
+# or from data: URIs. load_css_provider() replaces each url("embedded:NAME")
+# in the CSS with a data: URI made from the B64_ constant NAME, so themed
+# backgrounds and icons come from the single in-memory provider, with no file
+# I/O. The base64 constant is used as it is, without decoding it.
+#
+#   CSS = """
+#       #logo { background-image: url("embedded:B64_LOGO"); }
+#   """
+#   provider = load_css_provider(CSS, {"B64_LOGO": B64_LOGO})
+#
+# $ python embedded_image.py
+
+import base64
+import binascii
+import collections
+import re
+
+import gi
+gi.require_version('Gtk', '3.0')
+gi.require_version('Gdk', '3.0')
+gi.require_version('Gio', '2.0')
+gi.require_version('GLib', '2.0')
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import Gtk, Gdk, Gio, GLib, GdkPixbuf
+
+# Image file signatures, and their MIME types, for data: URIs.
+MIME_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"\x00\x00\x01\x00", "image/vnd.microsoft.icon"),
+    (b"BM", "image/bmp"),
+)
+
+# Characters of base64 decoded at a time.
+DECODE_CHUNK = 64 * 1024
+
+# Cairo surfaces kept by get_surface_from_base64()
+SURFACE_CACHE_ENTRIES = 64
+surface_cache = collections.OrderedDict()
+
+# Seconds before Pixbuf_Pool releases an image no longer shown
+RELEASE_DELAY = 30
+
+EMBEDDED_URL_RE = re.compile(r"""url\(\s*(["']?)embedded:(\w+)\1\s*\)""")
+
+
+def iter_base64_chunks(b64_image, chunk_size=DECODE_CHUNK):
+    '''
+    Yield the binary data of a base64 image constant, a chunk at a time. Chunks
+    end at a line end, after a whole number of 4 character groups.
+    '''
+    view = memoryview(b64_image)
+    length = len(b64_image)
+    start = 0
+    while start < length:
+        end = start + chunk_size
+        while end < length:
+            end = b64_image.find(b"\n", end)
+            if end < 0:
+                end = length
+                break
+            end += 1
+            whitespace = b64_image.count(b"\n", start, end) \
+                         + b64_image.count(b"\r", start, end)
+            if (end - start - whitespace) % 4 == 0:
+                break
+        yield binascii.a2b_base64(view[start:end])
+        start = end
+
+
+def get_base64_stream(b64_image):
+    '''
+    Return a Gio.MemoryInputStream of the binary data of a base64 image
+    constant. Each decoded chunk is added to the stream as it is decoded, so
+    python does not hold a copy of the whole image.
+    '''
+    stream = Gio.MemoryInputStream.new()
+    for chunk in iter_base64_chunks(b64_image):
+        stream.add_bytes(GLib.Bytes.new(chunk))
+    return stream
+
+
+def get_pixbuf_from_bytes(image_data):
+    'Return binary image data, E.g. read from a file, as a Pixbuf.'
+    stream = Gio.MemoryInputStream.new_from_bytes(GLib.Bytes.new(image_data))
+    pixbuf = GdkPixbuf.Pixbuf.new_from_stream(stream, None)
+    stream.close(None)
+    return pixbuf
+
+
+def get_pixbuf_from_base64(b64_image):
+    '''
+    Decode a base64 image constant and return it as a Pixbuf. The image is
+    read from a Gio.MemoryInputStream, so no file is written. Only the first
+    frame of an animation is returned, see get_animation_from_base64().
+    '''
+    stream = get_base64_stream(b64_image)
+    pixbuf = GdkPixbuf.Pixbuf.new_from_stream(stream, None)
+    stream.close(None)
+    return pixbuf
+
+
+def get_sized_pixbuf_from_base64(b64_image, size):
+    '''
+    Decode a base64 image constant to fit size x size pixels, keeping the
+    aspect. An SVG is rendered at that size, rather than scaled.
+    '''
+    stream = get_base64_stream(b64_image)
+    pixbuf = GdkPixbuf.Pixbuf.new_from_stream_at_scale(stream, size, size,
+                                                       True, None)
+    stream.close(None)
+    return pixbuf
+
+
+def get_surface_from_base64(b64_image, size, scale=1):
+    '''
+    Return a Cairo surface of a base64 image constant, size x size logical
+    pixels, for a display with the scale factor. The image is decoded at the
+    device size, size * scale, so an SVG stays sharp on a HiDPI display, and
+    converted once to a premultiplied surface with that device scale. The
+    surfaces are cached by (image, size, scale), so each is only made once.
+    '''
+    key = (b64_image, size, scale)
+    surface = surface_cache.get(key)
+    if surface is None:
+        pixbuf = get_sized_pixbuf_from_base64(b64_image, size * scale)
+        surface = Gdk.cairo_surface_create_from_pixbuf(pixbuf, scale, None)
+        surface_cache[key] = surface
+        while len(surface_cache) > SURFACE_CACHE_ENTRIES:
+            surface_cache.popitem(last=False)
+    else:
+        surface_cache.move_to_end(key)
+    return surface
+
+
+class Scaled_Image(Gtk.Image):
+    '''
+    Gtk.Image of a base64 image constant, size x size logical pixels, drawn
+    from a cached Cairo surface at the scale factor of the display. It is
+    decoded again at the new device size when the window moves to a monitor
+    with a different scale factor. Drawing needs no pixbuf conversion.
+    '''
+    def __init__(self, b64_image, size):
+        super(Scaled_Image, self).__init__()
+        self.b64_image = b64_image
+        self.size = size
+        self.set_size_request(size, size)
+        self.connect("notify::scale-factor", self.cb_scale_factor)
+        self.update_surface()
+
+
+    def update_surface(self):
+        self.set_from_surface(get_surface_from_base64(
+                self.b64_image, self.size, self.get_scale_factor()))
+
+
+    def cb_scale_factor(self, widget, param):
+        self.update_surface()
+
+
+def get_display_scale():
+    'Return the largest scale factor of the monitors of the default display.'
+    display = Gdk.Display.get_default()
+    if display is None:
+        return 1
+    return max([display.get_monitor(number).get_scale_factor()
+                for number in range(display.get_n_monitors())] or [1])
+
+
+def add_theme_icon(icon_name, b64_image, sizes=()):
+    '''
+    Register a base64 image constant as a themed icon, so widgets may use it
+    by name, with Gtk.Image.new_from_icon_name(), set_icon_name() etc. It is
+    added as a built-in icon, found in every icon theme, at its own size and
+    at each of the sizes given, decoded once for each. An SVG is also rendered
+    at the device size of a HiDPI display. A bitmap is not, as it would only
+    be scaled up, as GTK does itself. GTK picks the nearest size, and caches
+    the icon for each size it is drawn at, so using it many times at one size
+    never decodes or scales it again. Return its own size.
+
+    Gtk.IconTheme.add_builtin_icon() is deprecated since GTK 3.14, but works
+    in every GTK 3 release, and keeps each pixbuf registered for the life of
+    the program. Gtk.IconTheme.add_resource_path() would need a Gio.Resource,
+    whose GVDB data cannot be built in Python from the bytes of the image.
+    '''
+    pixbuf = get_pixbuf_from_base64(b64_image)
+    size = max(pixbuf.get_width(), pixbuf.get_height())
+    Gtk.IconTheme.add_builtin_icon(icon_name, size, pixbuf)
+    sizes = set(sizes)
+    scale = get_display_scale()
+    head = next(iter_base64_chunks(b64_image, 1024), b"")
+    if scale > 1 and get_mime_type(head) == "image/svg+xml":
+        sizes.add(size * scale)
+    for other_size in sizes:
+        if other_size != size:
+            Gtk.IconTheme.add_builtin_icon(icon_name, other_size,
+                    get_sized_pixbuf_from_base64(b64_image, other_size))
+    return size
+
+
+def get_animation_from_base64(b64_image):
+    '''
+    Decode a base64 image constant and return it as a PixbufAnimation. A still
+    image is an animation with one frame, see is_static_image(). Show it with
+    Animated_Image, which composes one frame at a time.
+    '''
+    stream = get_base64_stream(b64_image)
+    animation = GdkPixbuf.PixbufAnimation.new_from_stream(stream, None)
+    stream.close(None)
+    return animation
+
+
+def get_strip_frames(b64_strip, layout):
+    '''
+    Return the frames of a frame strip, made by embed_output.py --mode strip,
+    as a list of (pixbuf, delay) tuples. layout is its _FRAMES constant,
+    (width, height, columns, delays). The strip is decoded once, and every
+    frame is a sub-pixbuf sharing the pixels of the strip.
+    '''
+    strip = get_pixbuf_from_base64(b64_strip)
+    width, height, columns, delays = layout
+    return [(strip.new_subpixbuf(index % columns * width,
+                                 index // columns * height, width, height),
+             delay)
+            for index, delay in enumerate(delays)]
+
+
+class Animated_Image(Gtk.Image):
+    '''
+    Gtk.Image showing an animation, or the frames of a frame strip. An
+    animation is shown through its iterator, which composes each frame when it
+    is due, so only the current frame is held, however long the animation.
+    The timer only runs while the image is mapped, so a hidden spinner uses no
+    CPU. When shown again the iterator skips to the frame due at that time.
+    '''
+    def __init__(self, animation=None, frames=None):
+        super(Animated_Image, self).__init__()
+        self.frame_iter = None
+        self.frames = None
+        self.frame_index = 0
+        self.timeout_id = None
+        self.connect("map", self.cb_map)
+        self.connect("unmap", self.cb_unmap)
+        if animation is not None:
+            self.set_animation(animation)
+        elif frames is not None:
+            self.set_frames(frames)
+
+
+    def set_animation(self, animation):
+        'Show a PixbufAnimation, from get_animation_from_base64().'
+        self.stop()
+        self.frames = None
+        if animation.is_static_image():
+            self.frame_iter = None
+            self.set_from_pixbuf(animation.get_static_image())
+            return
+        self.frame_iter = animation.get_iter(None)
+        self.set_from_pixbuf(self.frame_iter.get_pixbuf())
+        self.start()
+
+
+    def set_frames(self, frames):
+        'Show a list of (pixbuf, delay) tuples, from get_strip_frames().'
+        self.stop()
+        self.frame_iter = None
+        self.frames = frames
+        self.frame_index = 0
+        self.set_from_pixbuf(frames[0][0])
+        self.start()
+
+
+    def get_delay(self):
+        'Milliseconds until the next frame, or -1 to stay on this frame.'
+        if self.frame_iter is not None:
+            return self.frame_iter.get_delay_time()
+        if self.frames and len(self.frames) > 1:
+            return self.frames[self.frame_index][1]
+        return -1
+
+
+    def start(self):
+        if self.timeout_id is not None or not self.get_mapped():
+            return
+        delay = self.get_delay()
+        if delay >= 0:
+            self.timeout_id = GLib.timeout_add(delay, self.cb_timeout)
+
+
+    def stop(self):
+        if self.timeout_id is not None:
+            GLib.source_remove(self.timeout_id)
+            self.timeout_id = None
+
+
+    def cb_timeout(self):
+        'Show the next frame, and wait for the one after.'
+        self.timeout_id = None
+        if self.frame_iter is not None:
+            if self.frame_iter.advance(None):
+                self.set_from_pixbuf(self.frame_iter.get_pixbuf())
+        else:
+            self.frame_index = (self.frame_index + 1) % len(self.frames)
+            self.set_from_pixbuf(self.frames[self.frame_index][0])
+        self.start()
+        return False
+
+
+    def cb_map(self, widget):
+        if self.frame_iter is not None and self.frame_iter.advance(None):
+            self.set_from_pixbuf(self.frame_iter.get_pixbuf())
+        self.start()
+
+
+    def cb_unmap(self, widget):
+        self.stop()
+
+
+def image_new_from_base64(b64_image):
+    'Return a Gtk.Image of a base64 image. Replaces Gtk.Image.new_from_file()'
+    return Gtk.Image.new_from_pixbuf(get_pixbuf_from_base64(b64_image))
+
+
+def set_layout_margins(widget, width, height, layout):
+    '''
+    Set the margins of a widget showing a width x height image trimmed by
+    embed_output.py --trim, so it is laid out as the original canvas. layout
+    is the _LAYOUT constant, (canvas width, canvas height, x, y).
+    '''
+    canvas_width, canvas_height, x, y = layout
+    widget.set_margin_start(x)
+    widget.set_margin_top(y)
+    widget.set_margin_end(canvas_width - x - width)
+    widget.set_margin_bottom(canvas_height - y - height)
+
+
+def image_new_from_trimmed(b64_image, layout):
+    '''
+    Return a Gtk.Image of an image trimmed by embed_output.py --trim, with its
+    cropped borders restored as margins, so the transparent pixels are neither
+    embedded nor decoded.
+    '''
+    pixbuf = get_pixbuf_from_base64(b64_image)
+    image = Gtk.Image.new_from_pixbuf(pixbuf)
+    set_layout_margins(image, pixbuf.get_width(), pixbuf.get_height(), layout)
+    return image
+
+
+def set_icon_from_base64(window, b64_image):
+    'Set the icon of a Gtk.Window from a base64 image. Replaces set_icon_from_file()'
+    window.set_icon(get_pixbuf_from_base64(b64_image))
+
+
+class Pixbuf_Pool():
+    '''
+    Decoded pixbufs of base64 image constants, shared by the widgets that show
+    them. An image is only decoded when a widget using it is shown. When every
+    widget using an image has been hidden for release_delay seconds, the
+    widgets are cleared and the pixbuf released. It is decoded again, and
+    given back to the widgets, when one of them is shown.
+    '''
+    def __init__(self, release_delay=RELEASE_DELAY):
+        self.release_delay = release_delay
+        self.images = {}
+        self.pixbufs = {}
+        self.users = collections.defaultdict(list)
+        self.release_ids = {}
+        self.counts = collections.Counter()
+
+
+    def add_image(self, name, b64_image):
+        'Add a base64 image constant to the pool. It is not decoded yet.'
+        self.images[name] = b64_image
+
+
+    def get_pixbuf(self, name):
+        'Return the pixbuf of an image, decoding it if it has been released.'
+        pixbuf = self.pixbufs.get(name)
+        if pixbuf is None:
+            pixbuf = get_pixbuf_from_base64(self.images[name])
+            self.pixbufs[name] = pixbuf
+            self.counts["decodes"] += 1
+            self.counts["peak_bytes"] = max(self.counts["peak_bytes"],
+                                            self.get_decoded_bytes())
+        else:
+            self.counts["hits"] += 1
+        return pixbuf
+
+
+    def attach(self, widget, name, set_pixbuf):
+        '''
+        Show an image of the pool in a widget, E.g. for the logo of an About
+        dialog: attach(about, "logo", about.set_logo). set_pixbuf is called
+        with the pixbuf when the widget is shown, and with None when the
+        pixbuf is released.
+        '''
+        self.users[name].append((widget, set_pixbuf))
+        widget.connect("map", self.cb_map, name, set_pixbuf)
+        widget.connect("unmap", self.cb_unmap, name)
+        widget.connect("destroy", self.cb_destroy, name)
+        if widget.get_mapped():
+            set_pixbuf(self.get_pixbuf(name))
+
+
+    def cb_map(self, widget, name, set_pixbuf):
+        release_id = self.release_ids.pop(name, None)
+        if release_id is not None:
+            GLib.source_remove(release_id)
+        set_pixbuf(self.get_pixbuf(name))
+
+
+    def cb_unmap(self, widget, name):
+        if name in self.pixbufs and name not in self.release_ids \
+                and not self.is_shown(name, widget):
+            self.release_ids[name] = GLib.timeout_add_seconds(
+                    self.release_delay, self.release, name)
+
+
+    def cb_destroy(self, widget, name):
+        self.users[name] = [user for user in self.users[name]
+                            if user[0] is not widget]
+        self.cb_unmap(widget, name)
+
+
+    def is_shown(self, name, exclude=None):
+        'Return True if a widget using the image, other than exclude, is shown.'
+        return any(widget.get_mapped() for widget, set_pixbuf
+                   in self.users[name] if widget is not exclude)
+
+
+    def release(self, name):
+        'Release the pixels of an image, unless it has been shown again.'
+        self.release_ids.pop(name, None)
+        if self.is_shown(name):
+            return False
+        for widget, set_pixbuf in self.users[name]:
+            set_pixbuf(None)
+        pixbuf = self.pixbufs.pop(name, None)
+        if pixbuf is not None:
+            self.counts["releases"] += 1
+            self.counts["released_bytes"] += pixbuf.get_byte_length()
+        return False
+
+
+    def get_decoded_bytes(self):
+        'Return the bytes of the pixels of the decoded images.'
+        return sum(pixbuf.get_byte_length() for pixbuf in self.pixbufs.values())
+
+
+    def get_stats(self):
+        '''
+        Return a dictionary of the images in the pool, how many are decoded,
+        the bytes of their pixels now and at most, and the counts of decodes,
+        reuses of a decoded pixbuf, and releases, with the bytes released. The
+        pool holds the only decoded copy of its images, so the bytes released
+        are the memory saved.
+        '''
+        return {"images": len(self.images),
+                "decoded": len(self.pixbufs),
+                "decoded_bytes": self.get_decoded_bytes(),
+                "peak_bytes": self.counts["peak_bytes"],
+                "decodes": self.counts["decodes"],
+                "hits": self.counts["hits"],
+                "releases": self.counts["releases"],
+                "released_bytes": self.counts["released_bytes"]}
+
+
+    def format_stats(self):
+        'Return the statistics as readable text.'
+        return ("Pixbuf pool: {images} images, {decoded} decoded using "
+                "{decoded_bytes} bytes, at most {peak_bytes} bytes. {decodes} "
+                "decodes, {hits} reused, {releases} released freeing "
+                "{released_bytes} bytes".format(**self.get_stats()))
+
+
+def get_mime_type(image_data):
+    'Return the MIME type of binary image data, from its first bytes.'
+    for signature, mime_type in MIME_SIGNATURES:
+        if image_data.startswith(signature):
+            return mime_type
+    if image_data.startswith(b"RIFF") and image_data[8:12] == b"WEBP":
+        return "image/webp"
+    if b"<svg" in image_data or image_data.lstrip().startswith(b"<?xml"):
+        return "image/svg+xml"
+    return "application/octet-stream"
+
+
+def get_data_uri(b64_image, mime_type=None):
+    '''
+    Return a data: URI for a base64 image constant. The constant is already
+    base64, so only the line breaks are removed. The MIME type is found from
+    the first bytes of the image, if not given.
+    '''
+    b64_text = b"".join(b64_image.split())
+    if mime_type is None:
+        # Enough of the image for the signatures, and an SVG <svg element.
+        mime_type = get_mime_type(base64.b64decode(b64_text[:1024 & ~3]))
+    return "data:{};base64,{}".format(mime_type, b64_text.decode("ascii"))
+
+
+def get_css_with_images(css, images):
+    '''
+    Return the CSS with each url("embedded:NAME") replaced by the data: URI
+    of images[NAME], a base64 image constant. Raise ValueError if a NAME is
+    not in images.
+    '''
+    def replace(match):
+        name = match.group(2)
+        if name not in images:
+            raise ValueError("No embedded image named {}".format(name))
+        return 'url("{}")'.format(get_data_uri(images[name]))
+    return EMBEDDED_URL_RE.sub(replace, css)
+
+
+def load_css_provider(css, images=None, screen=None,
+                      priority=Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION):
+    '''
+    Load the CSS, with any embedded images, into a new Gtk.CssProvider and add
+    it to the screen. Return the provider.
+    '''
+    css = get_css_with_images(css, images or {})
+    css_provider = Gtk.CssProvider()
+    css_provider.load_from_data(css.encode())
+    if screen is None:
+        screen = Gdk.Screen.get_default()
+    if screen is not None:
+        Gtk.StyleContext.add_provider_for_screen(screen, css_provider, priority)
+    return css_provider
+
+
+# Example: A 1 x 1 pixel red PNG, as the background of a label.
+B64_EXAMPLE = (b"""
+iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8DwHwAFBQIAX8jx
+0gAAAABJRU5ErkJggg==
+""")
+
+EXAMPLE_CSS = """
+    #example {
+        background-image: url("embedded:B64_EXAMPLE");
+        background-size: cover;
+        color: white;
+        padding: 20px;
+    }
+"""
+
+
+if __name__=="__main__":
+    print(get_css_with_images(EXAMPLE_CSS, {"B64_EXAMPLE": B64_EXAMPLE}))
+    load_css_provider(EXAMPLE_CSS, {"B64_EXAMPLE": B64_EXAMPLE})
+    window = Gtk.Window(title="Embedded Image")
+    label = Gtk.Label(label="Background from an embedded image")
+    label.set_name("example")
+    window.add(label)
+    window.connect("destroy", Gtk.main_quit)
+    window.show_all()
+    Gtk.main()
@@ -7,12 +7,12 @@
 #
 # Ian Stewart - 10 Jul 2020
 #
-# TODO: In get_image_temp_file_path should not have to write to file.
-#   Should be able to decode the base 64 to a var (pixbuff?) and then use the
-#   image as required.
+# Notes: get_image_pixbuf used to write the decoded image to a /tmp file, on
+#   every launch. It now decodes the base 64 to a pixbuf in memory, using
+#   embedded_image.py, which must be copied along with this program.
 #
 import base64
-import tempfile
+import embedded_image
 import os
 import sys
 # GI Version checking - although specific versions are not required in all cases.
@@ -112,14 +112,10 @@ class Icon_Window(Gtk.Window):
         self.textbuffer.set_text(s)
         
 
-    def get_image_temp_file_path(self):
+    def get_image_pixbuf(self):
         '''
         Get the desired B64_IMAGE data and decode it to binary bytes.
-        Create a temp file. Returns tuple, E.g.  (13, '/tmp/icon_em0f7c2r.ico')
-        [0] An OS-level handle to an open file as would be returned by os.open() 
-        [1] The absolute pathname of that file.
-        Write out binary bites to the temp file.
-        Return the file path
+        Return the image as a Pixbuf.
         '''
         #print(len(B64_IMAGE_1)) # 4409
         # Decode the icon image stored as base 64
@@ -132,23 +128,8 @@ class Icon_Window(Gtk.Window):
         else:
             b64_image = B64_IMAGE_2
 
-        image_data = base64.decodebytes(b64_image)
-                
-        # Create a tempfile
-        temp_file_tuple = tempfile.mkstemp(suffix=".ico", 
-                                           prefix="icon_", 
-                                           dir=None, 
-                                           text=False)
-
-        #print(temp_file_tuple) # (13, '/tmp/icon_em0f7c2r.ico')
-
-        # Write to image to tempfile
-        with open(temp_file_tuple[0], "wb") as fout:
-            fout.write(image_data)
-
-        #print("Temp file exists:", os.path.isfile(temp_file_tuple[1]))
-        #print("Temp files size:", os.stat(temp_file_tuple[1]).st_size)
-        return temp_file_tuple[1]
+        # Decode to a pixbuf in memory. No temporary file is written.
+        return embedded_image.get_pixbuf_from_base64(b64_image)
 
 
     def setup_css(self):
@@ -166,8 +147,8 @@ class Icon_Window(Gtk.Window):
 
     def setup_main(self):
 
-        # Get the path icon in a temp file.    
-        self.image_path_file = self.get_image_temp_file_path()
+        # Get the icon image as a pixbuf.
+        self.image_pixbuf = self.get_image_pixbuf()
 
         self.setup_window()
         
@@ -186,7 +167,7 @@ class Icon_Window(Gtk.Window):
         self.connect("destroy", Gtk.main_quit, "WM destroy")
         self.set_position(Gtk.WindowPosition.CENTER_ALWAYS)
 
-        self.set_icon_from_file(self.image_path_file)
+        self.set_icon(self.image_pixbuf)
 
         # Instantiate main container for the window   
         self.vbox = Gtk.VBox() 
@@ -216,11 +197,7 @@ class Icon_Window(Gtk.Window):
         self.button_1.set_margin_start(MARGIN_SIZE)
         self.button_1.set_margin_end(MARGIN_SIZE) 
         
-        image = Gtk.Image.new_from_file(self.image_path_file)
-        #print("Temp file exists:", os.path.isfile(self.image_path_file))
-
-        # Finished with image temp file? Remove.
-        os.remove(self.image_path_file)
+        image = Gtk.Image.new_from_pixbuf(self.image_pixbuf)
 
         self.hbox = Gtk.HBox()       
         self.hbox.pack_start(image, expand=True, fill=True, padding=0)
@@ -510,28 +487,25 @@ and used as the GUI programs logo or favicon, etc.
 As well as the base 64 variable, the following need to be added to the GTK 
 program being developed.
 
-1.  At the start of the program add the following imports:
+1.  Copy embedded_image.py next to the program. At the start of the program
+    add the following imports:
 
-    import tempfile
+    import embedded_image
     import base64
     import os
 
 2.  For the image to be used as a favicon and display in the system tray, then
     After the Gtk.Window() class has been created add the line:
         
-    self.image_path_file = self.get_image_temp_file_path()
+    self.image_pixbuf = self.get_image_pixbuf()
 
 
 3. Add the following function:
 
-    def get_image_temp_file_path(self):
+    def get_image_pixbuf(self):
         '''
         Select the desired B64_IMAGE data and decode it to binary bytes.
-        Create a temp file. Returns tuple, E.g.  (13, '/tmp/icon_em0f7c2r.ico')
-        [0] An OS-level handle to an open file as would be returned by os.open() 
-        [1] The absolute pathname of the file.
-        Write out binary bytes to the temp file.
-        Return the file path
+        Return the image as a Pixbuf.
         '''
         
         # Select the embedded icon image stored in base64
@@ -542,29 +516,14 @@ program being developed.
         elif ICON_IMAGE == 2:
             b64_image = B64_IMAGE_2
 
-        # Decode base64 data
-        image_data = base64.decodebytes(b64_image)
-                
-        # Use tempfile to create a /tmp/ file for the image
-        temp_file_tuple = tempfile.mkstemp(suffix=".ico", 
-                                           prefix="icon_", 
-                                           dir=None, 
-                                           text=False)
-
-        # Write to image to temp_file
-        with open(temp_file_tuple[0], "wb") as fout:
-            fout.write(image_data)
-
-        # Return path and temp filename
-        return temp_file_tuple[1]    
+        # Decode to a pixbuf in memory. No temporary file is written.
+        return embedded_image.get_pixbuf_from_base64(b64_image)
 
 
 4.  If its desired to use the image as a Logo, then during the setup of the
     GUI include code like this:
 
-        image = Gtk.Image.new_from_file(self.image_path_file)
-
-        #os.remove(self.image_path_file)
+        image = Gtk.Image.new_from_pixbuf(self.image_pixbuf)
 
         vbox.pack_start(image, expand=True, fill=True, padding=0)
 
@@ -592,11 +551,11 @@ if __name__=="__main__":
 """
 Notes:
 
-The image is stored in a /tmp file and loaded with: 
+The image was stored in a /tmp file and loaded with: 
 image = Gtk.Image.new_from_file(self.image_path_file)
 
-
-Using new from file. Should be able to use pixel buffer / pixbuf?
+It is now decoded to a pixbuf in memory and loaded with:
+image = Gtk.Image.new_from_pixbuf(self.image_pixbuf)
 
 Gtk.Image.new() variations...
 new
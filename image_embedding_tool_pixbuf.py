@@ -17,6 +17,8 @@
 # /python-edvuvpn-client-master/eduvpn/util.py function: def bytes2pixbuf
 
 import base64
+import concurrent.futures
+import os
 import sys
 
 # GI Version checking - although specific versions are not required in all cases.
@@ -30,6 +32,11 @@ gi.require_version('Pango', '1.0')
 gi.require_version('GdkPixbuf', '2.0')
 from gi.repository import Gtk, Gdk, GLib, GdkPixbuf # #Gst, GObject, GLib, Pango
 
+import embed_output
+import embedded_image
+import pixbuf_formats
+import thumbnails
+
 print("Gtk Version: {}.{}.{}".format(Gtk.get_major_version(), 
             Gtk.get_micro_version(), Gtk.get_minor_version()))
 
@@ -49,8 +56,33 @@ TITLE = "Icon Embedding Tool using GdkPixuf"
 FRAME_1 = "Convert an Image to Base 64 for embedding in a Python program"
 LABEL_1 = "Click <b>Select Image</b> to locate an image to be converted to base 64"
 BUTTON_1 =  "Select Image"
+BUTTON_2A = "Copy Constant"
+BUTTON_2B = "Save as .py"
 FRAME_2A = "Information"
 FRAME_2B = "Image converted to Base 64"
+FRAME_3 = "Encode Queue"
+LABEL_3 = "Drag and drop image files or folders onto the window to queue them"
+BUTTON_3A = "Combined Output"
+BUTTON_3B = "Clear Queue"
+PAGE_1 = "Base 64"
+PAGE_2 = "Gallery"
+BUTTON_4 = "Add Asset Module"
+
+# Number of worker threads reading and encoding the files in the queue. The
+# threads keep the GUI responsive. They share the GIL, so they do not encode in
+# parallel.
+QUEUE_WORKERS = 4
+
+# Largest image, in bytes, whose constant is shown in the text view. Larger
+# constants are only copied to the clipboard or saved to a file.
+OUTPUT_TEXT_LIMIT = 256 * 1024
+
+# Size in pixels of the file chooser preview, and the number of previews cached.
+PREVIEW_SIZE = 200
+PREVIEW_CACHE_ENTRIES = 100
+
+# Columns of the queue list store
+(COL_JOB, COL_FILE, COL_STATUS, COL_SIZE, COL_B64_SIZE, COL_TIME) = range(6)
 
 # Set the initial window size in pixels. Note: Mouse can stretch window bigger.
 WINDOW_WIDTH = 800
@@ -66,6 +98,15 @@ CSS = """
         font-weight: 700;
         font-size: 15px;        
     }  
+    /* Logo beside the drag and drop hint, from the embedded B64_IMAGE */
+    #label_3 {
+        background-image: url("embedded:B64_IMAGE");
+        background-repeat: no-repeat;
+        background-position: left center;
+        background-size: 24px 24px;
+        padding-left: 32px;
+        min-height: 24px;
+    }
 """
 
 class Main_Window(Gtk.Window):
@@ -76,12 +117,36 @@ class Main_Window(Gtk.Window):
         # Get one of the images as embedded b64 data and return it as a Pixbuf.
         self.image = self.get_image_from_base64(image_ident) #IMAGE_ID)        
 
+        # Encode queue. Files are encoded by a pool of worker threads.
+        self.executor = None
+        self.next_job_id = 0
+        self.queue_iters = {}
+        self.queue_futures = {}
+        self.queue_results = {}
+
+        # The (image file, constant name) of the current output, used by the
+        # Copy Constant and Save as .py buttons.
+        self.output_sources = []
+
+        # File chooser preview. Previews are decoded by one worker thread and
+        # cached by (path, mtime). The generation increases for every request,
+        # so the result of an out of date request is never shown.
+        self.preview_executor = None
+        self.preview_future = None
+        self.preview_generation = 0
+        self.preview_cache = thumbnails.LRU_Cache(PREVIEW_CACHE_ENTRIES)
+
         self.setup_css()    
         self.setup_main()
         
 
     def convert_image_to_base64(self,filename):
         'Convert the icon image to Base64 text for embedding into python program.'
+        self.output_sources = [(filename, "B64_IMAGE")]
+        if os.path.getsize(filename) > OUTPUT_TEXT_LIMIT:
+            # Too large to show. Copy Constant or Save as .py encode it.
+            self.textbuffer.set_text(get_output_summary(self.output_sources))
+            return
         with open(filename, "rb") as fid:
             data = fid.read()
         data_b64 = base64.encodebytes(data)
@@ -95,24 +160,26 @@ class Main_Window(Gtk.Window):
         self.textbuffer.set_text(s)
 
 
+    def get_b64_image(self, image_id=0):
+        'Select the desired embedded image stored as a base64 string'
+        if image_id == 0:
+            return B64_IMAGE
+        elif image_id == 1:
+            return B64_IMAGE_1
+        elif image_id == 2:
+            return B64_IMAGE_2
+        else:
+            return B64_IMAGE
+
+
     def get_image_from_base64(self, image_id=0):
         '''
         Select the desired B64_IMAGE data and decode it to binary bytes.
         Load the bytes using GdkPixbuf.PixbufLoader
         Return the Pixbuf image.
         '''
-        # Select the desired embedded image stored as a base64 string
-        if image_id == 0:
-            b64_image = B64_IMAGE
-        elif image_id == 1:
-            b64_image = B64_IMAGE_1
-        elif image_id == 2:
-            b64_image = B64_IMAGE_2
-        else:
-            b64_image = B64_IMAGE    
-        
         # Decode base64 data
-        image_data = base64.decodebytes(b64_image)
+        image_data = base64.decodebytes(self.get_b64_image(image_id))
         
         # Use PixbufLoader to load the image_data to Pixbuf data.
         loader = GdkPixbuf.PixbufLoader()        
@@ -124,21 +191,17 @@ class Main_Window(Gtk.Window):
 
     def setup_css(self):
         # Apply css for font and colour changes, etc.
-        css_provider = Gtk.CssProvider()
-        # If css start with b for bytes: css = b'* { background-color: #f00; }'
-        #css_provider.load_from_data(css)
-        css_provider.load_from_data(bytes(CSS.encode()))
-        context = Gtk.StyleContext()
-        screen = Gdk.Screen.get_default()
-        context.add_provider_for_screen(screen, 
-                                        css_provider,
-                                        Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+        # Images in the css, url("embedded:NAME"), are made into data: URIs
+        # from the B64_ constants, so no image files are read.
+        embedded_image.load_css_provider(CSS, {"B64_IMAGE": B64_IMAGE})
 
 
     def setup_main(self):
         # Main setups
         self.setup_window()
         self.setup_vbox_top()
+        self.setup_vbox_queue()
+        self.setup_drag_and_drop()
         self.add(self.vbox)
         self.textbuffer.set_text(NOTES)    
 
@@ -180,13 +243,31 @@ class Main_Window(Gtk.Window):
         self.button_1.connect("clicked", self.cb_button_1)
         self.button_1.set_margin_start(MARGIN_SIZE)
         self.button_1.set_margin_end(MARGIN_SIZE) 
+
+        # Output the constant without passing it through the text view
+        self.button_2a = Gtk.Button(label = BUTTON_2A)
+        self.button_2a.connect("clicked", self.cb_button_2a)
+        self.button_2b = Gtk.Button(label = BUTTON_2B)
+        self.button_2b.connect("clicked", self.cb_button_2b)
+        self.button_2a.set_sensitive(False)
+        self.button_2b.set_sensitive(False)
+
+        button_box = Gtk.VBox()
+        button_box.set_margin_top(MARGIN_SIZE)
+        button_box.set_margin_bottom(MARGIN_SIZE)
+        button_box.pack_start(self.button_1, expand=True, fill=True, padding=0)
+        button_box.pack_start(self.button_2a, expand=True, fill=True, padding=0)
+        button_box.pack_start(self.button_2b, expand=True, fill=True, padding=0)
         
-        image = Gtk.Image.new_from_pixbuf(self.image)        
+        # Drawn from a cached surface, decoded at the display's scale factor
+        image = embedded_image.Scaled_Image(
+                self.get_b64_image(image_ident),
+                max(self.image.get_width(), self.image.get_height()))
 
         self.hbox = Gtk.HBox() 
         self.hbox.pack_start(image, expand=True, fill=True, padding=0)
         self.hbox.pack_start(self.label_1, expand=True, fill=True, padding=0)
-        self.hbox.pack_start(self.button_1, expand=True, fill=True, padding=0)
+        self.hbox.pack_start(button_box, expand=True, fill=True, padding=0)
         self.frame_1.add(self.hbox)
     
         self.vbox.pack_start(self.frame_1, expand=False, fill=True, padding=0)
@@ -208,12 +289,429 @@ class Main_Window(Gtk.Window):
         self.textbuffer = self.textview.get_buffer()
         self.textbuffer.set_text("")
         scrolledwindow.add(self.textview)
-        
-        self.frame_2.add(scrolledwindow)
+
+        # Gallery of the images encoded in this session, or in asset modules.
+        self.gallery = thumbnails.Thumbnail_Gallery()
+        self.gallery.set_margin_start(MARGIN_SIZE)
+        self.gallery.set_margin_end(MARGIN_SIZE)
+
+        self.button_4 = Gtk.Button(label = BUTTON_4)
+        self.button_4.connect("clicked", self.cb_button_4)
+        self.button_4.set_halign(Gtk.Align.END)
+        self.button_4.set_margin_end(MARGIN_SIZE)
+        self.button_4.set_margin_bottom(MARGIN_SIZE)
+
+        vbox = Gtk.VBox(spacing=MARGIN_SIZE)
+        vbox.pack_start(self.gallery, expand=True, fill=True, padding=0)
+        vbox.pack_start(self.button_4, expand=False, fill=False, padding=0)
+
+        self.notebook = Gtk.Notebook()
+        self.notebook.append_page(scrolledwindow, Gtk.Label(label = PAGE_1))
+        self.notebook.append_page(vbox, Gtk.Label(label = PAGE_2))
+
+        self.frame_2.add(self.notebook)
 
         self.vbox.pack_start(self.frame_2, expand=True, fill=True, padding=0)
 
 
+    def setup_vbox_queue(self):
+        'Frame 3: List of the files dropped onto the window, and their status'
+        self.frame_3 = Gtk.Frame(label = FRAME_3)
+        self.frame_3.set_name("frame_3")
+        self.frame_3.set_label_align(0.1, 0.9)
+        self.frame_3.set_margin_top(MARGIN_SIZE)
+
+        self.label_3 = Gtk.Label(label = LABEL_3)
+        self.label_3.set_name("label_3")
+        self.label_3.set_margin_start(MARGIN_SIZE)
+        self.label_3.set_xalign(0)
+
+        self.button_3a = Gtk.Button(label = BUTTON_3A)
+        self.button_3a.connect("clicked", self.cb_button_3a)
+        self.button_3b = Gtk.Button(label = BUTTON_3B)
+        self.button_3b.connect("clicked", self.cb_button_3b)
+
+        hbox = Gtk.HBox(spacing=MARGIN_SIZE)
+        hbox.set_margin_end(MARGIN_SIZE)
+        hbox.pack_start(self.label_3, expand=True, fill=True, padding=0)
+        hbox.pack_start(self.button_3a, expand=False, fill=False, padding=0)
+        hbox.pack_start(self.button_3b, expand=False, fill=False, padding=0)
+
+        # Job id, File, Status, Size, Base 64 size, Time
+        self.queue_store = Gtk.ListStore(int, str, str, str, str, str)
+        self.queue_view = Gtk.TreeView(model=self.queue_store)
+        for column_id, title in ((COL_FILE, "File"), (COL_STATUS, "Status"),
+                                 (COL_SIZE, "Size"), (COL_B64_SIZE, "Base 64"),
+                                 (COL_TIME, "Time")):
+            renderer = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(title, renderer, text=column_id)
+            column.set_resizable(True)
+            column.set_expand(column_id == COL_FILE)
+            self.queue_view.append_column(column)
+
+        scrolledwindow = Gtk.ScrolledWindow()
+        scrolledwindow.set_min_content_height(150)
+        scrolledwindow.set_margin_start(MARGIN_SIZE)
+        scrolledwindow.set_margin_end(MARGIN_SIZE)
+        scrolledwindow.set_margin_bottom(MARGIN_SIZE)
+        scrolledwindow.add(self.queue_view)
+
+        vbox = Gtk.VBox(spacing=MARGIN_SIZE)
+        vbox.pack_start(hbox, expand=False, fill=True, padding=0)
+        vbox.pack_start(scrolledwindow, expand=True, fill=True, padding=0)
+        self.frame_3.add(vbox)
+
+        self.vbox.pack_start(self.frame_3, expand=False, fill=True, padding=0)
+
+
+    def setup_drag_and_drop(self):
+        'Accept files and folders dropped onto the window from a file manager'
+        self.drag_dest_set(Gtk.DestDefaults.ALL, [], Gdk.DragAction.COPY)
+        self.drag_dest_add_uri_targets()
+        self.connect("drag-data-received", self.cb_drag_data_received)
+        self.connect("destroy", self.cb_shutdown_queue)
+
+
+    def cb_drag_data_received(self, widget, context, x, y, data, info, time):
+        'Add the dropped files to the encode queue'
+        paths = []
+        for uri in data.get_uris():
+            try:
+                paths.append(GLib.filename_from_uri(uri)[0])
+            except GLib.Error:
+                # Not a local file
+                pass
+        self.queue_files(paths)
+
+
+    def queue_files(self, paths):
+        '''
+        Add files to the encode queue. Folders are searched by a worker thread,
+        and their files are only added if GdkPixbuf supports their extension.
+        '''
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=QUEUE_WORKERS)
+        future = self.executor.submit(list, get_queue_paths(paths))
+        future.add_done_callback(
+                lambda future: GLib.idle_add(self.cb_queue_paths, future))
+
+
+    def cb_queue_paths(self, future):
+        '''
+        Called in the main loop with the files found by queue_files(). The
+        files are encoded by worker threads so the GUI is never blocked. The
+        threads share the GIL, so they do not encode in parallel, but the
+        encoding is done in blocks which let the main loop run in between.
+        '''
+        try:
+            file_paths = future.result()
+        except OSError as e:
+            self.label_3.set_text("Unable to queue the files: {}".format(e))
+            return False
+        for file_path in file_paths:
+            job_id = self.next_job_id
+            self.next_job_id += 1
+            self.queue_iters[job_id] = self.queue_store.append(
+                    [job_id, os.path.basename(file_path), "Queued", "", "", ""])
+            future = self.executor.submit(self.encode_job, job_id, file_path)
+            future.add_done_callback(
+                    lambda future, job_id=job_id:
+                        GLib.idle_add(self.cb_encode_done, job_id, future))
+            self.queue_futures[job_id] = future
+        self.update_queue_label()
+        return False
+
+
+    def encode_job(self, job_id, file_path):
+        'Worker thread: Encode one file. Only GLib.idle_add touches the GUI.'
+        GLib.idle_add(self.cb_encode_started, job_id)
+        return embed_output.encode_file(file_path)
+
+
+    def cb_encode_started(self, job_id):
+        if job_id in self.queue_iters:
+            self.queue_store[self.queue_iters[job_id]][COL_STATUS] = "Encoding"
+        return False
+
+
+    def cb_encode_done(self, job_id, future):
+        'Called in the main loop when a worker has finished a file'
+        self.queue_futures.pop(job_id, None)
+        if job_id not in self.queue_iters or future.cancelled():
+            # The queue has been cleared
+            return False
+        row = self.queue_store[self.queue_iters[job_id]]
+        try:
+            result = future.result()
+        except (OSError, ValueError) as e:
+            row[COL_STATUS] = "Error: {}".format(e)
+        else:
+            self.queue_results[job_id] = result
+            self.gallery.add_file(result["path"])
+            row[COL_STATUS] = "Done"
+            row[COL_SIZE] = format_size(result["size"])
+            row[COL_B64_SIZE] = format_size(len(result["text"]))
+            row[COL_TIME] = "{:.1f} ms".format(result["seconds"] * 1000)
+        self.update_queue_label()
+        return False
+
+
+    def update_queue_label(self):
+        'Show the progress of the queue'
+        total = len(self.queue_iters)
+        if total == 0:
+            self.label_3.set_text(LABEL_3)
+            return
+        done = len(self.queue_results)
+        size = sum(result["size"] for result in self.queue_results.values())
+        self.label_3.set_text("{} of {} files encoded. {} in total".format(
+                done, total, format_size(size)))
+
+
+    def set_output_sources(self, sources):
+        'Set the images output by the Copy Constant and Save as .py buttons'
+        self.output_sources = sources
+        self.button_2a.set_sensitive(bool(sources))
+        self.button_2b.set_sensitive(bool(sources))
+
+
+    def cb_button_2a(self, widget):
+        'Copy the constants to the clipboard, without the text view'
+        texts = []
+        for file_path, name in self.output_sources:
+            with open(file_path, "rb") as fid:
+                texts.append(embed_output.format_constant(fid.read(), name))
+        clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+        clipboard.set_text("\n\n".join(texts), -1)
+        self.label_1.set_text("Copied {} to the clipboard".format(
+                ", ".join(name for file_path, name in self.output_sources)))
+
+
+    def cb_button_2b(self, widget):
+        '''
+        Save the constants to a python file. The file is written by a worker
+        thread, a block at a time, and renamed into place when complete.
+        '''
+        dialog = Gtk.FileChooserDialog(
+            title = "Save the constants as a python file",
+            parent = self,
+            action = Gtk.FileChooserAction.SAVE)
+        dialog.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                           Gtk.STOCK_SAVE, Gtk.ResponseType.OK)
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_name("image_constants.py")
+        response = dialog.run()
+        output_path = dialog.get_filename()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK:
+            return
+
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=QUEUE_WORKERS)
+        self.label_1.set_text("Saving {}...".format(output_path))
+        future = self.executor.submit(embed_output.write_constants,
+                                      output_path, list(self.output_sources))
+        future.add_done_callback(
+                lambda future:
+                    GLib.idle_add(self.cb_save_done, output_path, future))
+
+
+    def cb_save_done(self, output_path, future):
+        'Called in the main loop when the python file has been saved'
+        try:
+            written = future.result()
+        except (OSError, ValueError) as e:
+            self.label_1.set_text("Unable to save {}: {}".format(output_path, e))
+        else:
+            self.label_1.set_text("Saved {} ({})".format(output_path,
+                                  format_size(written)))
+        return False
+
+
+    def cb_button_3a(self, widget):
+        'Show the constants of all the encoded files in the queue'
+        job_ids = sorted(self.queue_results)
+        if not job_ids:
+            return
+        results = [self.queue_results[job_id] for job_id in job_ids]
+        names = get_unique_names([result["name"] for result in results])
+        self.set_output_sources([(result["path"], name)
+                                 for result, name in zip(results, names)])
+        if sum(result["size"] for result in results) > OUTPUT_TEXT_LIMIT:
+            self.textbuffer.set_text(get_output_summary(self.output_sources))
+        else:
+            # The constant text starts with its name
+            self.textbuffer.set_text("\n\n".join(
+                    name + result["text"][len(result["name"]):]
+                    for result, name in zip(results, names)))
+        self.frame_2.set_label(FRAME_2B)
+
+
+    def cb_button_3b(self, widget):
+        'Clear the queue. Files not yet started are cancelled.'
+        for future in self.queue_futures.values():
+            future.cancel()
+        self.queue_futures.clear()
+        self.queue_iters.clear()
+        self.queue_results.clear()
+        self.queue_store.clear()
+        self.update_queue_label()
+
+
+    def cb_shutdown_queue(self, widget):
+        # shutdown(cancel_futures=True) needs Python 3.9, so the jobs not yet
+        # started are cancelled here. A save already submitted is completed.
+        for future in self.queue_futures.values():
+            future.cancel()
+        self.queue_futures.clear()
+        if self.preview_future is not None:
+            self.preview_future.cancel()
+            self.preview_future = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        if self.preview_executor is not None:
+            self.preview_executor.shutdown(wait=False)
+
+
+    def setup_preview(self, dialog):
+        'Show a preview of the selected image in the file chooser dialog'
+        self.preview_image = Gtk.Image()
+        self.preview_label = Gtk.Label()
+        self.preview_label.set_line_wrap(True)
+        self.preview_label.set_max_width_chars(24)
+
+        vbox = Gtk.VBox(spacing=MARGIN_SIZE)
+        vbox.set_size_request(PREVIEW_SIZE + 2 * MARGIN_SIZE, -1)
+        vbox.pack_start(self.preview_image, expand=False, fill=False, padding=0)
+        vbox.pack_start(self.preview_label, expand=False, fill=False, padding=0)
+        vbox.show_all()
+
+        dialog.set_preview_widget(vbox)
+        dialog.set_use_preview_label(False)
+        dialog.connect("update-preview", self.cb_update_preview)
+
+
+    def cb_update_preview(self, dialog):
+        '''
+        Called as the selection in the file chooser changes. A cached preview
+        is shown at once, otherwise it is decoded by a worker thread. Only the
+        latest selection is decoded, so arrowing through a folder of large
+        photos does not build up a backlog.
+        '''
+        self.preview_generation += 1
+        if self.preview_future is not None:
+            self.preview_future.cancel()
+            self.preview_future = None
+
+        file_path = dialog.get_preview_filename()
+        try:
+            key = (file_path, os.stat(file_path).st_mtime_ns)
+        except (TypeError, OSError):
+            dialog.set_preview_widget_active(False)
+            return
+        if os.path.isdir(file_path):
+            dialog.set_preview_widget_active(False)
+            return
+
+        dialog.set_preview_widget_active(True)
+        preview = self.preview_cache.get(key)
+        if preview is not None:
+            self.show_preview(*preview)
+            return
+
+        self.preview_image.clear()
+        self.preview_label.set_text("Loading...")
+        if self.preview_executor is None:
+            self.preview_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=1)
+        generation = self.preview_generation
+        self.preview_future = self.preview_executor.submit(
+                self.preview_job, generation, file_path)
+        self.preview_future.add_done_callback(
+                lambda future:
+                    GLib.idle_add(self.cb_preview_done, generation, key, future))
+
+
+    def preview_job(self, generation, file_path):
+        '''
+        Worker thread: Estimate the output from the image header, then decode
+        at the preview size. Return (pixbuf or None, text).
+        '''
+        if generation != self.preview_generation:
+            # Already out of date
+            return None
+        estimate = embed_output.estimate_output(file_path)
+        size = format_size(estimate["size"])
+        if estimate["format"] is None:
+            return None, "Not a supported image\n{}".format(size)
+        if estimate["pixbuf_bytes"] is None:
+            # E.g. an SVG sized in percent
+            text = "{}\n{}\n{} lines of base 64".format(
+                    estimate["format"].upper(), size, estimate["lines"])
+        else:
+            text = "{} {} x {}\n{}\n{} lines of base 64\n{} decoded".format(
+                    estimate["format"].upper(), estimate["width"],
+                    estimate["height"], size, estimate["lines"],
+                    format_size(estimate["pixbuf_bytes"]))
+        if generation != self.preview_generation:
+            return None
+        try:
+            pixbuf = thumbnails.load_file_thumbnail(file_path, PREVIEW_SIZE)
+        except (OSError, GLib.Error):
+            return None, text
+        return pixbuf, text
+
+
+    def cb_preview_done(self, generation, key, future):
+        'Called in the main loop when a preview has been decoded'
+        if future.cancelled():
+            return False
+        try:
+            preview = future.result()
+        except (OSError, ValueError, GLib.Error) as e:
+            preview = (None, str(e))
+        if preview is None:
+            return False
+        self.preview_cache.put(key, preview)
+        if generation == self.preview_generation:
+            self.show_preview(*preview)
+        return False
+
+
+    def show_preview(self, pixbuf, text):
+        if pixbuf is None:
+            self.preview_image.clear()
+        else:
+            self.preview_image.set_from_pixbuf(pixbuf)
+        self.preview_label.set_text(text)
+
+
+    def cb_button_4(self, widget):
+        'Add the B64_ images of a python program, E.g. a generated asset module'
+        dialog = Gtk.FileChooserDialog(
+            title = "Please choose a python asset module",
+            parent = self,
+            action = Gtk.FileChooserAction.OPEN)
+        dialog.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                           Gtk.STOCK_OPEN, Gtk.ResponseType.OK)
+        file_filter = Gtk.FileFilter()
+        file_filter.set_name("Python programs")
+        file_filter.add_pattern("*.py")
+        dialog.add_filter(file_filter)
+
+        if dialog.run() == Gtk.ResponseType.OK:
+            file_path = dialog.get_filename()
+            try:
+                self.gallery.add_module(file_path)
+            except (OSError, SyntaxError, ValueError) as e:
+                self.textbuffer.set_text("Unable to read {}\n{}".format(
+                        file_path, e))
+                self.notebook.set_current_page(0)
+        dialog.destroy()
+
+
     def cb_button_1(self, widget):
         'Select Image file button'
         self.frame_2.set_label(FRAME_2A)
@@ -231,17 +729,106 @@ class Main_Window(Gtk.Window):
                            Gtk.STOCK_OPEN, Gtk.ResponseType.OK)
         
         dialog.set_default_size(800,800)  # No effect?
+        self.setup_preview(dialog)
         response = dialog.run()
+        self.preview_generation += 1
+
+        file_path = dialog.get_filename()
+        dialog.destroy()
 
         if response == Gtk.ResponseType.OK:
-            file_path = dialog.get_filename()
+            estimate = embed_output.estimate_output(file_path)
+            if estimate["constant_bytes"] > embed_output.LARGE_OUTPUT:
+                # Too large to paste into a program. Offer to save it instead.
+                self.set_output_sources([(file_path, "B64_IMAGE")])
+                if self.confirm_large_output(estimate):
+                    self.cb_button_2b(None)
+                return
             self.convert_image_to_base64(file_path)
+            self.set_output_sources(self.output_sources)
+            self.gallery.add_file(file_path)
             self.frame_2.set_label(FRAME_2B)
         elif response == Gtk.ResponseType.CANCEL:
             #print("Cancel clicked")
             pass
-            
-        dialog.destroy()  
+
+
+    def confirm_large_output(self, estimate):
+        'Ask whether to save a very large constant to a file. Return True if yes.'
+        dialog = Gtk.MessageDialog(
+            parent = self,
+            modal = True,
+            message_type = Gtk.MessageType.QUESTION,
+            buttons = Gtk.ButtonsType.YES_NO,
+            text = "The constant for this image is very large")
+        dialog.format_secondary_text(
+            "{}\n\nIt will be {} in {} lines. Save it as a python file?".format(
+            embed_output.format_estimate(estimate),
+            format_size(estimate["constant_bytes"]), estimate["lines"]))
+        response = dialog.run()
+        dialog.destroy()
+        return response == Gtk.ResponseType.YES
+
+def format_size(size):
+    'Return a size in bytes as readable text, E.g. 12.3 KB'
+    for unit in ("bytes", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            break
+        size /= 1024
+    if unit == "bytes":
+        return "{} {}".format(size, unit)
+    return "{:.1f} {}".format(size, unit)
+
+
+def get_output_summary(sources):
+    'Return a short summary of the constants for a list of (file path, name)'
+    lines = ["The output is too large to show here. Use {} or {}.".format(
+             BUTTON_2A, BUTTON_2B), ""]
+    for file_path, name in sources:
+        estimate = embed_output.estimate_output(file_path, name)
+        lines.append("{}\n    {} image, {} constant".format(
+                     embed_output.format_estimate(estimate),
+                     format_size(estimate["size"]),
+                     format_size(estimate["constant_bytes"])))
+    return "\n".join(lines)
+
+
+def get_unique_names(names):
+    '''
+    Return the constant names with a numeric suffix added to repeated names,
+    E.g. B64_LOGO, B64_LOGO_2, so files with the same name in different
+    folders do not define the same constant.
+    '''
+    used = set(names)
+    seen = set()
+    unique = []
+    for name in names:
+        new_name = name
+        number = 1
+        while new_name in seen or (new_name != name and new_name in used):
+            number += 1
+            new_name = "{}_{}".format(name, number)
+        seen.add(new_name)
+        unique.append(new_name)
+    return unique
+
+
+def get_queue_paths(paths):
+    '''
+    Yield the files to queue. Folders are searched, and only the files with
+    an extension supported by GdkPixbuf are included.
+    '''
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                extension = os.path.splitext(name)[1]
+                if extension and pixbuf_formats.is_format_supported(extension):
+                    yield os.path.join(root, name)
+
 
 # Logo 
 # An alpha symbol
@@ -33,6 +33,8 @@ gi.require_version('Pango', '1.0')
 gi.require_version('GdkPixbuf', '2.0')
 from gi.repository import Gtk, Gdk, GLib, GdkPixbuf # #Gst, GObject, GLib, Pango
 
+import embedded_image
+
 print("Gtk Version: {}.{}.{}".format(Gtk.get_major_version(), 
             Gtk.get_micro_version(), Gtk.get_minor_version()))
 
@@ -46,6 +48,9 @@ if sys.version_info < PYTHON_VERSION_MIN:
 # Select which image to use. 0,1,2,...:
 IMAGE_ID = 0
 
+# Name of the themed icon registered for the image
+ICON_NAME = "image-embedding-tool-logo"
+
 # Labelling...
 VERSION = "2021-05-14"
 TITLE = "Image Embedding Tool using GdkPixuf with Headerbar loaded by Builder"
@@ -74,8 +79,17 @@ class Main_Window(Gtk.Window):
     def __init__(self):
         super(Main_Window, self).__init__()
         
-        # Get one of the images as embedded b64 data and return it as a Pixbuf.
-        self.image = self.get_image_from_base64(image_ident) #IMAGE_ID)        
+        # Register one of the images as a themed icon. The favicon and the
+        # images in the HeaderBar and the frame use it by name, and share GTK's
+        # icon cache. GTK keeps the built-in icon for the life of the program.
+        self.icon_size = embedded_image.add_theme_icon(
+                ICON_NAME, self.get_b64_image(image_ident))
+
+        # The About dialog logo comes from a pool, which decodes its own copy
+        # only when the dialog is shown, and releases it after the dialog has
+        # been hidden. The bytes saved are printed on exit.
+        self.pixbuf_pool = embedded_image.Pixbuf_Pool()
+        self.pixbuf_pool.add_image(ICON_NAME, self.get_b64_image(image_ident))
 
         self.setup_css()    
         self.setup_main()
@@ -96,31 +110,16 @@ class Main_Window(Gtk.Window):
         self.textbuffer.set_text(s)
 
 
-    def get_image_from_base64(self, image_id=0):
-        '''
-        Select the desired B64_IMAGE data and decode it to binary bytes.
-        Load the bytes using GdkPixbuf.PixbufLoader
-        Return the Pixbuf image.
-        '''
-        # Select the desired embedded image stored as a base64 string
+    def get_b64_image(self, image_id=0):
+        'Select the desired embedded image stored as a base64 string'
         if image_id == 0:
-            b64_image = B64_IMAGE
+            return B64_IMAGE
         elif image_id == 1:
-            b64_image = B64_IMAGE_1
+            return B64_IMAGE_1
         elif image_id == 2:
-            b64_image = B64_IMAGE_2
+            return B64_IMAGE_2
         else:
-            b64_image = B64_IMAGE    
-        
-        # Decode base64 data
-        image_data = base64.decodebytes(b64_image)
-        
-        # Use PixbufLoader to load the image_data to Pixbuf data.
-        loader = GdkPixbuf.PixbufLoader()        
-        loader.write(image_data)
-        loader.close()
-        pixbuf = loader.get_pixbuf()                 
-        return pixbuf       
+            return B64_IMAGE
 
 
     def setup_css(self):
@@ -159,12 +158,13 @@ class Main_Window(Gtk.Window):
 
         # Place the image into the Header Bar
         image = builder.get_object("image_1")
-        image.set_from_pixbuf(self.image)
+        image.set_from_icon_name(ICON_NAME, Gtk.IconSize.DND)
+        image.set_pixel_size(self.icon_size)
 
         #Instantiate about dialog, which is hidden by default
         self.about = builder.get_object("about_dialog")
-        # Add the logo image to the About dialog
-        self.about.set_logo(self.image)
+        # Add the logo image to the About dialog, whenever it is shown
+        self.pixbuf_pool.attach(self.about, ICON_NAME, self.about.set_logo)
         
     def setup_window(self):
         # Setup window
@@ -175,7 +175,7 @@ class Main_Window(Gtk.Window):
         self.connect("destroy", Gtk.main_quit, "WM destroy")
         self.set_position(Gtk.WindowPosition.CENTER_ALWAYS)
 
-        self.set_icon(self.image)
+        self.set_icon_name(ICON_NAME)
         
         # Instantiate main container for the window   
         self.vbox = Gtk.VBox() 
@@ -205,7 +205,8 @@ class Main_Window(Gtk.Window):
         self.button_1.set_margin_start(MARGIN_SIZE)
         self.button_1.set_margin_end(MARGIN_SIZE) 
         
-        image = Gtk.Image.new_from_pixbuf(self.image)        
+        image = Gtk.Image.new_from_icon_name(ICON_NAME, Gtk.IconSize.DND)
+        image.set_pixel_size(self.icon_size)
 
         self.hbox = Gtk.HBox() 
         self.hbox.pack_start(image, expand=True, fill=True, padding=0)
@@ -655,15 +656,15 @@ $ python image_embedding_tool_pixbuf_headerbar.py 2
 
 # The HeaderBar is added using this XML data. It contains a Gtk.Image with an
 # id of "image_1". Initially There is no image until the following code provides
-# the image:
+# the image, as the themed icon registered with embedded_image.add_theme_icon():
 #   image = builder.get_object("image_1")
-#   image.set_from_pixbuf(self.image)
+#   image.set_from_icon_name(ICON_NAME, Gtk.IconSize.DND)
 #
 # The about_dialog's logo is commented out:
 #     <!--property name="logo"></property-->
-# The logo is added later with:
+# The logo is added later, from a pool which only holds it while it is shown:
 #   self.about = builder.get_object("about_dialog")
-#   self.about.set_logo(self.image)
+#   self.pixbuf_pool.attach(self.about, ICON_NAME, self.about.set_logo)
 ui_info = """
 <?xml version="1.0" encoding="UTF-8"?>
 <interface>
@@ -764,6 +765,7 @@ if __name__=="__main__":
     win = Main_Window()
     win.connect("destroy", Gtk.main_quit)
     win.show_all()
-    Gtk.main()    
+    Gtk.main()
+    print(win.pixbuf_pool.format_stats())    
 
 
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+#
+# import_cost.py
+#
+# Objectives: Measure the cost of importing a python program with large
+# embedded base64 image constants, against the size of the embedded payload.
+#
+# For each payload size a module is generated with a B64_IMAGE constant, as
+# produced by the GUI programs, and measured for:
+#   compile     Time for python to compile the source. This happens on every
+#               import when there is no .pyc file, E.g. a first run, or a
+#               read-only install.
+#   no_pyc      Time to import the module in a new interpreter, without a .pyc
+#   pyc         Time to import the module in a new interpreter, from its .pyc
+#   pyc_bytes   Size of the .pyc file.
+#
+# The same image is also generated in the sidecar mode of embed_output.py,
+# where the image is a data file read through importlib.resources only when
+# first used. Its import time and the time of the first read are measured.
+#
+# $ python import_cost.py
+# $ python import_cost.py --sizes 1000 1000000 --json
+
+import argparse
+import importlib.util
+import json
+import os
+import py_compile
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import embed_output
+
+SIZES = (1000, 16000, 256000, 1000000, 4000000, 16000000)
+REPEATS = 5
+
+# Run in a new interpreter to time the import of a module, and optionally the
+# first read of its sidecar data file.
+CHILD_CODE = '''
+import sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+module = __import__(sys.argv[2])
+imported = time.perf_counter()
+if len(sys.argv) > 3:
+    module.load_image_data(sys.argv[3])
+print(imported - start, time.perf_counter() - imported)
+'''
+
+
+def time_child(directory, module_name, no_pyc, file_name=None):
+    'Return the median (import, first read) seconds of a new interpreter.'
+    command = [sys.executable]
+    if no_pyc:
+        command.append("-B")
+    command += ["-c", CHILD_CODE, directory, module_name]
+    if file_name:
+        command.append(file_name)
+    imports = []
+    reads = []
+    for repeat in range(REPEATS):
+        output = subprocess.run(command, check=True, capture_output=True,
+                                text=True).stdout.split()
+        imports.append(float(output[0]))
+        reads.append(float(output[1]))
+    return statistics.median(imports), statistics.median(reads)
+
+
+def remove_pyc(path):
+    'Remove the cached .pyc file of a module source file, if any.'
+    pyc = importlib.util.cache_from_source(path)
+    if os.path.exists(pyc):
+        os.remove(pyc)
+
+
+def measure_constant(directory, size):
+    'Return the measurements of a module with a base64 constant of size bytes.'
+    module_name = "embed_constant_{}".format(size)
+    path = os.path.join(directory, module_name + ".py")
+    source = embed_output.format_constant(os.urandom(size)) + "\n"
+    with open(path, "w") as fout:
+        fout.write(source)
+
+    compile_times = []
+    for repeat in range(REPEATS):
+        start = time.perf_counter()
+        compile(source, path, "exec")
+        compile_times.append(time.perf_counter() - start)
+
+    remove_pyc(path)
+    no_pyc = time_child(directory, module_name, True)[0]
+    pyc_path = py_compile.compile(path, doraise=True)
+    pyc = time_child(directory, module_name, False)[0]
+    return {
+        "mode": "constant",
+        "payload_bytes": size,
+        "source_bytes": len(source),
+        "compile_seconds": statistics.median(compile_times),
+        "import_no_pyc_seconds": no_pyc,
+        "import_pyc_seconds": pyc,
+        "pyc_bytes": os.path.getsize(pyc_path),
+    }
+
+
+def measure_sidecar(directory, size):
+    'Return the measurements of a module reading a sidecar data file.'
+    module_name = "embed_sidecar_{}".format(size)
+    path = os.path.join(directory, module_name + ".py")
+    image_path = os.path.join(directory, "image_{}.bin".format(size))
+    with open(image_path, "wb") as fout:
+        fout.write(os.urandom(size))
+    source = embed_output.write_sidecar(image_path, "B64_IMAGE_{}".format(size),
+                                        directory)
+    with open(path, "w") as fout:
+        fout.write(source)
+    file_name = embed_output.get_sidecar_name("B64_IMAGE_{}".format(size),
+                                              image_path)
+
+    remove_pyc(path)
+    no_pyc, first_read = time_child(directory, module_name, True, file_name)
+    pyc_path = py_compile.compile(path, doraise=True)
+    pyc = time_child(directory, module_name, False)[0]
+    return {
+        "mode": "sidecar",
+        "payload_bytes": size,
+        "source_bytes": len(source),
+        "import_no_pyc_seconds": no_pyc,
+        "import_pyc_seconds": pyc,
+        "first_read_seconds": first_read,
+        "pyc_bytes": os.path.getsize(pyc_path),
+    }
+
+
+def print_results(results):
+    'Print the results as a table.'
+    print("{:<9} {:>10} {:>11} {:>11} {:>11} {:>11}".format(
+          "Mode", "Payload", "Compile ms", "No pyc ms", "Pyc ms", "Pyc bytes"))
+    for result in results:
+        compile_ms = result.get("compile_seconds")
+        print("{:<9} {:>10} {:>11} {:>11.2f} {:>11.2f} {:>11}".format(
+              result["mode"], result["payload_bytes"],
+              "-" if compile_ms is None else "{:.2f}".format(compile_ms * 1000),
+              result["import_no_pyc_seconds"] * 1000,
+              result["import_pyc_seconds"] * 1000,
+              result["pyc_bytes"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Measure the import cost of embedded image constants.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES,
+            help="Payload sizes in bytes")
+    parser.add_argument("--json", action="store_true",
+            help="Output the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="import_cost_") as directory:
+        for size in args.sizes:
+            results.append(measure_constant(directory, size))
+            results.append(measure_sidecar(directory, size))
+
+    if args.json:
+        print(json.dumps(results, indent=1))
+    else:
+        print_results(results)
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
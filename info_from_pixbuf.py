@@ -8,12 +8,44 @@
 #
 # With these details, then, potentially, a GdkPixbuf.Pixbuf.new_from_bytes()
 # could be used to used to create the pixbuf.
+#
+# Batch mode: When image files, directories or embedded constants are given on
+# the command line, the details of each are extracted by parallel workers and
+# output as JSON lines or CSV. E.g.
+#
+# $ python info_from_pixbuf.py radio_retro_32 N_32px.svg
+# $ python info_from_pixbuf.py --format csv ~/icons > icons.csv
+# $ python info_from_pixbuf.py B64_IMAGE_1 image_embedding_tool.py:B64_IMAGE_2
+#
+# A bare constant name refers to a constant in this program. The form
+# file.py:NAME refers to a constant in another python program.
+
+import argparse
+import ast
+import concurrent.futures
+import csv
+import json
+import os
+import sys
 
 import gi
 gi.require_version('GdkPixbuf', '2.0')
-from gi.repository import GdkPixbuf, GLib
+gi.require_version('Gio', '2.0')
+from gi.repository import GdkPixbuf, Gio, GLib
 import base64
 
+import pixbuf_formats
+
+# Fields reported for each image in batch mode.
+INFO_FIELDS = ("source", "width", "height", "channels", "rowstride",
+               "byte_length", "has_alpha", "x_dpi", "y_dpi",
+               "original_width", "original_height", "error")
+
+# Errors raised by ast.literal_eval() for a value which is not a plain literal,
+# E.g. a name, a set of lists, or nesting too deep to evaluate.
+LITERAL_ERRORS = (ValueError, SyntaxError, TypeError, MemoryError,
+                  RecursionError)
+
 
 def get_info(pixbuf):
 
@@ -57,26 +89,8 @@ def get_info(pixbuf):
 
 
     print("\nRetrieve the supported formats...")
-    pixbuf_format = GdkPixbuf.Pixbuf.get_formats()
-    for item in pixbuf_format:
-        mime_list = GdkPixbuf.PixbufFormat.get_mime_types(item)
-        for mime in mime_list:
-            print(mime)
-        description = GdkPixbuf.PixbufFormat.get_description(item)
-        print(description)
-        extension = GdkPixbuf.PixbufFormat.get_extensions(item)
-        print(extension)
-        lincese = GdkPixbuf.PixbufFormat.get_license(item)    
-        print(license)
-        name = GdkPixbuf.PixbufFormat.get_name(item)     
-        print(name)
-        is_disabled = GdkPixbuf.PixbufFormat.is_disabled(item)    
-        print(is_disabled)
-        is_scalable = GdkPixbuf.PixbufFormat.is_scalable(item)
-        print(is_scalable)
-        is_writable = GdkPixbuf.PixbufFormat.is_writable(item)
-        print(is_writable)
-        print()
+    # The format records are cached on disk by pixbuf_formats.py
+    pixbuf_formats.print_formats()
       	
   	
 def get_image_from_base64(B64_IMAGE):   
@@ -89,6 +103,194 @@ def get_image_from_base64(B64_IMAGE):
     loader.close()
     pixbuf = loader.get_pixbuf()                
     return pixbuf 
+
+
+def get_image_from_bytes(image_data):
+    '''
+    Load binary image data to a Pixbuf. Raises GLib.Error if it is not an image.
+    The same as embedded_image.get_pixbuf_from_bytes(), without importing Gtk,
+    so the batch mode and its worker processes need no display.
+    '''
+    stream = Gio.MemoryInputStream.new_from_bytes(GLib.Bytes.new(image_data))
+    pixbuf = GdkPixbuf.Pixbuf.new_from_stream(stream, None)
+    stream.close(None)
+    return pixbuf
+
+
+def positive_int(text):
+    'argparse type for a count of at least 1, E.g. of worker processes.'
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return value
+
+
+def get_info_record(pixbuf):
+    '''
+    Return the details of the pixbuf as a dictionary, rather than printing
+    them like get_info(). Options not provided by the image loader are None.
+    '''
+    def option_int(key):
+        value = pixbuf.get_option(key)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return None
+
+    return {
+        "width": pixbuf.get_width(),
+        "height": pixbuf.get_height(),
+        "channels": pixbuf.get_n_channels(),
+        "rowstride": pixbuf.get_rowstride(),
+        "byte_length": pixbuf.get_byte_length(),
+        "has_alpha": pixbuf.get_has_alpha(),
+        "x_dpi": option_int("x-dpi"),
+        "y_dpi": option_int("y-dpi"),
+        "original_width": option_int("original-width"),
+        "original_height": option_int("original-height"),
+    }
+
+
+def get_constant_from_source(file_path, name):
+    'Return the value of a module level bytes constant in a python program.'
+    with open(file_path, "rb") as fid:
+        tree = ast.parse(fid.read(), filename=file_path)
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            if isinstance(target, ast.Name) and target.id == name:
+                try:
+                    value = ast.literal_eval(node.value)
+                except LITERAL_ERRORS as e:
+                    raise ValueError("{} is not a literal: {}".format(name, e))
+                if not isinstance(value, bytes):
+                    raise ValueError("{} is not a bytes constant".format(name))
+                return value
+    raise KeyError("{} not found in {}".format(name, file_path))
+
+
+def get_constants_from_source(file_path, prefix="B64_"):
+    '''
+    Return a dictionary of the module level bytes constants in a python
+    program whose names start with the prefix, in the order they are defined.
+    '''
+    with open(file_path, "rb") as fid:
+        tree = ast.parse(fid.read(), filename=file_path)
+    constants = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            if isinstance(target, ast.Name) and target.id.startswith(prefix):
+                try:
+                    value = ast.literal_eval(node.value)
+                except LITERAL_ERRORS:
+                    continue
+                if isinstance(value, bytes):
+                    constants[target.id] = value
+    return constants
+
+
+def get_image_data(source):
+    '''
+    Return the binary image data for a source. A source is an image file, a
+    constant in this program, e.g. B64_IMAGE_1, or a constant in another
+    python program, e.g. image_embedding_tool.py:B64_IMAGE_2
+    '''
+    if os.path.isfile(source):
+        with open(source, "rb") as fid:
+            return fid.read()
+    if ":" in source:
+        file_path, name = source.rsplit(":", 1)
+        return base64.decodebytes(get_constant_from_source(file_path, name))
+    value = globals().get(source)
+    if isinstance(value, bytes) and source.startswith("B64_"):
+        return base64.decodebytes(value)
+    raise FileNotFoundError("No such file or constant: {}".format(source))
+
+
+def inspect_source(source):
+    'Worker: Return the info record for one source. Errors are recorded.'
+    record = dict.fromkeys(INFO_FIELDS)
+    record["source"] = source
+    try:
+        record.update(get_info_record(get_image_from_bytes(
+                get_image_data(source))))
+    except (OSError, ValueError, KeyError, SyntaxError, GLib.Error) as e:
+        record["error"] = str(e)
+    return record
+
+
+def expand_sources(sources):
+    'Yield the sources, replacing each directory with the files it contains.'
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield source
+
+
+def inspect_sources(sources, workers=None):
+    'Yield the info record of each source, in order, using a process pool.'
+    sources = list(expand_sources(sources))
+    if workers == 1 or len(sources) < 2:
+        for source in sources:
+            yield inspect_source(source)
+        return
+    # Larger chunks keep the inter-process overhead low for small icons.
+    processes = workers or os.cpu_count() or 1
+    chunksize = max(1, min(64, len(sources) // (processes * 4)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for record in executor.map(inspect_source, sources, chunksize=chunksize):
+            yield record
+
+
+def write_records(records, output_format="jsonl", fout=sys.stdout):
+    'Write the info records as JSON lines or CSV. Return the count of errors.'
+    errors = 0
+    if output_format == "csv":
+        writer = csv.DictWriter(fout, fieldnames=INFO_FIELDS)
+        writer.writeheader()
+    for record in records:
+        if record["error"]:
+            errors += 1
+        if output_format == "csv":
+            writer.writerow(record)
+        else:
+            fout.write(json.dumps(record) + "\n")
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Output details of images loaded into a GdkPixbuf.")
+    parser.add_argument("sources", nargs="*",
+            help="Image files, directories, B64_ constants in this program, "
+                 "or file.py:CONSTANT")
+    parser.add_argument("-f", "--format", choices=("jsonl", "csv"),
+            default="jsonl", help="Output format (default: jsonl)")
+    parser.add_argument("-j", "--workers", type=positive_int, default=None,
+            help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    if not args.sources:
+        # Original behaviour. Change the commenting to select the B64_IMAGE.
+        pixbuf = get_image_from_base64(B64_IMAGE)
+        #pixbuf = get_image_from_base64(B64_IMAGE_1)
+        #pixbuf = get_image_from_base64(B64_IMAGE_2)
+        get_info(pixbuf)
+        return 0
+
+    errors = write_records(inspect_sources(args.sources, args.workers),
+                           args.format)
+    return 1 if errors else 0
+
     
 B64_IMAGE = (b"""
 iVBORw0KGgoAAAANSUhEUgAAACAAAAAgCAYAAABzenr0AAAJs3pUWHRSYXcgcHJvZmlsZSB0eXBl
@@ -359,11 +561,6 @@ AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA==
 """)
 
 if __name__=="__main__":
-    # Change the commenting to select the B64_IMAGE.
-    pixbuf = get_image_from_base64(B64_IMAGE)
-    #pixbuf = get_image_from_base64(B64_IMAGE_1)
-    #pixbuf = get_image_from_base64(B64_IMAGE_2)    
-    
-    get_info(pixbuf)
+    sys.exit(main())
 
 
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+#
+# launch_syscalls.py
+#
+# Objectives: Count the system calls made to load an embedded image at launch,
+# with the old temporary file method and with the in-memory stream method.
+#
+# Methods, each run in a new interpreter:
+#   tempfile  As get_image_temp_file_path() suggested by image_embedding_tool.py:
+#             decode the image, write it to a /tmp file with tempfile.mkstemp,
+#             then load it twice, for set_icon_from_file() and
+#             Gtk.Image.new_from_file(). The file is removed afterwards, which
+#             is not counted, as the suggested code left it behind.
+#   stream    embedded_image.get_pixbuf_from_base64(): decode the image and load
+#             it once from a Gio.MemoryInputStream. No file is touched.
+#
+# When strace is installed the system calls made between two marker calls are
+# traced and counted by name. Otherwise the read and write system call counts
+# of /proc/self/io are shown.
+#
+# $ python launch_syscalls.py
+# $ python launch_syscalls.py radio_retro_64 --json
+
+import argparse
+import base64
+import collections
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+METHODS = ("tempfile", "stream")
+
+# Markers in the trace, around the image loading.
+MARK_START = "/launch_syscalls_start"
+MARK_END = "/launch_syscalls_end"
+
+# Run in a new interpreter. Prints the /proc/self/io changes as JSON.
+CHILD_CODE = '''
+import base64, json, os, sys, tempfile
+sys.path.insert(0, sys.argv[1])
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf
+import embedded_image
+
+def read_io():
+    try:
+        with open("/proc/self/io") as fid:
+            return dict(line.split(": ") for line in fid.read().splitlines())
+    except OSError:
+        return {}
+
+with open(sys.argv[3], "rb") as fid:
+    b64_image = fid.read()
+left = None
+before = read_io()
+os.path.exists(sys.argv[4])
+if sys.argv[2] == "tempfile":
+    image_data = base64.decodebytes(b64_image)
+    fd, left = tempfile.mkstemp(suffix=".ico", prefix="icon_")
+    with open(fd, "wb") as fout:
+        fout.write(image_data)
+    icon = GdkPixbuf.Pixbuf.new_from_file(left)
+    image = GdkPixbuf.Pixbuf.new_from_file(left)
+else:
+    icon = image = embedded_image.get_pixbuf_from_base64(b64_image)
+os.path.exists(sys.argv[5])
+after = read_io()
+if left:
+    os.remove(left)
+print(json.dumps({key: int(after[key]) - int(before[key])
+                  for key in ("syscr", "syscw") if key in after}))
+'''
+
+TRACE_LINE_RE = re.compile(r"^(?:\[pid\s+\d+\]\s+|\d+\s+)?(\w+)\(")
+
+
+def count_trace(trace_path):
+    'Return a Counter of the system calls between the markers in a trace.'
+    counts = collections.Counter()
+    counting = False
+    with open(trace_path) as fid:
+        for line in fid:
+            if MARK_START in line:
+                counting = True
+                continue
+            if MARK_END in line:
+                break
+            match = TRACE_LINE_RE.match(line)
+            if counting and match:
+                counts[match.group(1)] += 1
+    return counts
+
+
+def run_child(method, command):
+    '''
+    Run the child interpreter and return its output. Raise RuntimeError with
+    the last line of its errors if it fails, E.g. GdkPixbuf is not installed.
+    '''
+    process = subprocess.run(command, capture_output=True, text=True)
+    if process.returncode != 0:
+        errors = process.stderr.strip().splitlines() or ["No output"]
+        raise RuntimeError("The {} method failed: {}".format(method,
+                                                             errors[-1]))
+    return process.stdout
+
+
+def run_method(method, b64_path, use_strace):
+    'Run one method in a new interpreter. Return its result dictionary.'
+    command = [sys.executable, "-c", CHILD_CODE,
+               os.path.dirname(os.path.abspath(__file__)), method, b64_path,
+               MARK_START, MARK_END]
+    result = {"method": method}
+    if not use_strace:
+        output = run_child(method, command)
+        result["proc_io"] = json.loads(output.splitlines()[-1])
+        return result
+
+    with tempfile.TemporaryDirectory(prefix="launch_syscalls_") as directory:
+        trace_path = os.path.join(directory, "trace")
+        output = run_child(method, ["strace", "-f", "-o", trace_path] + command)
+        counts = count_trace(trace_path)
+    result["proc_io"] = json.loads(output.splitlines()[-1])
+    result["syscalls"] = sum(counts.values())
+    result["by_name"] = dict(counts.most_common())
+    return result
+
+
+def print_results(results):
+    'Print the results, and the saving of the last method over the first.'
+    for result in results:
+        print("{:<9} {}".format(result["method"], ", ".join(
+              "{} {}".format(key, value)
+              for key, value in result["proc_io"].items())))
+        if "syscalls" in result:
+            print("          {} system calls: {}".format(result["syscalls"],
+                  ", ".join("{} {}".format(name, count)
+                            for name, count in result["by_name"].items())))
+    if len(results) > 1 and "syscalls" in results[0]:
+        print("Saving: {} system calls".format(
+              results[0]["syscalls"] - results[-1]["syscalls"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Count the system calls of loading an embedded image.")
+    parser.add_argument("image", nargs="?", default="radio_retro_32",
+            help="Image file to embed (default: radio_retro_32)")
+    parser.add_argument("--no-strace", action="store_true",
+            help="Only show the /proc/self/io counts")
+    parser.add_argument("--json", action="store_true",
+            help="Output the results as JSON")
+    args = parser.parse_args(argv)
+
+    use_strace = not args.no_strace and shutil.which("strace") is not None
+    with open(args.image, "rb") as fid:
+        b64_image = base64.encodebytes(fid.read())
+    with tempfile.TemporaryDirectory(prefix="launch_syscalls_") as directory:
+        b64_path = os.path.join(directory, "image.b64")
+        with open(b64_path, "wb") as fout:
+            fout.write(b64_image)
+        try:
+            results = [run_method(method, b64_path, use_strace)
+                       for method in METHODS]
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+    if args.json:
+        print(json.dumps(results, indent=1))
+    else:
+        if not use_strace:
+            print("strace is not available. Showing /proc/self/io only.")
+        print_results(results)
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+#
+# memory_profile.py
+#
+# Objectives: Measure the memory used by the image conversion paths, so that
+# memory improvements can be checked, and kept.
+#
+# convert_image_to_base64() keeps the raw bytes, the base64 bytes, a decoded
+# str and the concatenated constant alive together. get_image_from_base64()
+# keeps the base64, the binary data and the pixbuf alive together.
+# get_pixbuf_from_base64() of embedded_image.py decodes a chunk at a time into
+# a Gio.MemoryInputStream, so python holds no copy of the whole image. Each path is
+# run for a range of image sizes under tracemalloc, while a thread samples the
+# resident set size (RSS) of the process. The report shows:
+#   peak_traced   Largest python memory allocated during the call.
+#   peak_rss      Largest increase in RSS during the call. This includes memory
+#                 allocated by GdkPixbuf, which tracemalloc does not see.
+#   copies        peak_traced / file size. The number of copies of the image
+#                 held by python at the peak.
+#   top sites     The source lines holding the most memory at the peak.
+#
+# $ python memory_profile.py
+# $ python memory_profile.py --sizes 256 4096 --top 8 --json
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import benchmark_pixbuf
+import embedded_image
+import image_embedding_tool_pixbuf
+import info_from_pixbuf
+
+SIZES = (64, 256, 1024, 2048, 4096)
+PATHS = ("convert_image_to_base64", "get_image_from_base64",
+         "get_pixbuf_from_base64")
+TOP_SITES = 5
+
+# Minimum growth in bytes of the traced memory before a new peak snapshot.
+SNAPSHOT_STEP = 65536
+
+# Seconds between RSS samples.
+RSS_INTERVAL = 0.001
+
+
+def get_rss():
+    'Return the resident set size of this process in bytes.'
+    try:
+        with open("/proc/self/statm") as fid:
+            return int(fid.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Not Linux. The maximum RSS is the best available.
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+class RSS_Sampler(threading.Thread):
+    'Thread sampling the RSS, to find the peak increase during a call.'
+    def __init__(self, interval=RSS_INTERVAL):
+        super(RSS_Sampler, self).__init__(daemon=True)
+        self.interval = interval
+        self.baseline = get_rss()
+        self.peak = self.baseline
+        self.running = threading.Event()
+        self.running.set()
+
+
+    def run(self):
+        while self.running.is_set():
+            self.peak = max(self.peak, get_rss())
+            time.sleep(self.interval)
+
+
+    def stop(self):
+        'Stop sampling and return the peak increase in bytes.'
+        self.running.clear()
+        self.join()
+        self.peak = max(self.peak, get_rss())
+        return self.peak - self.baseline
+
+
+class Peak_Snapshot():
+    '''
+    Profile hook that takes a tracemalloc snapshot each time the traced memory
+    reaches a new peak, as a function returns. This gives the allocation sites
+    alive at, or within 1/16 of, the peak, rather than those alive at the end.
+    '''
+    def __init__(self):
+        self.peak = 0
+        self.snapshot = None
+        # Traced memory held by the snapshot itself, which is not counted.
+        self.overhead = 0
+
+
+    def __call__(self, frame, event, arg):
+        if event not in ("return", "c_return"):
+            return
+        current = tracemalloc.get_traced_memory()[0] - self.overhead
+        # Snapshots are slow, so only take one when the peak grows noticeably.
+        if current > self.peak + max(self.peak // 16, SNAPSHOT_STEP):
+            self.snapshot = None
+            before = tracemalloc.get_traced_memory()[0]
+            self.snapshot = tracemalloc.take_snapshot()
+            self.overhead = tracemalloc.get_traced_memory()[0] - before
+            self.peak = before
+
+
+def profile_call(function, top=TOP_SITES):
+    'Call the function and return its memory report.'
+    hook = Peak_Snapshot()
+    sampler = RSS_Sampler()
+    sampler.start()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    sys.setprofile(hook)
+    try:
+        function()
+    finally:
+        sys.setprofile(None)
+        peak_traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        peak_rss = sampler.stop()
+
+    sites = []
+    if hook.snapshot is not None:
+        snapshot = hook.snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__)))
+        for stat in snapshot.statistics("lineno")[:top]:
+            frame = stat.traceback[0]
+            sites.append({"file": os.path.basename(frame.filename),
+                          "line": frame.lineno,
+                          "bytes": stat.size,
+                          "count": stat.count})
+    return {"peak_traced": peak_traced, "peak_rss": peak_rss, "sites": sites}
+
+
+def run_profiles(sizes=SIZES, paths=PATHS, top=TOP_SITES):
+    'Return a list of memory reports, one for each path and image size.'
+    reports = []
+    stand_in = benchmark_pixbuf.Stand_In()
+    with tempfile.TemporaryDirectory(prefix="memory_profile_") as directory:
+        for size in sizes:
+            path = benchmark_pixbuf.generate_image("png", size, directory)
+            with open(path, "rb") as fid:
+                b64_image = base64.encodebytes(fid.read())
+            functions = {
+                "convert_image_to_base64": lambda:
+                    image_embedding_tool_pixbuf.Main_Window.convert_image_to_base64(
+                        stand_in, path),
+                "get_image_from_base64": lambda:
+                    info_from_pixbuf.get_image_from_base64(b64_image),
+                "get_pixbuf_from_base64": lambda:
+                    embedded_image.get_pixbuf_from_base64(b64_image),
+            }
+            for name in paths:
+                report = profile_call(functions[name], top)
+                file_bytes = os.path.getsize(path)
+                report.update({"path": name,
+                               "size": size,
+                               "file_bytes": file_bytes,
+                               "copies": report["peak_traced"] / file_bytes})
+                reports.append(report)
+                # Let the result be freed before the next run.
+                stand_in.textbuffer.text = None
+    return reports
+
+
+def print_reports(reports):
+    'Print the reports in readable form.'
+    for report in reports:
+        print("{} {} x {} ({} bytes)".format(report["path"], report["size"],
+              report["size"], report["file_bytes"]))
+        print("  Peak traced: {:>12} bytes  ({:.2f} copies of the file)".format(
+              report["peak_traced"], report["copies"]))
+        print("  Peak RSS:    {:>12} bytes".format(report["peak_rss"]))
+        for site in report["sites"]:
+            print("    {:>12} bytes {:>6} blocks  {}:{}".format(
+                  site["bytes"], site["count"], site["file"], site["line"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Profile the memory of the image conversion paths.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES,
+            help="Image sizes in pixels")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=PATHS)
+    parser.add_argument("--top", type=int, default=TOP_SITES,
+            help="Number of allocation sites shown")
+    parser.add_argument("--json", action="store_true",
+            help="Output the reports as JSON")
+    args = parser.parse_args(argv)
+
+    reports = run_profiles(args.sizes, args.paths, args.top)
+    if args.json:
+        print(json.dumps(reports, indent=1))
+    else:
+        print_reports(reports)
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+#
+# perceptual_hash.py
+#
+# Objectives: Find near-duplicate images before they are embedded. For example
+# the same logo exported at different sizes, or a recoloured copy like the blue
+# Nikola logo.
+#
+# Each image is decoded at a small size with GdkPixbuf and three 64 bit
+# perceptual hashes are calculated with NumPy:
+#   ahash  Average hash. Each pixel of an 8 x 8 image above or below the mean.
+#   dhash  Difference hash. Each pixel of a 9 x 8 image brighter than the next.
+#   phash  The low frequencies of a 32 x 32 DCT above or below the median.
+#
+# Similar images have hashes with a small Hamming distance. The Hash_Index
+# splits each hash into threshold + 1 bands and only compares hashes that share
+# a band, so no near-duplicate is missed, and a directory of 50,000 images is
+# searched without comparing every pair.
+#
+# $ python perceptual_hash.py ~/icons
+# $ python perceptual_hash.py --hash dhash --threshold 8 ~/icons
+
+import argparse
+import concurrent.futures
+import os
+import sys
+
+import numpy as np
+
+import gi
+gi.require_version('GLib', '2.0')
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf, GLib
+
+import info_from_pixbuf
+import pixbuf_array
+
+HASH_TYPES = ("ahash", "dhash", "phash")
+
+# The Hash_Index has threshold + 1 bands, each at least 1 bit of the hash.
+MAX_THRESHOLD = 63
+DCT_SIZE = 32
+
+# Number of set bits in each byte value, for counting the bits of many hashes.
+BIT_COUNT = np.array([bin(value).count("1") for value in range(256)],
+                     dtype=np.uint8)
+
+
+def dct_matrix(size):
+    'Return the orthonormal DCT-II matrix of the given size.'
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] *= 1 / np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
+
+
+DCT = dct_matrix(DCT_SIZE)
+
+
+def pixbuf_to_gray(pixbuf):
+    '''
+    Return the pixbuf as a float array of luminance values. Transparent pixels
+    are blended with white, so the transparent background of icons is ignored.
+    '''
+    array = pixbuf_array.pixbuf_to_array(pixbuf).astype(np.float32)
+    rgb = array[:, :, :3]
+    if array.shape[2] == 4:
+        alpha = array[:, :, 3:] / 255
+        rgb = rgb * alpha + 255 * (1 - alpha)
+    return rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def bits_to_int(bits):
+    'Return a boolean array of 64 bits as an integer.'
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def get_hashes(pixbuf):
+    'Return a dictionary of the ahash, dhash and phash of a pixbuf.'
+    small = pixbuf.scale_simple(DCT_SIZE, DCT_SIZE, GdkPixbuf.InterpType.BILINEAR)
+    gray = pixbuf_to_gray(small)
+
+    # Average of 4 x 4 blocks gives the 8 x 8 image.
+    blocks = gray.reshape(8, 4, 8, 4).mean(axis=(1, 3))
+    ahash = bits_to_int(blocks > blocks.mean())
+
+    wide = pixbuf_to_gray(pixbuf.scale_simple(9, 8, GdkPixbuf.InterpType.BILINEAR))
+    dhash = bits_to_int(wide[:, 1:] > wide[:, :-1])
+
+    low = (DCT @ gray @ DCT.T)[:8, :8]
+    # The DC term is excluded from the median as it is much larger.
+    phash = bits_to_int(low > np.median(low.ravel()[1:]))
+
+    return {"ahash": ahash, "dhash": dhash, "phash": phash}
+
+
+def hash_file(path):
+    '''
+    Worker: Return (path, hashes) for an image file, or (path, None) if it can
+    not be loaded. Scalable images are rendered at the hash size.
+    '''
+    try:
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(path, DCT_SIZE * 2,
+                                                         DCT_SIZE * 2, False)
+    except GLib.Error:
+        return path, None
+    return path, get_hashes(pixbuf)
+
+
+def hash_files(paths, workers=None):
+    'Yield (path, hashes) for each path using a process pool.'
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(hash_file, paths, chunksize=32)
+
+
+def hamming_distances(value, values):
+    'Return the Hamming distance between a hash and an array of uint64 hashes.'
+    xor = np.bitwise_xor(values, np.uint64(value))
+    return BIT_COUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class Hash_Index():
+    '''
+    Index of 64 bit hashes for Hamming distance searches, by multi-index
+    hashing. Each hash is split into threshold + 1 bands of whole bits. If two
+    hashes differ by at most threshold bits, at least one band is equal, so
+    only hashes sharing a band with the query are compared, and none are
+    missed. The bands are narrower as the threshold grows, so the buckets are
+    larger and more hashes are compared.
+    '''
+    def __init__(self, threshold=6):
+        if not 0 <= threshold <= MAX_THRESHOLD:
+            raise ValueError("The threshold must be from 0 to {}".format(
+                             MAX_THRESHOLD))
+        self.threshold = threshold
+        self.bands = threshold + 1
+        # (shift, mask) of each band. The first 64 % bands are 1 bit wider.
+        self.band_masks = []
+        shift = 0
+        for band in range(self.bands):
+            bits = 64 // self.bands + (band < 64 % self.bands)
+            self.band_masks.append((shift, (1 << bits) - 1))
+            shift += bits
+        self.buckets = [{} for band in range(self.bands)]
+        self.keys = []
+        self.hashes = []
+        self._array = None
+
+
+    def band_values(self, value):
+        'Return the value of each band of a hash.'
+        return [(value >> shift) & mask for shift, mask in self.band_masks]
+
+
+    def add(self, key, value):
+        'Add a hash with a key, E.g. the file path.'
+        ident = len(self.keys)
+        self.keys.append(key)
+        self.hashes.append(value)
+        self._array = None
+        for bucket, band in zip(self.buckets, self.band_values(value)):
+            bucket.setdefault(band, []).append(ident)
+
+
+    def search(self, value, threshold=None):
+        '''
+        Return a list of (distance, key) for the hashes within threshold bits
+        of the value, nearest first. The threshold may not be larger than the
+        threshold of the index.
+        '''
+        if threshold is None or threshold > self.threshold:
+            threshold = self.threshold
+        if self._array is None:
+            self._array = np.array(self.hashes, dtype=np.uint64)
+        candidates = set()
+        for bucket, band in zip(self.buckets, self.band_values(value)):
+            candidates.update(bucket.get(band, ()))
+        if not candidates:
+            return []
+        idents = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        distances = hamming_distances(value, self._array[idents])
+        found = distances <= threshold
+        return sorted((int(distance), self.keys[ident]) for distance, ident
+                      in zip(distances[found], idents[found]))
+
+
+    def find_duplicates(self):
+        '''
+        Return groups of keys whose hashes are within the threshold of each
+        other. Groups are joined transitively. Only groups of 2 or more are
+        returned.
+        '''
+        parent = list(range(len(self.keys)))
+
+        def find(ident):
+            while parent[ident] != ident:
+                parent[ident] = parent[parent[ident]]
+                ident = parent[ident]
+            return ident
+
+        array = np.array(self.hashes, dtype=np.uint64)
+        for bucket in self.buckets:
+            for idents in bucket.values():
+                if len(idents) < 2:
+                    continue
+                members = np.array(idents, dtype=np.int64)
+                values = array[members]
+                for position, ident in enumerate(idents[:-1]):
+                    distances = hamming_distances(self.hashes[ident],
+                                                  values[position + 1:])
+                    for other in members[position + 1:][distances <= self.threshold]:
+                        parent[find(int(other))] = find(ident)
+
+        groups = {}
+        for ident in range(len(self.keys)):
+            groups.setdefault(find(ident), []).append(self.keys[ident])
+        return [group for group in groups.values() if len(group) > 1]
+
+
+def threshold_int(text):
+    'argparse type for a threshold the Hash_Index can honour.'
+    value = int(text)
+    if not 0 <= value <= MAX_THRESHOLD:
+        raise argparse.ArgumentTypeError("must be from 0 to {}".format(
+                                         MAX_THRESHOLD))
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Find near-duplicate images with perceptual hashes.")
+    parser.add_argument("sources", nargs="+", help="Image files or directories")
+    parser.add_argument("--hash", choices=HASH_TYPES, default="phash",
+            help="Hash to compare (default: phash)")
+    parser.add_argument("-t", "--threshold", type=threshold_int, default=6,
+            help="Maximum Hamming distance of near-duplicates (default: 6)")
+    parser.add_argument("-j", "--workers", type=info_from_pixbuf.positive_int,
+            default=None,
+            help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for source in args.sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                paths.extend(os.path.join(root, name) for name in sorted(files))
+        else:
+            paths.append(source)
+
+    index = Hash_Index(args.threshold)
+    for path, hashes in hash_files(paths, args.workers):
+        if hashes is None:
+            print("Not an image:", path, file=sys.stderr)
+            continue
+        index.add(path, hashes[args.hash])
+
+    groups = index.find_duplicates()
+    for group in groups:
+        print("\n".join(group))
+        print()
+    print("{} images, {} groups of near-duplicates".format(
+            len(index.keys), len(groups)), file=sys.stderr)
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
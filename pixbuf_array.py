@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+#
+# pixbuf_array.py
+#
+# Objectives: Analyse the pixel data in a GdkPixbuf using NumPy.
+#
+# pixbuf_to_array() returns the pixels of a pixbuf as a NumPy array with the
+# shape (height, width, channels). The rowstride padding at the end of each row,
+# as reported by info_from_pixbuf.py, is handled with the array strides, so the
+# pixels are not repacked.
+#
+# Notes: One copy of the pixels is made. GdkPixbuf.Pixbuf.read_pixel_bytes()
+# returns a GLib.Bytes that shares the pixbuf memory, but PyGObject offers no
+# way to wrap it without copying: get_data() copies it to python bytes, as
+# does get_pixels(). The array is read-only, over that copy, so changing the
+# pixbuf afterwards does not change the array.
+#
+# The statistics are vectorised and suitable for large images:
+#   alpha usage, unique colour count, bounding box of non-transparent pixels,
+#   and a histogram of each channel.
+#
+# trim_pixbuf() crops the fully transparent borders found by the bounding box,
+# as used by embed_output.py --trim.
+#
+# $ python pixbuf_array.py radio_retro_64 N_32px.svg
+
+import sys
+import time
+
+import numpy as np
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf, GLib
+
+import info_from_pixbuf
+
+# Images with fewer pixels than this count their colours by sorting. Above it
+# the 16 MB bitmap of unique_color_count() is faster.
+BITMAP_MIN_PIXELS = 1 << 20
+
+
+def pixbuf_to_array(pixbuf):
+    '''
+    Return a read-only uint8 array of shape (height, width, channels) of a
+    copy of the pixels of the pixbuf, made once by get_data(). Only 8 bits per
+    sample pixbufs are supported, which is all that GdkPixbuf currently creates.
+    '''
+    if pixbuf.get_bits_per_sample() != 8:
+        raise ValueError("Only 8 bits per sample is supported")
+    width = pixbuf.get_width()
+    height = pixbuf.get_height()
+    channels = pixbuf.get_n_channels()
+    rowstride = pixbuf.get_rowstride()
+    data = pixbuf.read_pixel_bytes().get_data()
+    return np.ndarray(shape=(height, width, channels),
+                      dtype=np.uint8,
+                      buffer=data,
+                      strides=(rowstride, channels, 1))
+
+
+def array_to_pixbuf(array):
+    '''
+    Return a new pixbuf from a uint8 array of shape (height, width, 3 or 4).
+    The rows are packed so the rowstride is width * channels.
+    '''
+    array = np.ascontiguousarray(array, dtype=np.uint8)
+    height, width, channels = array.shape
+    if channels not in (3, 4):
+        raise ValueError("Array must have 3 or 4 channels")
+    return GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(array.tobytes()),
+                                           GdkPixbuf.Colorspace.RGB,
+                                           channels == 4,
+                                           8,
+                                           width,
+                                           height,
+                                           width * channels)
+
+
+def alpha_usage(array):
+    '''
+    Return a dictionary of the number of transparent (alpha 0), opaque
+    (alpha 255) and partially transparent pixels.
+    '''
+    pixels = array.shape[0] * array.shape[1]
+    if array.shape[2] < 4:
+        return {"transparent": 0, "opaque": pixels, "partial": 0}
+    alpha = array[:, :, 3]
+    transparent = int(np.count_nonzero(alpha == 0))
+    opaque = int(np.count_nonzero(alpha == 255))
+    return {"transparent": transparent,
+            "opaque": opaque,
+            "partial": pixels - transparent - opaque}
+
+
+def pack_colors(array):
+    'Return the pixels packed into one integer each, for fast comparisons.'
+    rgb = (array[:, :, 0].astype(np.uint32) << 16
+           | array[:, :, 1].astype(np.uint32) << 8
+           | array[:, :, 2])
+    if array.shape[2] < 4:
+        return rgb
+    return (rgb << 8) | array[:, :, 3]
+
+
+def unique_color_count(array):
+    '''
+    Return the number of distinct colours (including alpha) in the image.
+    When every pixel of a large image is opaque a 24 bit bitmap is used, which
+    avoids sorting. Smaller images are sorted, rather than clearing the 16 MB
+    bitmap.
+    '''
+    if array.shape[0] == 0 or array.shape[1] == 0:
+        return 0
+    if array.shape[0] * array.shape[1] < BITMAP_MIN_PIXELS \
+            or array.shape[2] == 4 and not np.all(array[:, :, 3] == 255):
+        return int(np.unique(pack_colors(array)).size)
+    seen = np.zeros(1 << 24, dtype=bool)
+    seen[pack_colors(array[:, :, :3]).ravel()] = True
+    return int(np.count_nonzero(seen))
+
+
+def bounding_box(array):
+    '''
+    Return (x, y, width, height) of the pixels that are not fully transparent.
+    Return None if every pixel is transparent.
+    '''
+    height, width = array.shape[:2]
+    if array.shape[2] < 4:
+        return (0, 0, width, height) if width and height else None
+    visible = array[:, :, 3] != 0
+    rows = np.flatnonzero(visible.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(visible.any(axis=0))
+    x = int(cols[0])
+    y = int(rows[0])
+    return (x, y, int(cols[-1]) - x + 1, int(rows[-1]) - y + 1)
+
+
+def trim_box(array, padding=0):
+    '''
+    Return (x, y, width, height) of the pixels that are not fully transparent,
+    with padding pixels added on each side, within the image. Return None if
+    every pixel is transparent. Raise ValueError if padding is negative.
+    '''
+    if padding < 0:
+        raise ValueError("padding must not be negative")
+    box = bounding_box(array)
+    if box is None:
+        return None
+    height, width = array.shape[:2]
+    x, y, box_width, box_height = box
+    left = max(0, x - padding)
+    top = max(0, y - padding)
+    right = min(width, x + box_width + padding)
+    bottom = min(height, y + box_height + padding)
+    return (left, top, right - left, bottom - top)
+
+
+def trim_pixbuf(pixbuf, padding=0):
+    '''
+    Crop the fully transparent borders of a pixbuf, keeping padding pixels.
+    Return the cropped pixbuf, a sub-pixbuf sharing the pixels, and the
+    layout (canvas width, canvas height, x, y) of the crop in the original.
+    A pixbuf which has nothing to crop is returned as it is.
+    '''
+    box = trim_box(pixbuf_to_array(pixbuf), padding)
+    if box is None:
+        # Fully transparent. Keep one pixel.
+        box = (0, 0, 1, 1)
+    x, y, width, height = box
+    layout = (pixbuf.get_width(), pixbuf.get_height(), x, y)
+    if (width, height) == (pixbuf.get_width(), pixbuf.get_height()):
+        return pixbuf, layout
+    return pixbuf.new_subpixbuf(x, y, width, height), layout
+
+
+def histogram(array):
+    'Return a (channels, 256) array with the count of each value per channel.'
+    channels = array.shape[2]
+    result = np.zeros((channels, 256), dtype=np.int64)
+    for channel in range(channels):
+        result[channel] = np.bincount(array[:, :, channel].ravel(),
+                                      minlength=256)
+    return result
+
+
+def get_image_stats(pixbuf):
+    'Return a dictionary of statistics for the pixels of the pixbuf.'
+    array = pixbuf_to_array(pixbuf)
+    return {
+        "width": array.shape[1],
+        "height": array.shape[0],
+        "channels": array.shape[2],
+        "alpha": alpha_usage(array),
+        "unique_colors": unique_color_count(array),
+        "bounding_box": bounding_box(array),
+        "histogram": histogram(array),
+    }
+
+
+if __name__=="__main__":
+    sources = sys.argv[1:] or ["B64_IMAGE"]
+    for source in sources:
+        pixbuf = info_from_pixbuf.get_image_from_bytes(
+                info_from_pixbuf.get_image_data(source))
+        start = time.perf_counter()
+        stats = get_image_stats(pixbuf)
+        elapsed = time.perf_counter() - start
+        print(source)
+        print("  Size: {} x {} x {}".format(stats["width"], stats["height"],
+                                            stats["channels"]))
+        print("  Alpha:", stats["alpha"])
+        print("  Unique colours:", stats["unique_colors"])
+        print("  Bounding box:", stats["bounding_box"])
+        print("  Analysed in {:.2f} ms".format(elapsed * 1000))
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+#
+# pixbuf_cache.py
+#
+# Objectives: Avoid running base64 decode and the image decoder on every launch
+# for the same embedded image constants.
+#
+# The first time an embedded image is decoded its pixel buffer, as described by
+# info_from_pixbuf.py (width, height, rowstride, etc.), is written to a file in
+# the XDG cache directory. On later launches the file is memory mapped and the
+# pixbuf is created with GdkPixbuf.Pixbuf.new_from_bytes(), so no decoding of
+# the image takes place.
+#
+# The cache is opt-in. Either pass use_cache=True to get_pixbuf_from_base64()
+# or set the environment variable IMAGE_EMBEDDING_PIXEL_CACHE=1
+#
+# The cache file name is a hash of the base64 payload plus the GdkPixbuf
+# version, so a changed image, or an upgraded GdkPixbuf, never reads a stale
+# entry. Files are written to a temporary name and then renamed into place, so
+# concurrent processes only ever see complete files.
+#
+# Notes: The file is mapped with GLib.MappedFile, and the pixels are a range of
+# its GLib.Bytes, so the pixbuf uses the mapped pages without copying them.
+# Python's mmap could not be used, as PyGObject copies a python buffer into a
+# new GLib.Bytes.
+
+import base64
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import gi
+gi.require_version('GLib', '2.0')
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf, GLib
+
+CACHE_ENV = "IMAGE_EMBEDDING_PIXEL_CACHE"
+CACHE_ROOT = "image-embedding-tool"
+CACHE_SUBDIR = "pixels"
+CACHE_SUFFIX = ".pix"
+
+# Temporary files older than this, in seconds, were left by a failed writer.
+# Younger ones may belong to a writer that is still running.
+STALE_TEMP_AGE = 3600
+
+# Header at the start of each cache file, followed by the pixel data.
+# magic, payload digest, width, height, rowstride, n_channels,
+# bits_per_sample, has_alpha
+HEADER = struct.Struct("<8s32sIIIIII")
+MAGIC = b"EMBPIX01"
+
+
+def get_cache_dir(subdir=CACHE_SUBDIR):
+    'Return the XDG cache directory used for cached pixel buffers, etc.'
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        cache_home = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, CACHE_ROOT, subdir)
+
+
+def cache_enabled():
+    'Return True if the cache has been enabled from the environment.'
+    return os.environ.get(CACHE_ENV, "") not in ("", "0")
+
+
+def get_payload_digest(b64_image):
+    '''
+    Return the sha256 digest of the base64 payload combined with the GdkPixbuf
+    version. The digest changes if either the image or the decoder changes.
+    '''
+    digest = hashlib.sha256(b64_image)
+    digest.update(GdkPixbuf.PIXBUF_VERSION.encode())
+    return digest.digest()
+
+
+def get_cache_path(digest, cache_dir=None):
+    'Return the cache file path for a payload digest.'
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    return os.path.join(cache_dir, digest.hex() + CACHE_SUFFIX)
+
+
+def get_pixel_length(width, height, rowstride, n_channels, bits_per_sample):
+    'Byte length of pixbuf pixel data. The last row has no rowstride padding.'
+    if width == 0 or height == 0:
+        return 0
+    last_row = (width * n_channels * bits_per_sample + 7) // 8
+    return (height - 1) * rowstride + last_row
+
+
+def read_cache(digest, cache_dir=None):
+    '''
+    Memory map the cache file for the digest and build a pixbuf from it.
+    Return the pixbuf, or None if there is no valid cache file.
+    '''
+    path = get_cache_path(digest, cache_dir)
+    try:
+        mapped = GLib.MappedFile.new(path, False)
+    except GLib.Error:
+        return None
+
+    # The whole file, without a copy. Only the header is read by python.
+    file_bytes = mapped.get_bytes()
+    if file_bytes.get_size() < HEADER.size:
+        return None
+    (magic, file_digest, width, height, rowstride, n_channels,
+            bits_per_sample, has_alpha) = HEADER.unpack(
+            GLib.Bytes.new_from_bytes(file_bytes, 0, HEADER.size).get_data())
+    if magic != MAGIC or file_digest != digest:
+        return None
+    length = get_pixel_length(width, height, rowstride, n_channels,
+                              bits_per_sample)
+    if file_bytes.get_size() != HEADER.size + length:
+        # Truncated or otherwise corrupt.
+        return None
+
+    # The pixels, as a range of the mapped file
+    data = GLib.Bytes.new_from_bytes(file_bytes, HEADER.size, length)
+
+    return GdkPixbuf.Pixbuf.new_from_bytes(data,
+                                           GdkPixbuf.Colorspace.RGB,
+                                           bool(has_alpha),
+                                           bits_per_sample,
+                                           width,
+                                           height,
+                                           rowstride)
+
+
+def write_cache(digest, pixbuf, cache_dir=None):
+    '''
+    Write the pixbuf pixels to the cache file for the digest.
+    The file is written to a temporary name and renamed into place, which is
+    atomic, so other processes never map a partially written file.
+    Return True if the cache file was written.
+    '''
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+
+    width = pixbuf.get_width()
+    height = pixbuf.get_height()
+    rowstride = pixbuf.get_rowstride()
+    n_channels = pixbuf.get_n_channels()
+    bits_per_sample = pixbuf.get_bits_per_sample()
+    has_alpha = pixbuf.get_has_alpha()
+
+    pixels = pixbuf.read_pixel_bytes().get_data()
+    length = get_pixel_length(width, height, rowstride, n_channels,
+                              bits_per_sample)
+    header = HEADER.pack(MAGIC, digest, width, height, rowstride, n_channels,
+                         bits_per_sample, int(has_alpha))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp",
+                                         prefix="pix_",
+                                         dir=cache_dir)
+    except OSError:
+        return False
+
+    try:
+        with open(fd, "wb") as fout:
+            fout.write(header)
+            fout.write(pixels[:length])
+        os.replace(temp_path, get_cache_path(digest, cache_dir))
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def decode_base64(b64_image):
+    'Decode base64 image data to a pixbuf using GdkPixbuf.PixbufLoader'
+    image_data = base64.decodebytes(b64_image)
+
+    loader = GdkPixbuf.PixbufLoader()
+    loader.write(image_data)
+    loader.close()
+    pixbuf = loader.get_pixbuf()
+    return pixbuf
+
+
+def get_pixbuf_from_base64(b64_image, use_cache=None, cache_dir=None):
+    '''
+    Return the pixbuf for the base64 image data.
+    If the cache is enabled, a previously decoded pixel buffer is used when
+    available, otherwise the image is decoded and the result cached.
+    '''
+    if use_cache is None:
+        use_cache = cache_enabled()
+    if not use_cache:
+        return decode_base64(b64_image)
+
+    digest = get_payload_digest(b64_image)
+    pixbuf = read_cache(digest, cache_dir)
+    if pixbuf is not None:
+        return pixbuf
+
+    pixbuf = decode_base64(b64_image)
+    write_cache(digest, pixbuf, cache_dir)
+    return pixbuf
+
+
+def clear_cache(cache_dir=None):
+    '''
+    Remove all cached pixel buffers, and the temporary files left by failed
+    writers. Return the number of files removed.
+    '''
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    count = 0
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return 0
+    stale = time.time() - STALE_TEMP_AGE
+    for name in names:
+        path = os.path.join(cache_dir, name)
+        try:
+            if name.endswith(".tmp") and os.stat(path).st_mtime > stale:
+                # May still be being written
+                continue
+        except OSError:
+            continue
+        if name.endswith(CACHE_SUFFIX) or name.endswith(".tmp"):
+            try:
+                os.remove(path)
+                count += 1
+            except OSError:
+                pass
+    return count
+
+
+if __name__=="__main__":
+    # $ python pixbuf_cache.py          Report the cache directory and size.
+    # $ python pixbuf_cache.py clear    Remove all cached pixel buffers.
+    if len(sys.argv) > 1 and sys.argv[1] == "clear":
+        print("Removed {} cache files".format(clear_cache()))
+    else:
+        cache_dir = get_cache_dir()
+        total = 0
+        count = 0
+        if os.path.isdir(cache_dir):
+            for entry in os.scandir(cache_dir):
+                if entry.name.endswith(CACHE_SUFFIX):
+                    total += entry.stat().st_size
+                    count += 1
+        print("Cache directory:", cache_dir)
+        print("Cached images: {}  Bytes: {}".format(count, total))
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+#
+# pixbuf_formats.py
+#
+# Objectives: Provide the image formats supported by the installed GdkPixbuf
+# loaders, as structured records, without enumerating every loader module each
+# time.
+#
+# GdkPixbuf.Pixbuf.get_formats() loads the details of every loader module. The
+# records are therefore cached on disk in the XDG cache directory. The cache is
+# keyed by the GdkPixbuf version and the modification time of the loaders.cache
+# file, so installing or removing a loader refreshes the records.
+#
+# For checking format support on a hot path use is_format_supported(), which
+# only does a dictionary lookup after the first call. E.g.
+#
+#   import pixbuf_formats
+#   if pixbuf_formats.is_format_supported("image/webp"):
+#       ...
+#   if pixbuf_formats.is_format_supported("ico", writable=True):
+#       ...
+#
+# Run this program to list the supported formats:
+#
+# $ python pixbuf_formats.py
+# $ python pixbuf_formats.py --json
+
+import glob
+import json
+import os
+import sys
+import tempfile
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf
+
+import pixbuf_cache
+
+FORMATS_CACHE_FILE = "formats.json"
+
+# Usual locations of the loaders.cache file, if GDK_PIXBUF_MODULE_FILE is not set.
+LOADERS_CACHE_GLOBS = (
+    "/usr/lib/*/gdk-pixbuf-2.0/*/loaders.cache",
+    "/usr/lib*/gdk-pixbuf-2.0/*/loaders.cache",
+    "/usr/local/lib*/gdk-pixbuf-2.0/*/loaders.cache",
+    "/usr/local/lib/*/gdk-pixbuf-2.0/*/loaders.cache",
+)
+
+# Formats held in memory after the first call to get_formats()
+_formats = None
+_lookup = None
+
+
+def get_loaders_cache_path():
+    'Return the path of the GdkPixbuf loaders.cache file, or None if not found.'
+    path = os.environ.get("GDK_PIXBUF_MODULE_FILE")
+    if path and os.path.isfile(path):
+        return path
+    for pattern in LOADERS_CACHE_GLOBS:
+        paths = sorted(glob.glob(pattern))
+        if paths:
+            return paths[0]
+    return None
+
+
+def get_cache_key():
+    '''
+    Return the key identifying the installed loaders. This is the GdkPixbuf
+    version plus the path and modification time of loaders.cache
+    '''
+    path = get_loaders_cache_path()
+    mtime = None
+    if path:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    return {"version": GdkPixbuf.PIXBUF_VERSION,
+            "loaders_cache": path,
+            "mtime_ns": mtime}
+
+
+def get_format_record(pixbuf_format):
+    'Return the details of a GdkPixbuf.PixbufFormat as a dictionary.'
+    return {
+        "name": pixbuf_format.get_name(),
+        "description": pixbuf_format.get_description(),
+        "mime_types": list(pixbuf_format.get_mime_types()),
+        "extensions": list(pixbuf_format.get_extensions()),
+        "license": pixbuf_format.get_license(),
+        "writable": pixbuf_format.is_writable(),
+        "scalable": pixbuf_format.is_scalable(),
+        "disabled": pixbuf_format.is_disabled(),
+    }
+
+
+def enumerate_formats():
+    'Enumerate the loader modules. This is slow, so use get_formats()'
+    return [get_format_record(item) for item in GdkPixbuf.Pixbuf.get_formats()]
+
+
+def read_formats_cache(key, cache_dir):
+    'Return the cached format records if they match the key, else None.'
+    try:
+        with open(os.path.join(cache_dir, FORMATS_CACHE_FILE)) as fid:
+            data = json.load(fid)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("key") != key:
+        return None
+    return data.get("formats")
+
+
+def write_formats_cache(key, formats, cache_dir):
+    'Write the format records to the cache, atomically.'
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp",
+                                         prefix="formats_",
+                                         dir=cache_dir)
+    except OSError:
+        return False
+    try:
+        with open(fd, "w") as fout:
+            json.dump({"key": key, "formats": formats}, fout, indent=1)
+        os.replace(temp_path, os.path.join(cache_dir, FORMATS_CACHE_FILE))
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def get_formats(refresh=False, cache_dir=None):
+    '''
+    Return a list of format records. Each record is a dictionary with the keys:
+    name, description, mime_types, extensions, license, writable, scalable and
+    disabled. The records are read from the disk cache when it is up to date.
+    '''
+    global _formats, _lookup
+    if _formats is not None and not refresh:
+        return _formats
+
+    if cache_dir is None:
+        cache_dir = pixbuf_cache.get_cache_dir("formats")
+    key = get_cache_key()
+    formats = None if refresh else read_formats_cache(key, cache_dir)
+    if formats is None:
+        formats = enumerate_formats()
+        write_formats_cache(key, formats, cache_dir)
+
+    _formats = formats
+    _lookup = None
+    return _formats
+
+
+def find_format(ident):
+    '''
+    Return the format record for a format name, mime type or file extension.
+    E.g. "png", "image/png" or ".png". Return None if not supported.
+    '''
+    global _lookup
+    if _lookup is None:
+        lookup = {}
+        for record in get_formats():
+            keys = [record["name"]] + record["mime_types"] + record["extensions"]
+            for key in keys:
+                lookup.setdefault(key.lower(), record)
+        _lookup = lookup
+    return _lookup.get(ident.lower().lstrip("."))
+
+
+def is_format_supported(ident, writable=False):
+    '''
+    Return True if a format name, mime type or file extension can be loaded,
+    and, if writable is True, saved. Disabled formats are not supported.
+    '''
+    record = find_format(ident)
+    if record is None or record["disabled"]:
+        return False
+    return record["writable"] or not writable
+
+
+def print_formats(formats=None):
+    'Print the format records in the layout used by info_from_pixbuf.py'
+    if formats is None:
+        formats = get_formats()
+    for record in formats:
+        for mime in record["mime_types"]:
+            print(mime)
+        print(record["description"])
+        print(record["extensions"])
+        print(record["license"])
+        print(record["name"])
+        print("Disabled:", record["disabled"])
+        print("Scalable:", record["scalable"])
+        print("Writable:", record["writable"])
+        print()
+
+
+if __name__=="__main__":
+    refresh = "--refresh" in sys.argv
+    formats = get_formats(refresh=refresh)
+    if "--json" in sys.argv:
+        json.dump(formats, sys.stdout, indent=1)
+        print()
+    else:
+        print("Supported formats of GdkPixbuf {}\n".format(
+                GdkPixbuf.PIXBUF_VERSION))
+        print_formats(formats)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+#
+# pixbuf_probe.py
+#
+# Objectives: Return the format, width and height of an image without decoding
+# its pixels.
+#
+# Showing information about a selected file with GdkPixbuf.PixbufLoader means
+# decoding the whole image. The probe only reads the header. Built-in parsers
+# handle PNG, GIF, JPEG, ICO, BMP, WebP and SVG. Other formats fall back to
+# GdkPixbuf.Pixbuf.get_file_info(), which also stops after the header.
+#
+# The result is a dictionary like:
+#   {"format": "png", "width": 32, "height": 32, "has_alpha": True}
+# has_alpha is None when it can not be known from the header.
+#
+# $ python pixbuf_probe.py radio_retro_32 N_32px.svg
+# $ python pixbuf_probe.py ~/icons > probe.jsonl
+
+import io
+import json
+import os
+import re
+import struct
+import sys
+import time
+
+# Bytes read from the start of a file. Enough for every fixed position header.
+HEAD_SIZE = 32
+
+# Bytes searched for the <svg> element. Inkscape puts a long comment and
+# namespace list before the width and height.
+SVG_HEAD_SIZE = 16384
+
+# JPEG start of frame markers. C4, C8 and CC are not frames.
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# Conversion of SVG lengths to pixels at 96 dpi.
+SVG_UNITS = {"": 1.0, "px": 1.0, "pt": 96 / 72, "pc": 16.0, "in": 96.0,
+             "cm": 96 / 2.54, "mm": 96 / 25.4}
+
+SVG_TAG_RE = re.compile(rb"<svg\b[^>]*>", re.DOTALL)
+SVG_ATTR_RE = re.compile(rb"""\s([\w:-]+)\s*=\s*["']([^"']*)["']""")
+SVG_LENGTH_RE = re.compile(r"^\s*([0-9.]+)\s*([a-z]*)\s*$")
+
+
+def result(image_format, width, height, has_alpha=None):
+    'Return a probe result dictionary.'
+    return {"format": image_format, "width": width, "height": height,
+            "has_alpha": has_alpha}
+
+
+def pixbuf_memory(width, height, channels):
+    'Bytes used by the pixels of a pixbuf. Rows are padded to 4 bytes.'
+    if width == 0 or height == 0:
+        return 0
+    rowstride = (width * channels + 3) & ~3
+    return (height - 1) * rowstride + width * channels
+
+
+def probe_png(head, fid):
+    # Signature, then the IHDR chunk: width, height, bit depth, colour type.
+    width, height, bit_depth, color_type = struct.unpack_from(">IIBB", head, 16)
+    # Colour type 4 is gray+alpha and 6 is RGBA. A tRNS chunk may also add
+    # alpha, but it comes later in the file.
+    return result("png", width, height, color_type in (4, 6) or None)
+
+
+def probe_gif(head, fid):
+    width, height = struct.unpack_from("<HH", head, 6)
+    return result("gif", width, height, None)
+
+
+def skip_gif_blocks(fid):
+    'Skip the data sub-blocks of a GIF, up to and including the terminator.'
+    while True:
+        size = fid.read(1)
+        if not size or size[0] == 0:
+            return
+        fid.seek(size[0], io.SEEK_CUR)
+
+
+def gif_frame_delays(fid):
+    '''
+    Return the delay of every frame of a GIF, in hundredths of a second, from
+    the graphic control extensions. Only the block headers are read. A frame
+    without a graphic control extension has a delay of 0.
+    '''
+    head = fid.read(13)
+    if len(head) < 13 or head[:3] != b"GIF":
+        raise ValueError("Not a GIF image")
+    if head[10] & 0x80:
+        # Global colour table
+        fid.seek(3 << ((head[10] & 0x07) + 1), io.SEEK_CUR)
+    delays = []
+    delay = 0
+    while True:
+        introducer = fid.read(1)
+        if not introducer or introducer == b"\x3b":
+            return delays
+        if introducer == b"\x21":
+            label = fid.read(1)
+            if label == b"\xf9":
+                block = fid.read(6)
+                if len(block) < 6:
+                    raise ValueError("Truncated GIF graphic control extension")
+                delay = struct.unpack_from("<H", block, 2)[0]
+                fid.seek(-6, io.SEEK_CUR)
+            skip_gif_blocks(fid)
+        elif introducer == b"\x2c":
+            descriptor = fid.read(9)
+            if len(descriptor) < 9:
+                return delays
+            if descriptor[8] & 0x80:
+                # Local colour table
+                fid.seek(3 << ((descriptor[8] & 0x07) + 1), io.SEEK_CUR)
+            # LZW minimum code size, then the image data
+            fid.seek(1, io.SEEK_CUR)
+            skip_gif_blocks(fid)
+            delays.append(delay)
+            delay = 0
+        else:
+            raise ValueError("Bad GIF block {!r}".format(introducer))
+
+
+def probe_bmp(head, fid):
+    header_size = struct.unpack_from("<I", head, 14)[0]
+    if header_size == 12:
+        width, height = struct.unpack_from("<HH", head, 18)
+        bpp = struct.unpack_from("<H", head, 24)[0]
+    else:
+        width, height = struct.unpack_from("<ii", head, 18)
+        bpp = struct.unpack_from("<H", head, 28)[0]
+    return result("bmp", abs(width), abs(height), bpp == 32)
+
+
+def probe_ico(head, fid):
+    # Directory entries are 16 bytes each. Report the largest image.
+    count = struct.unpack_from("<H", head, 4)[0]
+    fid.seek(6)
+    entries = fid.read(16 * count)
+    best = None
+    for offset in range(0, len(entries) - 15, 16):
+        width, height = entries[offset], entries[offset + 1]
+        bpp = struct.unpack_from("<H", entries, offset + 6)[0]
+        # A size of 0 means 256 pixels.
+        size = (width or 256, height or 256, bpp)
+        if best is None or size[0] * size[1] > best[0] * best[1]:
+            best = size
+    if best is None:
+        return None
+    return result("ico", best[0], best[1], best[2] == 32 or None)
+
+
+def probe_webp(head, fid):
+    chunk = head[12:16]
+    if chunk == b"VP8X":
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return result("webp", width, height, bool(head[20] & 0x10))
+    if chunk == b"VP8L":
+        bits = int.from_bytes(head[21:25], "little")
+        return result("webp", (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1,
+                      bool((bits >> 28) & 1))
+    if chunk == b"VP8 ":
+        width, height = struct.unpack_from("<HH", head, 26)
+        return result("webp", width & 0x3fff, height & 0x3fff, False)
+    return None
+
+
+def probe_jpeg(head, fid):
+    '''
+    Walk the JPEG segments until the start of frame. Each segment is skipped
+    using its length, so EXIF data and thumbnails are never read.
+    '''
+    fid.seek(2)
+    while True:
+        marker = fid.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        while marker[1] == 0xFF:
+            # Fill bytes before a marker.
+            marker = marker[1:] + fid.read(1)
+            if len(marker) < 2:
+                return None
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+            # Markers without a length.
+            continue
+        length_bytes = fid.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker[1] in JPEG_SOF_MARKERS:
+            frame = fid.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack_from(">HH", frame, 1)
+            return result("jpeg", width, height, False)
+        fid.seek(length - 2, io.SEEK_CUR)
+
+
+def svg_length(value):
+    'Convert an SVG length to pixels. Return None for percentages, etc.'
+    if value is None:
+        return None
+    match = SVG_LENGTH_RE.match(value.decode("ascii", "replace"))
+    if not match or match.group(2) not in SVG_UNITS:
+        return None
+    return int(round(float(match.group(1)) * SVG_UNITS[match.group(2)]))
+
+
+def probe_svg(head, fid):
+    '''
+    Find the <svg> element and return its width and height, or the size of
+    the viewBox if they are not given.
+    '''
+    fid.seek(0)
+    text = fid.read(SVG_HEAD_SIZE)
+    match = SVG_TAG_RE.search(text)
+    if not match:
+        return None
+    attrs = dict(SVG_ATTR_RE.findall(match.group(0)))
+    width = svg_length(attrs.get(b"width"))
+    height = svg_length(attrs.get(b"height"))
+    if (width is None or height is None) and b"viewBox" in attrs:
+        box = attrs[b"viewBox"].replace(b",", b" ").split()
+        if len(box) == 4:
+            try:
+                box_width, box_height = float(box[2]), float(box[3])
+            except ValueError:
+                pass
+            else:
+                width = width if width is not None else int(round(box_width))
+                height = height if height is not None else int(round(box_height))
+    return result("svg", width, height, True)
+
+
+def get_parser(head):
+    'Return the parser function for the file header, or None.'
+    if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+        return probe_png
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return probe_gif
+    if head.startswith(b"\xff\xd8"):
+        return probe_jpeg
+    if head.startswith(b"\x00\x00\x01\x00"):
+        return probe_ico
+    if head.startswith(b"BM") and len(head) >= 30:
+        return probe_bmp
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return probe_webp
+    stripped = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if stripped.startswith(b"<?xml") or stripped.startswith(b"<svg") \
+            or stripped.startswith(b"<!--") or stripped.startswith(b"<!DOCTYPE"):
+        return probe_svg
+    return None
+
+
+def probe_stream(fid):
+    '''
+    Probe a binary file object opened for reading, positioned at the start.
+    Return the result dictionary, or None if the format is not recognised.
+    '''
+    head = fid.read(HEAD_SIZE)
+    parser = get_parser(head)
+    if parser is None:
+        return None
+    try:
+        return parser(head, fid)
+    except (struct.error, ValueError, OSError):
+        return None
+
+
+def probe_bytes(data):
+    'Probe binary image data, E.g. a decoded embedded image.'
+    return probe_stream(io.BytesIO(data))
+
+
+def probe_gdkpixbuf(path):
+    '''
+    Probe using GdkPixbuf.Pixbuf.get_file_info(). GdkPixbuf is only imported
+    when a format is not handled by the built-in parsers.
+    '''
+    import gi
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GdkPixbuf
+    pixbuf_format, width, height = GdkPixbuf.Pixbuf.get_file_info(path)
+    if pixbuf_format is None:
+        return None
+    return result(pixbuf_format.get_name(), width, height, None)
+
+
+def probe(path, fallback=True):
+    '''
+    Return the format, width and height of an image file without decoding it.
+    Return None if the file is not a recognised image.
+    '''
+    with open(path, "rb") as fid:
+        info = probe_stream(fid)
+    if info is None and fallback:
+        info = probe_gdkpixbuf(path)
+    return info
+
+
+if __name__=="__main__":
+    paths = []
+    for source in sys.argv[1:]:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                paths.extend(os.path.join(root, name) for name in sorted(files))
+        else:
+            paths.append(source)
+
+    start = time.perf_counter()
+    for path in paths:
+        try:
+            info = probe(path)
+        except OSError as e:
+            info = {"error": str(e)}
+        info = dict(info or {"error": "Unknown format"}, path=path)
+        print(json.dumps(info))
+    elapsed = time.perf_counter() - start
+    if paths:
+        print("Probed {} files in {:.3f} s".format(len(paths), elapsed),
+              file=sys.stderr)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+#
+# reduction_advisor.py
+#
+# Objectives: Find embedded images that are stored with more data than they
+# need, and produce a smaller equivalent encoding.
+#
+# Using the pixel data read by info_from_pixbuf.py and pixbuf_array.py, each
+# image is checked for:
+#   * An alpha channel where every pixel is opaque.
+#   * Colour pixels that are all grey (red == green == blue).
+#   * 256 colours or less, which may be stored as a palette.
+#
+# The image is then re-encoded as a grayscale, RGB or palette PNG, whichever is
+# the smallest, and the base64 payload and decoded pixbuf memory saved are
+# reported. The new encoding is lossless.
+#
+# Animations and vector images (SVG) are skipped, and reported as such: a PNG
+# would keep only the first frame of an animation, and an SVG is scalable.
+#
+# Notes: GdkPixbuf always decodes to RGB or RGBA, so grayscale and palette PNGs
+# reduce the payload but not the decoded memory. Dropping an unused alpha
+# channel reduces both.
+#
+# $ python reduction_advisor.py ~/icons
+# $ python reduction_advisor.py --output-dir reduced --json radio_retro_64
+
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+import gi
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+import embed_output
+import info_from_pixbuf
+import pixbuf_array
+import pixbuf_probe
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG colour types
+PNG_GRAY = 0
+PNG_RGB = 2
+PNG_PALETTE = 3
+PNG_GRAY_ALPHA = 4
+PNG_RGBA = 6
+
+# Formats of pixbuf_probe.py which are vector images, not re-encoded as PNG
+VECTOR_FORMATS = ("svg",)
+
+
+def base64_length(size):
+    'Length of base64.encodebytes() output for size bytes, including newlines.'
+    if size == 0:
+        return 0
+    return 4 * ((size + 2) // 3) + (size + 56) // 57
+
+
+def png_chunk(chunk_type, data):
+    'Return a PNG chunk: length, type, data and crc.'
+    crc = zlib.crc32(chunk_type + data) & 0xffffffff
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
+
+
+def filter_rows(rows, bytes_per_pixel):
+    '''
+    Return the PNG filtered image data for a (height, row_bytes) uint8 array.
+    The None, Sub and Up filters are applied to the whole image and the
+    filtering that compresses the smallest is used.
+    '''
+    rows = rows.astype(np.uint8)
+    height = rows.shape[0]
+    sub = rows.copy()
+    sub[:, bytes_per_pixel:] -= rows[:, :-bytes_per_pixel]
+    up = rows.copy()
+    up[1:] -= rows[:-1]
+
+    best = None
+    for filter_type, data in ((0, rows), (1, sub), (2, up)):
+        types = np.full((height, 1), filter_type, dtype=np.uint8)
+        compressed = zlib.compress(np.hstack((types, data)).tobytes(), 9)
+        if best is None or len(compressed) < len(best):
+            best = compressed
+    return best
+
+
+def pack_indices(indices, bit_depth):
+    'Pack (height, width) palette indices into rows of bit_depth bits.'
+    if bit_depth == 8:
+        return indices.astype(np.uint8)
+    per_byte = 8 // bit_depth
+    height, width = indices.shape
+    padded = -width % per_byte
+    if padded:
+        indices = np.hstack((indices, np.zeros((height, padded), indices.dtype)))
+    groups = indices.astype(np.uint8).reshape(height, -1, per_byte)
+    shifts = np.arange(per_byte - 1, -1, -1, dtype=np.uint8) * bit_depth
+    return np.bitwise_or.reduce(groups << shifts, axis=2).astype(np.uint8)
+
+
+def encode_png(array, color_type, palette=None, bit_depth=8):
+    '''
+    Encode a uint8 array as a PNG. For PNG_PALETTE the array is (height, width)
+    indices and palette is a (colours, 3 or 4) array. Otherwise the array is
+    (height, width, channels) matching the colour type.
+    '''
+    height, width = array.shape[:2]
+    ihdr = struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0)
+    chunks = [png_chunk(b"IHDR", ihdr)]
+    if color_type == PNG_PALETTE:
+        chunks.append(png_chunk(b"PLTE", palette[:, :3].astype(np.uint8).tobytes()))
+        if palette.shape[1] == 4:
+            alpha = palette[:, 3].astype(np.uint8)
+            # Trailing opaque entries may be left out of the tRNS chunk.
+            last = np.flatnonzero(alpha != 255)
+            if last.size:
+                chunks.append(png_chunk(b"tRNS", alpha[:last[-1] + 1].tobytes()))
+        rows = pack_indices(array, bit_depth)
+        bytes_per_pixel = 1
+    else:
+        bytes_per_pixel = array.shape[2] if array.ndim == 3 else 1
+        rows = array.reshape(height, width * bytes_per_pixel)
+    chunks.append(png_chunk(b"IDAT", filter_rows(rows, bytes_per_pixel)))
+    chunks.append(png_chunk(b"IEND", b""))
+    return PNG_SIGNATURE + b"".join(chunks)
+
+
+def get_palette(array):
+    '''
+    Return (indices, palette) if the image has 256 colours or less, else None.
+    Palette entries include alpha if the image has an alpha channel.
+    '''
+    packed = pixbuf_array.pack_colors(array)
+    colors, indices = np.unique(packed.ravel(), return_inverse=True)
+    if colors.size > 256:
+        return None
+    channels = array.shape[2]
+    shifts = np.arange(channels - 1, -1, -1, dtype=np.uint32) * 8
+    palette = ((colors[:, None] >> shifts) & 0xff).astype(np.uint8)
+    return indices.reshape(array.shape[:2]), palette
+
+
+def analyse_array(array):
+    'Return the findings for an image array as a dictionary of booleans.'
+    channels = array.shape[2]
+    has_alpha = channels == 4
+    opaque = not has_alpha or bool(np.all(array[:, :, 3] == 255))
+    red = array[:, :, 0]
+    grayscale = bool(np.array_equal(red, array[:, :, 1])
+                     and np.array_equal(red, array[:, :, 2]))
+    return {"unused_alpha": has_alpha and opaque,
+            "grayscale": grayscale,
+            "keep_alpha": not opaque}
+
+
+def get_candidates(array, findings):
+    'Yield (kind, png_bytes, decoded_channels) for each lossless encoding.'
+    keep_alpha = findings["keep_alpha"]
+    channels = 4 if keep_alpha else 3
+    if findings["grayscale"]:
+        if keep_alpha:
+            yield ("gray+alpha", encode_png(array[:, :, [0, 3]], PNG_GRAY_ALPHA),
+                   4)
+        else:
+            yield ("grayscale", encode_png(array[:, :, :1], PNG_GRAY), 3)
+    palette = get_palette(array if keep_alpha else array[:, :, :3])
+    if palette is not None:
+        indices, entries = palette
+        count = entries.shape[0]
+        bit_depth = 1 if count <= 2 else 2 if count <= 4 else 4 if count <= 16 else 8
+        yield ("palette", encode_png(indices, PNG_PALETTE, entries, bit_depth),
+               channels)
+    if keep_alpha:
+        yield ("rgba", encode_png(array, PNG_RGBA), 4)
+    else:
+        yield ("rgb", encode_png(np.ascontiguousarray(array[:, :, :3]), PNG_RGB),
+               3)
+
+
+def get_skip_reason(image_data, info):
+    'Return why an image, probed as info, is not re-encoded, or None.'
+    if info is None:
+        return None
+    if info["format"] in VECTOR_FORMATS:
+        return "vector image, a PNG would not scale"
+    if embed_output.is_animation(image_data, info):
+        return "animation, a PNG would keep only the first frame"
+    return None
+
+
+def get_skipped_report(source, info, reason, payload):
+    'Return the report of an image which is not re-encoded.'
+    return {
+        "source": source,
+        "width": info["width"],
+        "height": info["height"],
+        "channels": None,
+        "unused_alpha": None,
+        "grayscale": None,
+        "colors": None,
+        "skipped": reason,
+        "encoding": None,
+        "payload_before": payload,
+        "payload_after": payload,
+        "payload_saved": 0,
+        "memory_before": None,
+        "memory_after": None,
+        "memory_saved": 0,
+        "png": None,
+    }
+
+
+def advise(image_data, source=""):
+    '''
+    Analyse the binary image data and return a report dictionary. If a smaller
+    encoding is found, the report "png" entry holds the new PNG bytes. An
+    animation or a vector image is not decoded, and the report "skipped" entry
+    holds the reason.
+    '''
+    info = pixbuf_probe.probe_bytes(image_data)
+    reason = get_skip_reason(image_data, info)
+    if reason is not None:
+        return get_skipped_report(source, info, reason,
+                                  base64_length(len(image_data)))
+
+    pixbuf = info_from_pixbuf.get_image_from_bytes(image_data)
+    array = pixbuf_array.pixbuf_to_array(pixbuf)
+    height, width, channels = array.shape
+    findings = analyse_array(array)
+    findings["colors"] = pixbuf_array.unique_color_count(array)
+
+    payload_before = base64_length(len(image_data))
+    memory_before = pixbuf.get_byte_length()
+    report = {
+        "source": source,
+        "width": width,
+        "height": height,
+        "channels": channels,
+        "unused_alpha": findings["unused_alpha"],
+        "grayscale": findings["grayscale"],
+        "colors": findings["colors"],
+        "skipped": None,
+        "encoding": None,
+        "payload_before": payload_before,
+        "payload_after": payload_before,
+        "payload_saved": 0,
+        "memory_before": memory_before,
+        "memory_after": memory_before,
+        "memory_saved": 0,
+        "png": None,
+    }
+
+    best = None
+    for kind, png, decoded_channels in get_candidates(array, findings):
+        if best is None or len(png) < len(best[1]):
+            best = (kind, png, decoded_channels)
+    kind, png, decoded_channels = best
+    if len(png) >= len(image_data):
+        # The original is already smaller, e.g. a well packed PNG.
+        return report
+
+    memory_after = pixbuf_probe.pixbuf_memory(width, height, decoded_channels)
+    report.update({
+        "encoding": kind,
+        "payload_after": base64_length(len(png)),
+        "payload_saved": payload_before - base64_length(len(png)),
+        "memory_after": memory_after,
+        "memory_saved": memory_before - memory_after,
+        "png": png,
+    })
+    return report
+
+
+def print_report(report):
+    'Print a report in readable form.'
+    print(report["source"])
+    if report["skipped"] is not None:
+        print("  Size: {} x {}".format(report["width"], report["height"]))
+        print("  Skipped: {}".format(report["skipped"]))
+        return
+    print("  Size: {} x {} x {}  Colours: {}".format(
+            report["width"], report["height"], report["channels"],
+            report["colors"]))
+    print("  Unused alpha: {}  Grayscale: {}".format(
+            report["unused_alpha"], report["grayscale"]))
+    if report["encoding"] is None:
+        print("  No smaller encoding found")
+        return
+    print("  Re-encode as {} PNG".format(report["encoding"]))
+    print("  Payload: {} -> {} bytes (saved {})".format(
+            report["payload_before"], report["payload_after"],
+            report["payload_saved"]))
+    print("  Memory:  {} -> {} bytes (saved {})".format(
+            report["memory_before"], report["memory_after"],
+            report["memory_saved"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Find smaller lossless encodings of images.")
+    parser.add_argument("sources", nargs="*", default=["B64_IMAGE"],
+            help="Image files, directories, B64_ constants in "
+                 "info_from_pixbuf.py, or file.py:CONSTANT")
+    parser.add_argument("-o", "--output-dir",
+            help="Write the smaller PNG encodings to this directory")
+    parser.add_argument("--json", action="store_true",
+            help="Output JSON lines instead of text")
+    args = parser.parse_args(argv)
+
+    total_payload = 0
+    total_memory = 0
+    for source in info_from_pixbuf.expand_sources(args.sources):
+        try:
+            report = advise(info_from_pixbuf.get_image_data(source), source)
+        except (OSError, ValueError, KeyError, GLib.Error) as e:
+            print("{}: {}".format(source, e), file=sys.stderr)
+            continue
+        png = report.pop("png")
+        if png is not None and args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            name = os.path.splitext(os.path.basename(source.replace(":", "_")))[0]
+            with open(os.path.join(args.output_dir, name + ".png"), "wb") as fout:
+                fout.write(png)
+        total_payload += report["payload_saved"]
+        total_memory += report["memory_saved"]
+        if args.json:
+            print(json.dumps(report))
+        else:
+            print_report(report)
+
+    if not args.json:
+        print("\nTotal saved. Payload: {} bytes  Memory: {} bytes".format(
+                total_payload, total_memory))
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+#
+# scan_embedded.py
+#
+# Objectives: Audit the embedded image constants of a project, to find those
+# which are broken, oversized or unused.
+#
+# Every .py file under the root is read, and those containing the prefix are
+# tokenized, as by constant_index.py, to find the module level B64_ bytes
+# literals. Each constant is decoded like get_image_from_base64() of
+# info_from_pixbuf.py, base64.decodebytes() then GdkPixbuf.PixbufLoader, by a
+# pool of worker processes, and the format, dimensions, base64 payload, image
+# bytes, decoded pixbuf memory and decode time are reported. Files are given to
+# the workers in chunks, and each constant is decoded by the worker which read
+# its file, so no payload is passed between processes.
+#
+# References are counted by module: every occurrence of the name of a constant
+# in the file which defines it, other than its definition, and in the files
+# which import that module, E.g. "import icons" or "from app.icons import
+# B64_LOGO". A constant of the same name in another module is counted
+# separately. A constant may be used by another name, E.g. through getattr(),
+# so an unused constant should be checked before it is removed.
+#
+# A file which can not be read or tokenized is reported as skipped, and is not
+# a problem of any constant.
+#
+# Problems reported:
+#   broken     The base64 or the image can not be decoded.
+#   oversized  The base64 payload is larger than --max-payload bytes.
+#   unused     The name of the constant is not found anywhere else.
+#
+# $ python scan_embedded.py ~/project
+# $ python scan_embedded.py --format csv --max-payload 65536 ~/project > images.csv
+
+import argparse
+import base64
+import collections
+import concurrent.futures
+import csv
+import json
+import os
+import re
+import sys
+import time
+import tokenize
+
+import gi
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+import constant_index
+import info_from_pixbuf
+import pixbuf_probe
+
+# Base64 payloads larger than this, in bytes, are reported as oversized.
+MAX_PAYLOAD = 256 * 1024
+
+# Fields reported for each constant
+SCAN_FIELDS = ("path", "name", "line", "format", "width", "height",
+               "payload_bytes", "image_bytes", "pixbuf_bytes", "decode_ms",
+               "references", "problems", "error")
+
+# Import statements: the module of a from import, and the names imported.
+IMPORT_RE = re.compile(rb"^[ \t]*(?:from[ \t]+([\w.]+)[ \t]+)?import[ \t]+"
+                       rb"([^\n#;]+)", re.MULTILINE)
+
+
+def get_name_re(prefix):
+    'Return a regular expression matching the names starting with the prefix.'
+    return re.compile(rb"\b" + re.escape(prefix.encode()) + rb"\w*")
+
+
+def get_imported_modules(source):
+    '''
+    Return the set of the module names imported by python source, the last
+    part of each dotted name, E.g. "from app.icons import B64_LOGO" and
+    "from app import icons" both import icons.
+    '''
+    modules = set()
+    for match in IMPORT_RE.finditer(source):
+        if match.group(1):
+            modules.add(match.group(1).rsplit(b".", 1)[-1].decode())
+        for name in match.group(2).split(b","):
+            name = name.strip(b" \t()\\").split()
+            if name:
+                modules.add(name[0].rsplit(b".", 1)[-1].decode())
+    return modules
+
+
+def get_module_name(path):
+    'Return the name a python file is imported by, E.g. app/icons.py is icons.'
+    folder, name = os.path.split(os.path.splitext(path)[0])
+    if name == "__init__":
+        return os.path.basename(folder)
+    return name
+
+
+def decode_constant(value, record):
+    'Decode a base64 constant into the record, as get_image_from_base64() does.'
+    start = time.perf_counter()
+    try:
+        image_data = base64.decodebytes(value)
+        pixbuf = info_from_pixbuf.get_image_from_bytes(image_data)
+    except (ValueError, GLib.Error) as e:
+        record["error"] = str(e)
+        return
+    if pixbuf is None:
+        record["error"] = "Not a recognised image"
+        return
+    record["decode_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    info = pixbuf_probe.probe_bytes(image_data)
+    record["format"] = info["format"] if info else None
+    record["width"] = pixbuf.get_width()
+    record["height"] = pixbuf.get_height()
+    record["image_bytes"] = len(image_data)
+    record["pixbuf_bytes"] = pixbuf.get_byte_length()
+
+
+def scan_file(root, path, prefix="B64_"):
+    '''
+    Worker: Return a dictionary of the records of the constants defined in one
+    file, a Counter of the names starting with the prefix used in it, other
+    than the definitions, and the modules it imports. Files not containing the
+    prefix are not tokenized. A constant whose literal can not be evaluated
+    is a broken record. A file which can not be tokenized has no records, and
+    its error.
+    '''
+    result = {"path": path, "records": [], "names": collections.Counter(),
+              "modules": set(), "error": None}
+    with open(os.path.join(root, path), "rb") as fid:
+        source = fid.read()
+    if prefix.encode() not in source:
+        return result
+    errors = []
+    try:
+        constants = constant_index.find_constants(source, prefix, errors)
+    except (tokenize.TokenError, SyntaxError, ValueError,
+            UnicodeDecodeError) as e:
+        result["error"] = str(e)
+        return result
+    result["names"].update(name.decode() for name
+                           in get_name_re(prefix).findall(source))
+    result["modules"] = get_imported_modules(source)
+
+    for constant in constants:
+        # The definition is not a reference
+        result["names"][constant["name"]] -= 1
+        record = dict.fromkeys(SCAN_FIELDS)
+        record.update({"path": path,
+                       "name": constant["name"],
+                       "line": constant["line"],
+                       "payload_bytes": constant["payload_bytes"]})
+        literal = source[constant["start"]:constant["end"]]
+        decode_constant(constant_index.eval_literal(literal), record)
+        result["records"].append(record)
+    for error in errors:
+        # A literal which can not be evaluated is a broken constant
+        result["names"][error["name"]] -= 1
+        record = dict.fromkeys(SCAN_FIELDS)
+        record.update({"path": path, "name": error["name"],
+                       "line": error["line"], "error": error["error"]})
+        result["records"].append(record)
+    result["records"].sort(key=lambda record: record["line"])
+    return result
+
+
+def scan_file_job(job):
+    'Worker: scan_file() for one (root, path, prefix) job. Errors are recorded.'
+    root, path, prefix = job
+    try:
+        return scan_file(root, path, prefix)
+    except OSError as e:
+        return {"path": path, "records": [], "names": collections.Counter(),
+                "modules": set(), "error": str(e)}
+
+
+def scan_tree(root, prefix="B64_", max_payload=MAX_PAYLOAD, workers=None):
+    '''
+    Return the records of every constant under the root, with the count of
+    references to each, and the problems found, the number of files, and a
+    list of the (path, error) of the files skipped.
+    '''
+    jobs = [(root, path, prefix)
+            for path in constant_index.iter_python_files(root)]
+    if workers == 1 or len(jobs) < 2:
+        results = list(map(scan_file_job, jobs))
+    else:
+        # Larger chunks keep the inter-process overhead low for small files.
+        processes = workers or os.cpu_count() or 1
+        chunksize = max(1, min(64, len(jobs) // (processes * 4)))
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers) as executor:
+            results = list(executor.map(scan_file_job, jobs,
+                                        chunksize=chunksize))
+
+    records = [record for result in results for record in result["records"]]
+    skipped = [(result["path"], result["error"]) for result in results
+               if result["error"]]
+    count_references(records, results)
+    for record in records:
+        problems = []
+        if record["error"]:
+            problems.append("broken")
+        if record["payload_bytes"] and record["payload_bytes"] > max_payload:
+            problems.append("oversized")
+        if record["references"] <= 0:
+            problems.append("unused")
+        record["problems"] = " ".join(problems)
+    return records, len(jobs), skipped
+
+
+def count_references(records, results):
+    '''
+    Set the references of each record: the uses of its name in its own file,
+    and in the files which import its module.
+    '''
+    users = collections.defaultdict(list)
+    for result in results:
+        for name, count in result["names"].items():
+            users[name].append((result["path"], count, result["modules"]))
+    for record in records:
+        module = get_module_name(record["path"])
+        record["references"] = sum(
+                count for path, count, modules in users[record["name"]]
+                if path == record["path"] or module in modules)
+
+
+def write_records(records, output_format="text", fout=sys.stdout):
+    'Write the scan records as text, JSON lines or CSV.'
+    if output_format == "csv":
+        writer = csv.DictWriter(fout, fieldnames=SCAN_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+        return
+    for record in records:
+        if output_format == "jsonl":
+            fout.write(json.dumps(record) + "\n")
+        elif record["error"]:
+            fout.write("{}:{}  {}  {}\n".format(record["path"],
+                       record["name"], record["problems"], record["error"]))
+        else:
+            fout.write("{}:{}  {} {} x {}  {} base64 bytes, {} decoded, "
+                       "{} ms, {} references  {}\n".format(
+                       record["path"], record["name"],
+                       (record["format"] or "?").upper(), record["width"],
+                       record["height"], record["payload_bytes"],
+                       record["pixbuf_bytes"], record["decode_ms"],
+                       record["references"], record["problems"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Validate and report the embedded images of a project.")
+    parser.add_argument("root", help="Root folder of the python files")
+    parser.add_argument("-p", "--prefix", default="B64_",
+            help="Prefix of the constant names (default: B64_)")
+    parser.add_argument("-m", "--max-payload", type=int, default=MAX_PAYLOAD,
+            help="Base64 bytes reported as oversized (default: 262144)")
+    parser.add_argument("-f", "--format", choices=("text", "jsonl", "csv"),
+            default="text", help="Output format (default: text)")
+    parser.add_argument("-j", "--workers", type=info_from_pixbuf.positive_int,
+            default=None,
+            help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    records, files, skipped = scan_tree(args.root, args.prefix,
+                                        args.max_payload, args.workers)
+    write_records(records, args.format)
+    for path, error in skipped:
+        print("Skipped {}: {}".format(path, error), file=sys.stderr)
+    counts = collections.Counter(problem for record in records
+                                 for problem in record["problems"].split())
+    print("{} constants in {} files scanned in {:.2f} s, {} files skipped. "
+          "{} broken, {} oversized, {} unused".format(
+          len(records), files, time.perf_counter() - start, len(skipped),
+          counts["broken"], counts["oversized"], counts["unused"]),
+          file=sys.stderr)
+    return 1 if counts["broken"] else 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+#
+# thumbnails.py
+#
+# Objectives: Show thumbnails of many images without decoding them all, or
+# holding them all in memory.
+#
+# load_thumbnail() uses the "size-prepared" signal of GdkPixbuf.PixbufLoader to
+# decode at the thumbnail size. Scalable images, like SVG, are rendered at that
+# size, and the JPEG loader decodes at a reduced scale.
+#
+# Thumbnail_Gallery is a Gtk.IconView backed by a Gtk.ListStore. Every entry
+# starts with a shared placeholder image. Only the entries scrolled into view
+# are decoded, by worker threads, and the thumbnails are held in a bounded
+# LRU_Cache. When a thumbnail is evicted from the cache its entry returns to the
+# placeholder, so memory stays bounded with thousands of entries.
+#
+# $ python thumbnails.py ~/icons image_embedding_tool.py
+
+import base64
+import collections
+import concurrent.futures
+import os
+import sys
+
+import gi
+gi.require_version('Gtk', '3.0')
+gi.require_version('GLib', '2.0')
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import Gtk, GLib, GdkPixbuf
+
+import info_from_pixbuf
+
+THUMBNAIL_SIZE = 96
+CACHE_ENTRIES = 500
+DECODE_WORKERS = 2
+
+# Bytes read from a file at a time by load_file_thumbnail()
+CHUNK_SIZE = 65536
+
+# Columns of the gallery list store
+(COL_NAME, COL_PIXBUF, COL_KEY) = range(3)
+
+
+class LRU_Cache():
+    '''
+    Dictionary with a maximum number of entries. When full, the least recently
+    used entry is removed and on_evict(key, value) is called.
+    '''
+    def __init__(self, max_entries, on_evict=None):
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self.entries = collections.OrderedDict()
+
+
+    def get(self, key, default=None):
+        'Return the value for the key, marking it as recently used.'
+        if key not in self.entries:
+            return default
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+
+    def put(self, key, value):
+        'Add or replace the value for the key.'
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            old_key, old_value = self.entries.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(old_key, old_value)
+
+
+    def clear(self):
+        self.entries.clear()
+
+
+    def __contains__(self, key):
+        return key in self.entries
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def scale_to_fit(width, height, size):
+    'Return width and height scaled to fit a square of size, keeping the aspect.'
+    if width <= size and height <= size:
+        return width, height
+    scale = size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def get_thumbnail_loader(size=THUMBNAIL_SIZE):
+    'Return a PixbufLoader that decodes at no more than size x size pixels.'
+    def cb_size_prepared(loader, width, height):
+        loader.set_size(*scale_to_fit(width, height, size))
+
+    loader = GdkPixbuf.PixbufLoader()
+    loader.connect("size-prepared", cb_size_prepared)
+    return loader
+
+
+def get_loader_thumbnail(loader, size=THUMBNAIL_SIZE):
+    'Close the loader and return its pixbuf, scaled to fit size if required.'
+    loader.close()
+    pixbuf = loader.get_pixbuf()
+    # Not all loaders honour set_size()
+    width, height = scale_to_fit(pixbuf.get_width(), pixbuf.get_height(), size)
+    if (width, height) != (pixbuf.get_width(), pixbuf.get_height()):
+        pixbuf = pixbuf.scale_simple(width, height, GdkPixbuf.InterpType.BILINEAR)
+    return pixbuf
+
+
+def load_thumbnail(image_data, size=THUMBNAIL_SIZE):
+    '''
+    Decode binary image data at no more than size x size pixels. The loader is
+    told the size before decoding, so it may decode at the reduced size.
+    '''
+    loader = get_thumbnail_loader(size)
+    loader.write(image_data)
+    return get_loader_thumbnail(loader, size)
+
+
+def load_file_thumbnail(file_path, size=THUMBNAIL_SIZE, chunk_size=CHUNK_SIZE):
+    '''
+    Decode an image file at no more than size x size pixels. The file is read
+    in chunks, so a large file is never held in memory as a whole.
+    '''
+    loader = get_thumbnail_loader(size)
+    try:
+        with open(file_path, "rb") as fid:
+            for chunk in iter(lambda: fid.read(chunk_size), b""):
+                loader.write(chunk)
+    except (OSError, GLib.Error):
+        try:
+            loader.close()
+        except GLib.Error:
+            pass
+        raise
+    return get_loader_thumbnail(loader, size)
+
+
+def get_placeholder(size=THUMBNAIL_SIZE):
+    'Return a transparent pixbuf, shared by all entries without a thumbnail.'
+    pixbuf = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, True, 8, size, size)
+    pixbuf.fill(0x00000000)
+    return pixbuf
+
+
+class Thumbnail_Gallery(Gtk.ScrolledWindow):
+    '''
+    Scrolled gallery of image thumbnails. Thumbnails are decoded lazily as
+    they scroll into view and held in a bounded LRU cache.
+    Entries are added with a function returning the binary image data, so the
+    data itself is only read when it is needed.
+    '''
+    def __init__(self, size=THUMBNAIL_SIZE, cache_entries=CACHE_ENTRIES):
+        super(Thumbnail_Gallery, self).__init__()
+        self.size = size
+        self.placeholder = get_placeholder(size)
+        self.cache = LRU_Cache(cache_entries, self.cb_evicted)
+        self.data_functions = {}
+        self.iters = {}
+        # Key: Future of the decode job
+        self.pending = {}
+        self.next_key = 0
+        self.refresh_id = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=DECODE_WORKERS)
+
+        # Name, Thumbnail pixbuf, Key
+        self.store = Gtk.ListStore(str, GdkPixbuf.Pixbuf, int)
+        self.iconview = Gtk.IconView(model=self.store)
+        self.iconview.set_text_column(COL_NAME)
+        self.iconview.set_pixbuf_column(COL_PIXBUF)
+        self.iconview.set_item_width(size + 20)
+        self.add(self.iconview)
+
+        self.get_vadjustment().connect("value-changed", self.cb_view_changed)
+        self.iconview.connect("size-allocate", self.cb_view_changed)
+        self.connect("destroy", self.cb_destroy)
+
+
+    def add_image(self, name, get_data):
+        '''
+        Add an entry. get_data is a function returning the binary image data.
+        Return the key of the entry.
+        '''
+        key = self.next_key
+        self.next_key += 1
+        self.data_functions[key] = get_data
+        self.iters[key] = self.store.append([name, self.placeholder, key])
+        self.schedule_refresh()
+        return key
+
+
+    def add_file(self, file_path):
+        'Add an image file. It is read when it scrolls into view.'
+        def get_data():
+            with open(file_path, "rb") as fid:
+                return fid.read()
+        return self.add_image(os.path.basename(file_path), get_data)
+
+
+    def add_module(self, file_path):
+        'Add all the B64_ image constants of a python program, E.g. an asset module.'
+        keys = []
+        for name, b64_image in info_from_pixbuf.get_constants_from_source(
+                file_path).items():
+            keys.append(self.add_image(name, lambda b64_image=b64_image:
+                                       base64.decodebytes(b64_image)))
+        return keys
+
+
+    def clear(self):
+        self.cache.clear()
+        self.data_functions.clear()
+        self.iters.clear()
+        self.cancel_pending()
+        self.store.clear()
+
+
+    def schedule_refresh(self):
+        'Refresh the visible thumbnails once the main loop is idle.'
+        if self.refresh_id is None:
+            self.refresh_id = GLib.idle_add(self.refresh_visible)
+
+
+    def cb_view_changed(self, *args):
+        self.schedule_refresh()
+
+
+    def refresh_visible(self):
+        'Request a thumbnail for every visible entry that does not have one.'
+        self.refresh_id = None
+        visible = self.iconview.get_visible_range()
+        if not visible:
+            return False
+        start, end = visible
+        for index in range(start.get_indices()[0], end.get_indices()[0] + 1):
+            key = self.store[index][COL_KEY]
+            pixbuf = self.cache.get(key)
+            if pixbuf is not None or key in self.pending:
+                continue
+            future = self.executor.submit(self.decode_job, key,
+                                          self.data_functions[key])
+            self.pending[key] = future
+            future.add_done_callback(
+                    lambda future, key=key:
+                        GLib.idle_add(self.cb_decoded, key, future))
+        return False
+
+
+    def decode_job(self, key, get_data):
+        'Worker thread: Decode one thumbnail'
+        return load_thumbnail(get_data(), self.size)
+
+
+    def cb_decoded(self, key, future):
+        'Called in the main loop when a thumbnail has been decoded'
+        self.pending.pop(key, None)
+        if key not in self.iters:
+            # The gallery has been cleared
+            return False
+        try:
+            pixbuf = future.result()
+        except (OSError, ValueError, GLib.Error):
+            pixbuf = self.placeholder
+        self.cache.put(key, pixbuf)
+        self.store[self.iters[key]][COL_PIXBUF] = pixbuf
+        return False
+
+
+    def cb_evicted(self, key, pixbuf):
+        'Release an evicted thumbnail, by showing the placeholder instead'
+        if key in self.iters:
+            self.store[self.iters[key]][COL_PIXBUF] = self.placeholder
+
+
+    def cancel_pending(self):
+        'Cancel the decode jobs not yet started.'
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+
+
+    def cb_destroy(self, widget):
+        # shutdown(cancel_futures=True) needs Python 3.9
+        self.cancel_pending()
+        self.executor.shutdown(wait=False)
+
+
+if __name__=="__main__":
+    # Show a gallery of image files, folders and python asset modules.
+    window = Gtk.Window(title="Thumbnail Gallery")
+    window.set_default_size(800, 600)
+    gallery = Thumbnail_Gallery()
+    for source in sys.argv[1:]:
+        if source.endswith(".py"):
+            gallery.add_module(source)
+        else:
+            for path in info_from_pixbuf.expand_sources([source]):
+                gallery.add_file(path)
+    window.add(gallery)
+    window.connect("destroy", Gtk.main_quit)
+    window.show_all()
+    Gtk.main()